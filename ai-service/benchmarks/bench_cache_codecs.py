@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark cache codecs: bytes stored and encode/decode time per value type.
+
+Usage (from ai-service/):
+    python benchmarks/bench_cache_codecs.py
+"""
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.cache_codecs import CacheCodec, NUMPY_AVAILABLE, available_codecs, available_compressions  # noqa: E402
+
+REPEATS = 50
+
+
+def _words(n: int, seed: int) -> str:
+    rnd = random.Random(seed)
+    vocab = ["".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(3, 10))) for _ in range(2000)]
+    return " ".join(rnd.choice(vocab) for _ in range(n))
+
+
+def build_values():
+    summary = "\n".join(f"- {_words(18, i)}" for i in range(400))
+    quiz = {
+        "questions": "\n\n".join(
+            f"Q{i}) {_words(14, i)}?\nA) {_words(4, i+1)}\nB) {_words(4, i+2)}\nC) {_words(4, i+3)}\nD) {_words(4, i+4)}\nCorrect: B"
+            for i in range(30)
+        ),
+        "title": "Lecture 7",
+        "num_questions": 30,
+    }
+    map_outputs = [_words(120, i) for i in range(24)]
+    rnd = random.Random(7)
+    embedding_list = [[rnd.uniform(-1, 1) for _ in range(384)] for _ in range(64)]
+    values = {
+        "summary (text)": {"content": summary, "title": "Lecture 7"},
+        "quiz (dict)": quiz,
+        "map outputs (list[str])": map_outputs,
+        "embeddings (list[float])": embedding_list,
+    }
+    if NUMPY_AVAILABLE:
+        import numpy as np
+        values["embeddings (ndarray f32)"] = np.asarray(embedding_list, dtype=np.float32)
+    return values
+
+
+def bench(codec: CacheCodec, value):
+    # numpy arrays are not JSON serializable; the legacy path stored .tolist()
+    if codec.codec == "json" and hasattr(value, "tolist"):
+        value = value.tolist()
+    blob = codec.dumps(value)
+    t0 = time.perf_counter()
+    for _ in range(REPEATS):
+        codec.dumps(value)
+    enc = (time.perf_counter() - t0) / REPEATS
+    t0 = time.perf_counter()
+    for _ in range(REPEATS):
+        codec.loads(blob)
+    dec = (time.perf_counter() - t0) / REPEATS
+    return len(blob), enc, dec
+
+
+def main():
+    values = build_values()
+    print(f"{'value':<26} {'codec':<8} {'compr':<5} {'bytes':>10} {'enc µs':>10} {'dec µs':>10}")
+    for name, value in values.items():
+        legacy = len(json.dumps(value if not hasattr(value, "tolist") else value.tolist()))
+        print(f"{name:<26} {'legacy':<8} {'-':<5} {legacy:>10} {'':>10} {'':>10}")
+        for codec_name in available_codecs():
+            for compression in available_compressions():
+                codec = CacheCodec(codec=codec_name, compression=compression)
+                size, enc, dec = bench(codec, value)
+                print(f"{name:<26} {codec_name:<8} {compression:<5} {size:>10} {enc*1e6:>10.1f} {dec*1e6:>10.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Offline comparison of quiz/flashcard map strategies: the full map over every
+chunk (up to MAX_CHUNKS) against mapping only passages selected by maximal
+marginal relevance (MapReduceGenerator._generate_selected), with randomly
+picked passages as an ablation. No model is run: each map call is assumed to
+draw its items evenly from the text it was given, and the reduce to keep
+the requested number at random. Reports model calls, map input tokens and two
+coverage metrics of the kept items:
+  topics  - share of the document's topics that at least one item comes from
+  passage - mean similarity of every passage to the closest item source passage
+            (utils.chunk_selection.coverage)
+
+The document is a synthetic course reader built from the fixture notes
+(benchmarks/fixtures/course_notes.json): one chapter per note, chapters of very
+different lengths. Needs sentence-transformers and the chat model's tokenizer.
+
+Usage (from ai-service/):
+    python benchmarks/bench_chunk_selection.py [--pages 120] [--items 8,12,20] [--trials 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transformers import AutoTokenizer  # noqa: E402
+
+import utils.vector_db as vector_db  # noqa: E402
+from models.specialized_models import FlashcardGenerator, QuizGenerator, SELECT_OVERSAMPLE  # noqa: E402
+from utils.chunk_selection import coverage, group_in_order  # noqa: E402
+
+from bench_hybrid_search import FIXTURE, WORDS  # noqa: E402
+
+_PAGE = re.compile(r"^\[Page (\d+)\]$", re.MULTILINE)
+
+
+def make_reader(notes, pages: int, seed: int = 0):
+    """[Page N] text with one chapter per note (Zipf-like lengths); returns (text, page -> topic)."""
+    rnd = random.Random(seed)
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(len(notes))]
+    lengths = [max(1, round(pages * w / sum(weights))) for w in weights]
+    body, topic_of = [], {}
+    for topic, (note, length) in enumerate(zip(notes, lengths)):
+        sentences = re.split(r"(?<=\.) ", _PAGE.sub("", note["text"]).strip())
+        for _ in range(length):
+            page = len(body) + 1
+            topic_of[page] = topic
+            filler = [" ".join(rnd.choices(WORDS, k=rnd.randint(8, 16))).capitalize() + "." for _ in range(2)]
+            paragraphs = [" ".join(rnd.sample(sentences, len(sentences))) for _ in range(3)]
+            body.append(f"[Page {page}]\n" + "\n\n".join(paragraphs + [" ".join(filler)]))
+    return "\n\n".join(body), topic_of
+
+
+def simulate(pool, target: int, trials: int, pages, topic_of, embeddings, num_topics: int):
+    """pool: source passage of every mapped item; the reduce keeps `target` of them at random."""
+    rnd = random.Random(1)
+    topics, passages = [], []
+    for _ in range(trials):
+        kept = rnd.sample(pool, min(target, len(pool)))
+        topics.append(len({topic_of[pages[i]] for i in kept}) / num_topics)
+        passages.append(coverage(embeddings, kept))
+    return statistics.mean(topics), statistics.mean(passages)
+
+
+def map_pool(groups, per_chunk: int):
+    """Item sources when each map call draws per_chunk items evenly from its passages."""
+    return [group[i % len(group)] for group in groups for i in range(per_chunk)]
+
+
+async def run(gen, content: str, target: int, trials: int, topic_of, num_topics: int, rnd: random.Random):
+    total, chunks = gen._plan(content)
+    setup = gen._setup(total, len(chunks))
+    passages, embeddings = await gen.passages(content)
+    pages = [page for _, page, _, _ in passages]
+    index = {(text, page): i for i, (text, page, _, _) in enumerate(passages)}
+    on_page = {}
+    for i, page in enumerate(pages):
+        on_page.setdefault(page, []).append(i)
+
+    def row(name, groups, per_chunk, windows):
+        tokens = sum(len(gen.tok.encode(w)) for w in windows)
+        return (name, len(windows) + 1, tokens,
+                *simulate(map_pool(groups, per_chunk), target, trials, pages, topic_of, embeddings, num_topics))
+
+    # full map: every chunk, items drawn from the passages of the pages it holds
+    full = [[i for page in map(int, _PAGE.findall(chunk)) for i in on_page.get(page, [])] for chunk in chunks]
+    rows = [row("full map", [g for g in full if g], setup["per_chunk"], chunks)]
+
+    groups = await gen._select(content, target, len(chunks))
+    if groups is None:
+        return rows
+    per_chunk = -(-sum(len(g) for g in groups) // len(groups))
+    selected = [[index[(text, page)] for text, page, _, _ in g] for g in groups]
+    rows.append(row("MMR selection", selected, per_chunk, [gen._window(g) for g in groups]))
+    runs = group_in_order(rnd.sample(range(len(passages)), sum(len(g) for g in groups)), len(groups))
+    rows.append(row("random selection", runs, per_chunk, [gen._window([passages[i] for i in r]) for r in runs]))
+    return rows
+
+
+def main(pages: int, items, trials: int, tokenizer: str):
+    with open(FIXTURE, encoding="utf-8") as f:
+        notes = json.load(f)["documents"]
+    content, topic_of = make_reader(notes, pages)
+    tok = AutoTokenizer.from_pretrained(tokenizer)
+    # the generators only tokenize and chunk here; no model weights are loaded
+    model_data = {"tokenizer": tok, "model": types.SimpleNamespace(eval=lambda: None), "config": None}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHROMA_DB_PATH"] = os.environ["VECTOR_INDEX_PATH"] = os.path.join(tmp, "index")
+        os.environ["LEXICAL_INDEX_PATH"] = os.path.join(tmp, "lexical.sqlite3")
+        os.environ["EMBED_CACHE_PATH"] = os.path.join(tmp, "embeddings.sqlite3")
+        db = vector_db.VectorDB()
+        print(f"{len(topic_of)} pages, {len(notes)} topics, oversample {SELECT_OVERSAMPLE}, {trials} trials per row")
+        print(f"{'task':<12}{'items':>6}  {'strategy':<18}{'calls':>6}{'map tokens':>12}{'topics':>8}{'passage':>9}")
+        for cls in (QuizGenerator, FlashcardGenerator):
+            gen = cls(model_data, passages=db.embed_passages)
+            for target in items:
+                rows = asyncio.run(run(gen, content, target, trials, topic_of, len(notes), random.Random(target)))
+                for name, calls, map_tokens, topics, passage in rows:
+                    print(f"{gen.TASK:<12}{target:>6}  {name:<18}{calls:>6}{map_tokens:>12}{topics:>8.2f}{passage:>9.3f}")
+        db.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--items", default="8,12,20", help="requested questions/cards, comma-separated")
+    parser.add_argument("--trials", type=int, default=50)
+    parser.add_argument("--tokenizer", default="models/Qwen2.5-7B-Instruct")
+    args = parser.parse_args()
+    main(args.pages, [int(n) for n in args.items.split(",")], args.trials, args.tokenizer)
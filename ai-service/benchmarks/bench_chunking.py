@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark the token-aware chunker (utils.chunking) against the previous fixed
+512-character windows on synthetic lecture notes with [Page N] markers, at
+several input sizes to show linear scaling. Reports throughput, chunk sizes in
+embedding-model tokens, chunks over the model window and chunks that start or
+end mid-word.
+
+Usage (from ai-service/):
+    python benchmarks/bench_chunking.py [--sizes 1000000,2000000,4000000] [--tokenizer NAME_OR_PATH]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chunking import chunk_document  # noqa: E402
+
+WORDS = ["neuron", "synapse", "membrane", "potential", "gradient", "enzyme", "protein", "cell",
+         "signal", "receptor", "ion", "channel", "voltage", "transport", "depolarization", "axon"]
+MODEL_WINDOW = 256  # all-MiniLM-L6-v2 max_seq_length
+
+
+def legacy_chunk_text(text: str, chunk_size: int = 512, overlap: int = 50):
+    # previous VectorDB._chunk_text, kept as the reference
+    chunks, start = [], 0
+    while start < len(text):
+        chunks.append(text[start:start + chunk_size])
+        start += chunk_size - overlap
+    return chunks
+
+
+def make_text(rnd: random.Random, chars: int) -> str:
+    """Pages of paragraphs and bullet lists, sentences of 5-25 words."""
+    pages, size, p = [], 0, 0
+    while size < chars:
+        p += 1
+        blocks = []
+        for _ in range(rnd.randint(2, 5)):
+            if rnd.random() < 0.3:
+                blocks.append("\n".join("- " + " ".join(rnd.choices(WORDS, k=rnd.randint(3, 10)))
+                                        for _ in range(rnd.randint(2, 6))))
+            else:
+                blocks.append(" ".join(" ".join(rnd.choices(WORDS, k=rnd.randint(5, 25))).capitalize() + "."
+                                       for _ in range(rnd.randint(2, 8))))
+        page = f"[Page {p}]\n" + "\n\n".join(blocks)
+        pages.append(page)
+        size += len(page) + 2
+    return "\n\n".join(pages)[:chars]
+
+
+def mid_word(chunk: str, text: str, start: int) -> bool:
+    end = start + len(chunk)
+    return (start > 0 and text[start - 1].isalnum() and chunk[:1].isalnum()) or \
+           (end < len(text) and text[end:end + 1].isalnum() and chunk[-1:].isalnum())
+
+
+def report(name: str, chunks, text: str, elapsed: float, tokenizer):
+    sizes = [len(ids) for ids in tokenizer(chunks, add_special_tokens=False)["input_ids"]]
+    cuts, pos = 0, 0
+    for chunk in chunks:
+        start = text.find(chunk, max(0, pos - 600))
+        if start >= 0:
+            cuts += mid_word(chunk, text, start)
+            pos = start + len(chunk)
+    over = sum(1 for n in sizes if n > MODEL_WINDOW - 2)
+    print(f"{name:<14}{len(text) / 1e6:>6.1f}{len(text) / elapsed / 1e6:>9.2f}{len(chunks):>8}"
+          f"{statistics.mean(sizes):>8.0f}{max(sizes):>6}{over:>9}{cuts:>10}")
+
+
+def main(sizes, tokenizer_name: str, target_tokens: int):
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    rnd = random.Random(0)
+    print(f"{'chunker':<14}{'MB':>6}{'MB/s':>9}{'chunks':>8}{'tok avg':>8}{'max':>6}{'>window':>9}{'mid-word':>10}")
+    for size in sizes:
+        text = make_text(rnd, size)
+        t0 = time.perf_counter()
+        legacy = legacy_chunk_text(text)
+        report("fixed 512 chr", legacy, text, time.perf_counter() - t0, tokenizer)
+        t0 = time.perf_counter()
+        chunks = chunk_document(text, tokenizer, target_tokens)
+        report("token-aware", [c for c, _, _, _ in chunks], text, time.perf_counter() - t0, tokenizer)
+        if any(c[1] == 0 or c[1] > c[2] for c in chunks):
+            raise SystemExit("❌ Chunk without page provenance")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000000,2000000,4000000")
+    parser.add_argument("--tokenizer", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--target-tokens", type=int, default=200)
+    args = parser.parse_args()
+    main([int(s) for s in args.sizes.split(",")], args.tokenizer, args.target_tokens)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark DOCX extraction: python-docx object model (old path) vs the streaming
+word/document.xml extractor, on synthetic documents with paragraphs, tables and
+page breaks. Reports time, throughput and peak Python heap (tracemalloc).
+
+Fixtures are written as raw OOXML, so python-docx is only needed for the
+comparison column.
+
+Usage (from ai-service/):
+    python benchmarks/bench_docx_extraction.py [--sizes 1000,10000,100000]
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+import zipfile
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.data_processor import _extract_docx, _extract_docx_stream  # noqa: E402
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+WORDS = ["neuron", "synapse", "membrane", "potential", "gradient", "enzyme", "protein",
+         "cell", "signal", "receptor", "ion", "channel", "voltage", "transport"]
+
+
+def _para(text: str, page_break: bool = False) -> str:
+    brk = '<w:r><w:br w:type="page"/></w:r>' if page_break else ""
+    return f'<w:p><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r>{brk}</w:p>'
+
+
+def make_docx(paragraphs: int, seed: int = 0) -> bytes:
+    """A paragraph every step, a 4x3 table every 25 paragraphs, a page break every 40."""
+    rnd = random.Random(seed)
+    blocks = []
+    for i in range(paragraphs):
+        blocks.append(_para(" ".join(rnd.choices(WORDS, k=18)), page_break=(i + 1) % 40 == 0))
+        if (i + 1) % 25 == 0:
+            rows = "".join(
+                "<w:tr>" + "".join(f"<w:tc>{_para(' '.join(rnd.choices(WORDS, k=3)))}</w:tc>" for _ in range(3)) + "</w:tr>"
+                for _ in range(4)
+            )
+            blocks.append(f"<w:tbl>{rows}</w:tbl>")
+    document = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document xmlns:w="{W_NS}">'
+        f'<w:body>{"".join(blocks)}<w:sectPr/></w:body></w:document>'
+    )
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", CONTENT_TYPES)
+        zf.writestr("_rels/.rels", RELS)
+        zf.writestr("word/document.xml", document)
+    return buf.getvalue()
+
+
+def measure(fn, data: bytes):
+    t0 = time.perf_counter()
+    text = fn(data)
+    elapsed = time.perf_counter() - t0
+    # separate run for memory: tracing slows the extractor down several times
+    tracemalloc.start()
+    fn(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return text, elapsed, peak
+
+
+def main(sizes):
+    try:
+        import docx  # noqa: F401
+        have_docx = True
+    except ImportError:
+        have_docx = False
+        print("python-docx not installed: only the streaming extractor is measured")
+
+    print(f"{'paragraphs':>10}{'docx MB':>9}{'extractor':>12}{'time s':>9}{'MB/s':>8}{'peak MB':>9}{'pages':>7}")
+    for n in sizes:
+        data = make_docx(n)
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            xml_mb = zf.getinfo("word/document.xml").file_size / 1e6
+        runs = [("streaming", _extract_docx_stream)] + ([("python-docx", _extract_docx)] if have_docx else [])
+        for name, fn in runs:
+            text, elapsed, peak = measure(fn, data)
+            pages = text.count("[Page ")
+            print(f"{n:>10}{len(data) / 1e6:>9.1f}{name:>12}{elapsed:>9.2f}{xml_mb / elapsed:>8.1f}"
+                  f"{peak / 1e6:>9.1f}{pages:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    args = parser.parse_args()
+    main([int(s) for s in args.sizes.split(",")])
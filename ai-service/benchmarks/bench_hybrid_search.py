@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark VectorDB.search modes (dense, lexical BM25, hybrid RRF) on the
+fixture corpus in benchmarks/fixtures/course_notes.json: short course notes,
+each with one query quoting an exact term/formula/acronym and one paraphrase.
+Synthetic distractor notes are added to grow the corpus. Reports hit@1, hit@5
+and MRR@10 (is the query's document among the results) per query kind, and
+the search latency. Needs sentence-transformers (and chromadb unless
+VECTOR_BACKEND=numpy).
+
+Usage (from ai-service/):
+    python benchmarks/bench_hybrid_search.py [--distractors 2000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.vector_db as vector_db  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "course_notes.json")
+WORDS = ["cell", "energy", "membrane", "reaction", "force", "graph", "market", "memory", "signal", "rate",
+         "model", "system", "process", "value", "pressure", "temperature", "network", "variable", "protein",
+         "function", "study", "lecture", "example", "theory", "result", "change", "level", "structure"]
+
+
+def distractors(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    for i in range(n):
+        sentences = [" ".join(rnd.choices(WORDS, k=rnd.randint(8, 20))).capitalize() + "." for _ in range(rnd.randint(3, 6))]
+        yield f"noise-{i}", "[Page 1]\n" + " ".join(sentences), {"user_id": "bench"}
+
+
+async def evaluate(db, queries, mode: str, k: int = 10):
+    results = {"exact": [], "paraphrase": []}
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = await db.search(q["query"], n_results=k, filter_metadata={"user_id": "bench"}, mode=mode)
+        latencies.append(time.perf_counter() - t0)
+        ranked = [h["metadata"]["document_id"] for h in hits]
+        results[q["kind"]].append(ranked.index(q["document_id"]) + 1 if q["document_id"] in ranked else None)
+    return results, latencies
+
+
+def summarize(ranks):
+    n = len(ranks)
+    return (sum(1 for r in ranks if r == 1) / n, sum(1 for r in ranks if r and r <= 5) / n,
+            sum(1 / r for r in ranks if r) / n)
+
+
+def main(num_distractors: int):
+    with open(FIXTURE, encoding="utf-8") as f:
+        fixture = json.load(f)
+    docs = [(d["id"], d["text"], {"user_id": "bench"}) for d in fixture["documents"]]
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHROMA_DB_PATH"] = os.environ["VECTOR_INDEX_PATH"] = os.path.join(tmp, "index")
+        os.environ["LEXICAL_INDEX_PATH"] = os.path.join(tmp, "lexical.sqlite3")
+        os.environ["EMBED_CACHE_PATH"] = os.path.join(tmp, "embeddings.sqlite3")
+        db = vector_db.VectorDB()
+        t0 = time.perf_counter()
+        chunks = asyncio.run(db.add_documents(docs + list(distractors(num_distractors))))
+        print(f"{len(docs)} fixture + {num_distractors} distractor notes, {chunks} chunks indexed in "
+              f"{time.perf_counter() - t0:.1f}s; {len(fixture['queries'])} queries")
+        print(f"{'mode':<10}{'kind':<12}{'hit@1':>7}{'hit@5':>7}{'MRR':>7}{'p50 ms':>9}{'p95 ms':>9}")
+        for mode in ("dense", "lexical", "hybrid"):
+            results, latencies = asyncio.run(evaluate(db, fixture["queries"], mode))
+            p50 = statistics.median(latencies) * 1e3
+            p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1e3
+            for kind in ("exact", "paraphrase"):
+                hit1, hit5, mrr = summarize(results[kind])
+                print(f"{mode:<10}{kind:<12}{hit1:>7.2f}{hit5:>7.2f}{mrr:>7.2f}"
+                      + (f"{p50:>9.1f}{p95:>9.1f}" if kind == "exact" else ""))
+        db.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--distractors", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.distractors)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark near-duplicate linking: index a corpus of synthetic lecture decks,
+then upload re-exports (layout noise only), revisions (a few pages rewritten)
+and unrelated decks. Reports lookup latency per page, pages linked, and
+document matches per kind. Checks that the uploaded text is never altered.
+
+Usage (from ai-service/):
+    python benchmarks/bench_near_duplicate.py [--docs 500] [--pages 30]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.near_duplicate import NearDuplicateIndex, PageLinker, signature, split_pages  # noqa: E402
+
+VOCAB = [f"term{i}" for i in range(5000)]
+
+
+def make_deck(rnd: random.Random, pages: int) -> str:
+    return "\n\n".join(
+        f"[Page {p}]\n" + "\n".join(" ".join(rnd.choices(VOCAB, k=12)) for _ in range(rnd.randint(6, 20)))
+        for p in range(1, pages + 1)
+    )
+
+
+def re_export(rnd: random.Random, deck: str) -> str:
+    """Same content, different layout: line breaks moved and spacing changed."""
+    out = []
+    for page in split_pages(deck):
+        marker, _, body = page.partition("\n")
+        words = body.split()
+        cut = rnd.randint(1, len(words) - 1)
+        out.append(f"{marker}\n{' '.join(words[:cut])}\n{'  '.join(words[cut:])}")
+    return "\n\n".join(out)
+
+
+def revise(rnd: random.Random, deck: str, changed: int) -> str:
+    pages = split_pages(deck)
+    for i in rnd.sample(range(len(pages)), changed):
+        marker = pages[i].partition("\n")[0]
+        pages[i] = f"{marker}\n" + " ".join(rnd.choices(VOCAB, k=150))
+    return "\n\n".join(pages)
+
+
+def main(num_docs: int, num_pages: int):
+    rnd = random.Random(0)
+    store = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        index = NearDuplicateIndex(os.path.join(tmp, "near_duplicates.sqlite3"))
+        t0 = time.perf_counter()
+        for d in range(num_docs):
+            store[f"doc{d}"] = make_deck(rnd, num_pages)
+            linker = PageLinker(index, store.get, f"doc{d}")
+            for page in split_pages(store[f"doc{d}"]):
+                linker.page(page)
+            linker.index_as(f"doc{d}")
+        elapsed = time.perf_counter() - t0
+        print(f"Indexed {num_docs} docs x {num_pages} pages in {elapsed:.1f}s "
+              f"({elapsed / (num_docs * num_pages) * 1e3:.2f} ms/page incl. signature) -> {index.stats()}")
+
+        page = split_pages(store["doc0"])[0].partition("\n")[2]
+        sig = signature(page)
+        sig_times, query_times = [], []
+        for _ in range(1000):
+            t0 = time.perf_counter()
+            signature(page)
+            sig_times.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            index.query(sig, 0.95)
+            query_times.append(time.perf_counter() - t0)
+        print(f"Per page: signature {statistics.median(sig_times) * 1e6:.0f} µs, "
+              f"LSH lookup {statistics.median(query_times) * 1e6:.0f} µs (median)")
+
+        kinds = {
+            "re-export": lambda d: re_export(rnd, store[d]),
+            "revision (3 pages)": lambda d: revise(rnd, store[d], 3),
+            "unrelated": lambda d: make_deck(rnd, num_pages),
+        }
+        print(f"{'upload':<20}{'pages linked':>14}{'identical':>11}{'doc matched':>13}{'ms/doc':>9}")
+        for name, make in kinds.items():
+            linked = identical = matched = 0
+            times = []
+            for d in rnd.sample(sorted(store), 20):
+                text = make(d)
+                t0 = time.perf_counter()
+                linker = PageLinker(index, store.get)
+                stored = "\n\n".join(linker.page(p) for p in split_pages(text))
+                match = linker.document_match()
+                times.append(time.perf_counter() - t0)
+                linked += linker.linked_pages
+                identical += linker.identical_pages
+                matched += match is not None and match["document_id"] == d
+                if stored != "\n\n".join(split_pages(text)):
+                    raise SystemExit(f"❌ Upload based on {d} was altered by linking")
+            print(f"{name:<20}{linked / 20:>10.1f}/{num_pages:<3}{identical / 20:>11.1f}{matched:>10}/20"
+                  f"{statistics.mean(times) * 1e3:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=30)
+    args = parser.parse_args()
+    main(args.docs, args.pages)
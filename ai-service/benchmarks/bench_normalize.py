@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark _normalize_ws throughput (MB/s) against the previous per-line
+implementation, and check that both give identical output on a fixture corpus
+(plus random fuzz strings made of the characters the normalizer cares about).
+The "unicode cleanup" row is the production default (EXTRACT_UNICODE_CLEANUP=1).
+
+Usage (from ai-service/):
+    python benchmarks/bench_normalize.py [--pages N] [--repeat R]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.data_processor import _normalize_ws  # noqa: E402
+
+
+def legacy_normalize_ws(text: str) -> str:
+    # previous implementation, kept verbatim as the reference
+    import re
+    text = text.replace("\r", "")
+    lines = [re.sub(r"[ \t]+", " ", ln).strip() for ln in text.split("\n")]
+    lines = [re.sub(r"^[•\-\u2022]+[ \t]*", "- ", ln) for ln in lines]
+    return "\n".join(lines).strip()
+
+
+WORDS = ["neuron", "synapse", "membrane", "potential", "gradient", "enzyme", "protein",
+         "cell", "signal", "receptor", "ion", "channel", "voltage", "transport", "de\ufb01nition"]
+
+
+def make_page(rnd: random.Random, p: int) -> str:
+    """One extracted page: prose, bullets, ragged spacing, tabs, CRLF and blank lines."""
+    lines = [f"  Lecture 7 – Page {p}  "]
+    for _ in range(45):
+        kind = rnd.random()
+        words = " ".join(rnd.choices(WORDS, k=rnd.randint(4, 14)))
+        if kind < 0.15:
+            lines.append(rnd.choice(["•  ", "- ", "•• ", "--\t", "•"]) + words)
+        elif kind < 0.25:
+            lines.append("")
+        elif kind < 0.35:
+            lines.append(words.replace(" ", rnd.choice(["  ", "\t", " \t ", "   "])) + "   ")
+        elif kind < 0.40:
+            lines.append(" " + words + " \r")
+        else:
+            lines.append(words)
+    return "\n".join(lines)
+
+
+FIXTURES = [
+    "",
+    "   ",
+    "\n\n\n",
+    "plain text",
+    "\r\nline one\r\nline two\r\n",
+    "•  bullet\n- dash\n-- double\n•\n-\n---",
+    "a\t\tb  c   d \t e",
+    " nbsp edges \n em space ",
+    "\x0cform feed\x0b\nvertical\x1c\x85",
+    "exam-\nple hyphen across lines",
+    "  leading\n\n\n  trailing  \n",
+]
+
+
+def fuzz(rnd: random.Random, n: int) -> str:
+    alphabet = ["a", "b", " ", "  ", "\t", "\n", "\r", "-", "•", "•", " ", "\x0c", "　", "x-\ny"]
+    return "".join(rnd.choice(alphabet) for _ in range(n))
+
+
+# (input, expected) with unicode_cleanup=True
+CLEANUP_FIXTURES = [
+    ("de\ufb01nition of \ufb02ow", "definition of flow"),
+    ("hyphen\u00adated zero\u200bwidth", "hyphenated zerowidth"),
+    ("exam-\nple and self-\nControl", "example and self-\nControl"),
+    ("state-\nof-the-art and the state-\nof-the-art.", "state-\nof-the-art and the state-\nof-the-art."),
+    ("PDF-\nbased and co-\noperate", "PDF-\nbased and cooperate"),
+    ("a\u00a0\u00a0b\u3000c", "a b c"),
+    ("\u2022 bullet\r\n", "- bullet"),
+]
+
+
+def check_equal(corpus):
+    for i, text in enumerate(corpus):
+        expected, got = legacy_normalize_ws(text), _normalize_ws(text)
+        if expected != got:
+            raise SystemExit(f"❌ Output differs on fixture {i}: {text!r}\n  legacy: {expected!r}\n  new:    {got!r}")
+
+
+def throughput(fn, pages, repeat: int) -> float:
+    size = sum(len(p.encode("utf-8")) for p in pages)
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for p in pages:
+            fn(p)
+        best = min(best, time.perf_counter() - t0)
+    return size / best / 1e6
+
+
+def main(num_pages: int, repeat: int):
+    rnd = random.Random(0)
+    pages = [make_page(rnd, p + 1) for p in range(num_pages)]
+    check_equal(FIXTURES + pages + [fuzz(rnd, rnd.randint(0, 200)) for _ in range(5000)])
+    print(f"✅ Identical output on {len(FIXTURES) + len(pages) + 5000} fixtures")
+    for text, expected in CLEANUP_FIXTURES:
+        got = _normalize_ws(text, unicode_cleanup=True)
+        if got != expected:
+            raise SystemExit(f"❌ Unicode cleanup of {text!r} gave {got!r}, expected {expected!r}")
+
+    document = ["\n\n".join(pages)]
+    size_mb = len(document[0].encode("utf-8")) / 1e6
+    print(f"Corpus: {num_pages} pages, {size_mb:.1f} MB")
+    print(f"{'variant':<34}{'MB/s':>10}")
+    legacy = throughput(legacy_normalize_ws, pages, repeat)
+    rows = [
+        ("legacy (per page)", legacy),
+        ("new (per page)", throughput(_normalize_ws, pages, repeat)),
+        ("new (whole document)", throughput(_normalize_ws, document, repeat)),
+        # what the extractors run with the default EXTRACT_UNICODE_CLEANUP=1
+        ("new + unicode cleanup (per page)", throughput(lambda t: _normalize_ws(t, True), pages, repeat)),
+    ]
+    for name, mbps in rows:
+        print(f"{name:<34}{mbps:>10.1f}  ({mbps / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.pages, args.repeat)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Benchmark PDF extraction throughput: inline (old event-loop path) vs the
+process pool, on synthetic 10-, 100- and 1000-page PDFs.
+
+Usage (from ai-service/, needs pymupdf):
+    python benchmarks/bench_pdf_extraction.py [--workers N]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # noqa: E402
+
+from utils.data_processor import DocumentProcessor, _extract_pdf_pages  # noqa: E402
+
+
+def make_pdf(pages: int, seed: int = 0) -> bytes:
+    rnd = random.Random(seed)
+    words = ["neuron", "synapse", "membrane", "potential", "gradient", "enzyme", "protein",
+             "cell", "signal", "receptor", "ion", "channel", "voltage", "transport"]
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        lines = [" ".join(rnd.choices(words, k=12)) for _ in range(45)]
+        page.insert_text((50, 60), f"Lecture 7 - Page {p+1}\n" + "\n".join(lines), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+async def main(workers: int):
+    processor = DocumentProcessor(max_workers=workers)
+    # warm the pool so worker start-up is not billed to the first run
+    await processor._process_pdf_pymupdf(make_pdf(2))
+    print(f"{'pages':>6} {'size MB':>8} {'inline s':>9} {'pool s':>8} {'pages/s':>9} {'speedup':>8}")
+    for pages in (10, 100, 1000):
+        pdf = make_pdf(pages)
+        t0 = time.perf_counter()
+        inline = "\n\n".join(_extract_pdf_pages(pdf, 0, pages)).strip()
+        t_inline = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        pooled = await processor._process_pdf_pymupdf(pdf)
+        t_pool = time.perf_counter() - t0
+        assert pooled == inline, "pool output differs from inline extraction"
+        print(f"{pages:>6} {len(pdf)/1e6:>8.2f} {t_inline:>9.3f} {t_pool:>8.3f} {pages/t_pool:>9.0f} {t_inline/t_pool:>7.2f}x")
+    processor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    asyncio.run(main(parser.parse_args().workers))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark multi-query retrieval: one VectorDB.search call per query (the
+previous path) against search_many per batch of related queries, with and
+without the query-embedding LRU. The workload is --batches batches of --per-batch
+queries drawn from the fixture queries (benchmarks/fixtures/course_notes.json)
+with Zipf-like popularity, so popular questions repeat as they do across
+students. Reports queries/s, the speedup and the query cache hit rate. Needs
+sentence-transformers (and chromadb unless VECTOR_BACKEND=numpy).
+
+Usage (from ai-service/):
+    python benchmarks/bench_search_many.py [--batches 100] [--per-batch 4] [--mode dense]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.vector_db as vector_db  # noqa: E402
+from utils.embedding_cache import QueryEmbeddingCache  # noqa: E402
+
+from bench_hybrid_search import FIXTURE, distractors  # noqa: E402
+
+
+def workload(queries, batches: int, per_batch: int, seed: int = 0):
+    rnd = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(queries))]
+    return [[q if rnd.random() < 0.5 else q.upper() + "  "  # same query typed differently
+             for q in rnd.choices(queries, weights, k=per_batch)] for _ in range(batches)]
+
+
+async def one_by_one(db, batches, mode):
+    return [[await db.search(q, 5, {"user_id": "bench"}, mode) for q in batch] for batch in batches]
+
+
+async def batched(db, batches, mode):
+    return [await db.search_many(batch, 5, {"user_id": "bench"}, mode) for batch in batches]
+
+
+def run(name, db, search, batches, mode, cache: bool):
+    db.query_cache = QueryEmbeddingCache() if cache else None
+    t0 = time.perf_counter()
+    asyncio.run(search(db, batches, mode))
+    elapsed = time.perf_counter() - t0
+    queries = sum(len(b) for b in batches)
+    hit_rate = f"{db.query_cache.stats()['hit_rate']:.2f}" if cache else "-"
+    print(f"{name:<30}{queries / elapsed:>10.1f}{elapsed:>9.2f}{hit_rate:>10}")
+    return elapsed
+
+
+def main(num_batches: int, per_batch: int, mode: str, num_distractors: int):
+    with open(FIXTURE, encoding="utf-8") as f:
+        fixture = json.load(f)
+    docs = [(d["id"], d["text"], {"user_id": "bench"}) for d in fixture["documents"]]
+    batches = workload([q["query"] for q in fixture["queries"]], num_batches, per_batch)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHROMA_DB_PATH"] = os.environ["VECTOR_INDEX_PATH"] = os.path.join(tmp, "index")
+        os.environ["LEXICAL_INDEX_PATH"] = os.path.join(tmp, "lexical.sqlite3")
+        os.environ["EMBED_CACHE_PATH"] = os.path.join(tmp, "embeddings.sqlite3")
+        db = vector_db.VectorDB()
+        asyncio.run(db.add_documents(docs + list(distractors(num_distractors))))
+        print(f"{num_batches} batches x {per_batch} queries, mode={mode}, {db.index.count()} chunks")
+        print(f"{'variant':<30}{'queries/s':>10}{'time s':>9}{'hit rate':>10}")
+        legacy = run("search per query (legacy)", db, one_by_one, batches, mode, cache=False)
+        many = run("search_many", db, batched, batches, mode, cache=False)
+        cached = run("search_many + query LRU", db, batched, batches, mode, cache=True)
+        print(f"speedup: {legacy / many:.1f}x batched, {legacy / cached:.1f}x batched + cache")
+        db.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batches", type=int, default=100)
+    parser.add_argument("--per-batch", type=int, default=4)
+    parser.add_argument("--mode", default="dense", choices=["dense", "lexical", "hybrid"])
+    parser.add_argument("--distractors", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.batches, args.per_batch, args.mode, args.distractors)
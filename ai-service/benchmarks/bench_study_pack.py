@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Compare /generate/study-pack (one shared map pass + batched reduce) against
+three separate summary/quiz/flashcard generations on the same document.
+
+Usage (from ai-service/, needs the model and a GPU):
+    python benchmarks/bench_study_pack.py path/to/extracted.txt
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.model_manager import ModelManager  # noqa: E402
+from models.specialized_models import (  # noqa: E402
+    FlashcardGenerator, QuizGenerator, StudyPackGenerator, SummaryGenerator,
+)
+
+
+async def main(path: str):
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+
+    manager = ModelManager({"summary": {"model_path": "models/Qwen2.5-7B-Instruct"}})
+    await manager.load_models()
+    model_data = manager.get("summary")
+    title = os.path.basename(path)
+
+    t0 = time.perf_counter()
+    await SummaryGenerator(model_data).generate(content, title)
+    t_summary = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    await QuizGenerator(model_data).generate(content, title)
+    t_quiz = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    await FlashcardGenerator(model_data).generate(content, title)
+    t_flash = time.perf_counter() - t0
+    separate = t_summary + t_quiz + t_flash
+
+    t0 = time.perf_counter()
+    pack = await StudyPackGenerator(model_data).generate(content, title)
+    combined = time.perf_counter() - t0
+
+    print("\n=== Study pack benchmark ===")
+    print(f"Document: {path} ({len(content)} chars, {pack['chunks']} chunks)")
+    print(f"Separate calls: summary {t_summary:.1f}s + quiz {t_quiz:.1f}s + flashcards {t_flash:.1f}s = {separate:.1f}s")
+    print(f"Study pack:     {combined:.1f}s  ({separate / combined:.2f}x)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1]))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vector index backends (utils.vector_index) on the same synthetic
+clustered embeddings: the built-in NumpyIndex (float32, float16, and float16
+with int8 or PQ codes; each flat and IVF at a few nprobe values) against
+ChromaIndex (HNSW). Reports build time, bytes scanned per vector, single-query
+latency (p50/p95) and recall@k against exact float32 search, with and without a
+metadata filter (one user out of --users). Chroma is skipped when it is not
+installed or with --skip-chroma. No embedding model is needed.
+
+Usage (from ai-service/):
+    python benchmarks/bench_vector_index.py [--rows 100000] [--queries 200] [--k 10] [--skip-chroma]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.vector_index as vector_index  # noqa: E402
+
+DIM = 384  # all-MiniLM-L6-v2
+BATCH = 5000
+
+
+def make_data(rows: int, queries: int, users: int, seed: int = 0):
+    """Points around rows/100 topic centres, like chunk embeddings of many documents."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, rows // 100), DIM)).astype(np.float32)
+
+    def sample(n):
+        return vector_index.normalize(centres[rng.integers(0, len(centres), n)]
+                                      + 1.2 * rng.standard_normal((n, DIM)).astype(np.float32))
+
+    data, query = sample(rows), sample(queries)
+    user_of = rng.integers(0, users, rows)
+    return data, query, user_of
+
+
+def exact(data: np.ndarray, query: np.ndarray, k: int, allowed: np.ndarray = None):
+    scores = query @ data.T
+    if allowed is not None:
+        scores[:, ~allowed] = -np.inf
+    return [set(np.argsort(-s)[:k]) for s in scores]
+
+
+def build(index, data: np.ndarray, user_of: np.ndarray) -> float:
+    t0 = time.perf_counter()
+    for start in range(0, len(data), BATCH):
+        stop = min(len(data), start + BATCH)
+        index.upsert(
+            ids=[str(i) for i in range(start, stop)],
+            embeddings=data[start:stop],
+            documents=[f"chunk {i}" for i in range(start, stop)],
+            metadatas=[{"user_id": f"u{u}", "chunk_index": i} for i, u in zip(range(start, stop), user_of[start:stop])],
+        )
+    return time.perf_counter() - t0
+
+
+def measure(index, query: np.ndarray, truth, k: int, where=None):
+    latencies, recall = [], []
+    for q, expected in zip(query, truth):
+        t0 = time.perf_counter()
+        hits = index.query(q[None, :], k, where)[0]
+        latencies.append(time.perf_counter() - t0)
+        recall.append(len({int(h["id"]) for h in hits} & expected) / max(1, len(expected)))
+    latencies = np.asarray(latencies) * 1e3
+    return np.percentile(latencies, 50), np.percentile(latencies, 95), float(np.mean(recall))
+
+
+def report(name, build_s, index, query, truth, filtered_truth, k, where):
+    p50, p95, recall = measure(index, query, truth, k)
+    fp50, _, frecall = measure(index, query, filtered_truth, k, where)
+    per_vector = index.stats().get("bytes_per_vector", "")
+    print(f"{name:<25}{build_s:>8.1f}{per_vector:>7}{p50:>9.2f}{p95:>9.2f}{recall:>9.3f}{fp50:>11.2f}{frecall:>10.3f}")
+
+
+def main(rows: int, queries: int, k: int, users: int, nprobes, skip_chroma: bool = False):
+    data, query, user_of = make_data(rows, queries, users)
+    truth = exact(data, query, k)
+    filtered_truth = exact(data, query, k, user_of == 0)
+    where = {"user_id": "u0"}
+    print(f"{rows} x {DIM} vectors, {queries} queries, recall@{k}; filter: 1 user of {users}")
+    print(f"{'backend':<25}{'build s':>8}{'B/vec':>7}{'p50 ms':>9}{'p95 ms':>9}{'recall':>9}"
+          f"{'filt. p50':>11}{'filt. rec':>10}")
+
+    vector_index.IVF_MIN_ROWS = rows + 1  # build flat; IVF is trained explicitly below
+    for dtype, quantization in (("float32", "none"), ("float16", "none"), ("float16", "int8"), ("float16", "pq")):
+        label = dtype if quantization == "none" else quantization
+        with tempfile.TemporaryDirectory() as tmp:
+            index = vector_index.NumpyIndex(tmp, DIM, dtype, quantization)
+            report(f"numpy flat {label}", build(index, data, user_of), index, query, truth, filtered_truth, k, where)
+            if dtype == "float16":
+                t0 = time.perf_counter()
+                index.train()
+                train_s = time.perf_counter() - t0
+                nlist = index.stats()["ivf_lists"]
+                for nprobe in nprobes:
+                    vector_index.IVF_NPROBE = nprobe
+                    report(f"numpy IVF {nprobe}/{nlist} {label}", train_s, index, query, truth, filtered_truth, k, where)
+
+    if vector_index.CHROMA_AVAILABLE and not skip_chroma:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = vector_index.ChromaIndex(tmp)
+            report("chroma HNSW", build(index, data, user_of), index, query, truth, filtered_truth, k, where)
+    else:
+        print("skipping the Chroma backend" + ("" if skip_chroma else " (chromadb not installed)"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--nprobe", default="8,16")
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+    main(args.rows, args.queries, args.k, args.users, [int(n) for n in args.nprobe.split(",")], args.skip_chroma)
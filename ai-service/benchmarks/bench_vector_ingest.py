@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark VectorDB ingestion throughput (docs/sec): the previous per-document
+path (encode, .tolist(), one index write per document) against the batched
+add_documents pipeline. Each variant writes to its own temporary index
+directory. Needs sentence-transformers (and chromadb unless VECTOR_BACKEND=numpy).
+
+Usage (from ai-service/):
+    python benchmarks/bench_vector_ingest.py [--docs 300] [--batch-chunks 1024]
+    EMBED_PROCESSES=4 python benchmarks/bench_vector_ingest.py   # multi-process encode pool
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.vector_db as vector_db  # noqa: E402
+
+WORDS = ["neuron", "synapse", "membrane", "potential", "gradient", "enzyme", "protein",
+         "cell", "signal", "receptor", "ion", "channel", "voltage", "transport", "lecture"]
+
+
+def make_docs(n: int, seed: int = 0):
+    """Notes of very different lengths (0.5-12 KB), like a real upload history."""
+    rnd = random.Random(seed)
+    return [
+        (f"doc{i}", " ".join(rnd.choices(WORDS, k=rnd.randint(80, 2000))), {"user_id": f"u{i % 7}"})
+        for i in range(n)
+    ]
+
+
+async def legacy_ingest(db: "vector_db.VectorDB", docs) -> int:
+    # previous add_document body, kept as the reference
+    added = 0
+    for document_id, text, metadata in docs:
+        chunks = db._chunk_text(text)
+        embeddings = db.embedding_model.encode(chunks).tolist()
+        ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
+        metadatas = [{**metadata, "chunk_index": i, "chunk_text": chunk[:100]} for i, chunk in enumerate(chunks)]
+        db.index.upsert(ids=ids, embeddings=embeddings, documents=chunks, metadatas=metadatas)
+        added += len(chunks)
+    return added
+
+
+async def batched_ingest(db: "vector_db.VectorDB", docs) -> int:
+    return await db.add_documents(docs)
+
+
+def run(name: str, ingest, docs, batch_chunks: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHROMA_DB_PATH"] = os.environ["VECTOR_INDEX_PATH"] = tmp
+        db = vector_db.VectorDB()
+        db.ingest_batch_chunks = min(batch_chunks, db.ingest_batch_chunks)
+        db.embedding_model.encode(["warm up"])
+        t0 = time.perf_counter()
+        chunks = asyncio.run(ingest(db, docs))
+        elapsed = time.perf_counter() - t0
+        assert db.index.count() == chunks
+        db.shutdown()
+    print(f"{name:<28}{len(docs) / elapsed:>10.1f}{chunks / elapsed:>12.0f}{elapsed:>9.1f}")
+    return elapsed
+
+
+def main(num_docs: int, batch_chunks: int):
+    docs = make_docs(num_docs)
+    print(f"{num_docs} documents, {sum(len(t) for _, t, _ in docs) / 1e6:.1f} MB of text; "
+          f"EMBED_BATCH_SIZE={vector_db.EMBED_BATCH_SIZE}, EMBED_PROCESSES={vector_db.EMBED_PROCESSES}")
+    print(f"{'variant':<28}{'docs/s':>10}{'chunks/s':>12}{'time s':>9}")
+    legacy = run("per-document (legacy)", legacy_ingest, docs, batch_chunks)
+    batched = run(f"add_documents ({batch_chunks}/batch)", batched_ingest, docs, batch_chunks)
+    print(f"speedup: {legacy / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--batch-chunks", type=int, default=vector_db.INGEST_BATCH_CHUNKS)
+    args = parser.parse_args()
+    main(args.docs, args.batch_chunks)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark re-indexing a lightly edited document: the previous update_document
+(delete every chunk, re-embed and re-add the whole text) against the diffing
+update_document with the embedding cache. Reports time and chunks embedded.
+Needs sentence-transformers (and chromadb unless VECTOR_BACKEND=numpy).
+
+Usage (from ai-service/):
+    python benchmarks/bench_vector_update.py [--pages 200] [--edits 1]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.vector_db as vector_db  # noqa: E402
+
+WORDS = ["neuron", "synapse", "membrane", "potential", "gradient", "enzyme", "protein",
+         "cell", "signal", "receptor", "ion", "channel", "voltage", "transport", "lecture"]
+
+
+def make_document(rnd: random.Random, pages: int) -> str:
+    return "\n\n".join(
+        f"[Page {p}]\n" + "\n".join(" ".join(rnd.choices(WORDS, k=rnd.randint(6, 30))) for _ in range(25))
+        for p in range(1, pages + 1)
+    )
+
+
+def edit(rnd: random.Random, text: str, edits: int) -> str:
+    """Insert a sentence into `edits` random lines (shifts everything after it)."""
+    lines = text.split("\n")
+    for i in rnd.sample(range(len(lines)), edits):
+        lines[i] += " " + " ".join(rnd.choices(WORDS, k=8))
+    return "\n".join(lines)
+
+
+class CountingEncoder:
+    def __init__(self, encode):
+        self.encode, self.texts = encode, 0
+
+    def __call__(self, texts):
+        self.texts += len(texts)
+        return self.encode(texts)
+
+
+async def legacy_update(db, document_id, text, metadata):
+    # previous update_document: delete everything, then re-add (re-embedding every chunk)
+    await db.delete_document(document_id)
+    return await db.add_document(document_id, text, metadata)
+
+
+def run(name: str, update, original: str, edited: str, use_cache: bool):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHROMA_DB_PATH"] = os.path.join(tmp, "chroma")
+        os.environ["VECTOR_INDEX_PATH"] = os.path.join(tmp, "index")
+        os.environ["EMBED_CACHE_PATH"] = os.path.join(tmp, "embeddings.sqlite3")
+        os.environ["EMBED_CACHE_ENABLED"] = "1" if use_cache else "0"
+        db = vector_db.VectorDB()
+        asyncio.run(db.add_document("doc", original, {"user_id": "u1"}))
+        db._encode = counter = CountingEncoder(db._encode)
+        t0 = time.perf_counter()
+        asyncio.run(update(db, "doc", edited, {"user_id": "u1"}))
+        elapsed = time.perf_counter() - t0
+        chunks = db.index.count()
+        db.shutdown()
+    print(f"{name:<34}{elapsed * 1e3:>10.1f}{counter.texts:>10}{chunks:>8}")
+
+
+def main(num_pages: int, edits: int):
+    rnd = random.Random(0)
+    original = make_document(rnd, num_pages)
+    edited = edit(rnd, original, edits)
+    print(f"{num_pages} pages, {len(original) / 1e6:.2f} MB, {edits} edited line(s)")
+    print(f"{'update':<34}{'ms':>10}{'embedded':>10}{'chunks':>8}")
+    run("delete + re-add (legacy)", legacy_update, original, edited, use_cache=False)
+    run("diff + embedding cache", lambda db, *a: db.update_document(*a), original, edited, use_cache=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=1)
+    args = parser.parse_args()
+    main(args.pages, args.edits)
@@ -1,13 +1,22 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
 import logging
 import json
+import os
 
 from models.model_manager import ModelManager
-from models.specialized_models import SummaryGenerator, QuizGenerator, FlashcardGenerator, ChatGenerator
-from utils.data_processor import DocumentProcessor
+from models.specialized_models import SummaryGenerator, QuizGenerator, FlashcardGenerator, ChatGenerator, StudyPackGenerator
+from utils.data_processor import DocumentProcessor, UploadTooLarge
+from utils.cache_manager import CacheManager, make_key
+from utils.single_flight import SingleFlight
+from utils.job_queue import JobQueue
+from utils.document_store import DocumentStore
+from utils.near_duplicate import NearDuplicateIndex, PageLinker, public_report, split_pages
+from utils.vector_db import get_vector_db
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,21 +30,252 @@ model_manager = ModelManager({
     "flashcards": {"type": "base"},
 })
 processor = DocumentProcessor()
+cache = CacheManager()
+flights = SingleFlight()  # coalesces identical in-flight generations
+RESULT_TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+jobs = JobQueue()  # persistent queue for POST /jobs
+jobs_wakeup = asyncio.Event()
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+background_tasks = set()
+documents = DocumentStore()  # extracted text by digest, referenced as document_id
+near_dups = NearDuplicateIndex()  # MinHash/LSH over stored pages: links re-exports and revisions
+CHAT_RETRIEVAL_ENABLED = os.getenv("CHAT_RETRIEVAL_ENABLED", "1") == "1"
+# quiz/flashcards map only a diverse subset of passages sized to the request; see MapReduceGenerator._generate_selected
+CHUNK_SELECTION_ENABLED = os.getenv("CHUNK_SELECTION_ENABLED", "1") == "1"
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "8"))  # chunks retrieved per grounded chat turn (then packed to RAG_CONTEXT_TOKENS)
+vector_db = None  # chunk index over stored documents (grounded chat, passage selection); set on startup, None if unavailable
+indexing = {}  # document_id -> in-flight indexing task
+indexed_documents = set()
+
+def result_key(task: str, gen, **params) -> str:
+    """Result-cache key: the request plus the generator's prompt version and map mode, so prompt changes miss."""
+    mode = "select" if getattr(gen, "passages", None) is not None else "map"
+    return make_key(task, prompt_version=gen.PROMPT_VERSION, mode=mode, **params)
+
+async def cached_generation(key: str, run, regenerate: bool = False):
+    """
+    Serve from the result cache, else run once per key no matter how many identical
+    requests arrive. regenerate skips the cached result (quizzes are sampled, so a
+    new run gives new questions) and replaces it; identical regenerations still coalesce.
+    """
+    async def job():
+        if not regenerate:
+            cached = await cache.get(key)
+            if cached is not None:
+                logger.info(f"♻️  Result cache hit {key[:24]}...")
+                return cached
+        result = await run()
+        await cache.set(key, result, ttl=RESULT_TTL)
+        return result
+    return await flights.do(f"{key}:regenerate" if regenerate else key, job)
+
+async def resolve_content(content: Optional[str], document_id: Optional[str]) -> str:
+    """Request text: inline content, or the stored document for document_id."""
+    if content is not None:
+        return content
+    if not document_id:
+        raise HTTPException(status_code=400, detail="Either content or document_id is required")
+    text = await asyncio.to_thread(documents.get, document_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail=f"Unknown document_id '{document_id}'")
+    return text
+
+def store_document(text: str, document_id: Optional[str] = None):
+    """
+    Store text as a document; returns (content, document_id, near-duplicate report).
+    Pages that nearly match a stored page are linked to it in the report; the text
+    itself is stored as uploaded. The report names other documents: it is logged,
+    and clients only get its public_report. See utils.near_duplicate.
+    """
+    linker = PageLinker(near_dups, documents.get, document_id)
+    content = "\n\n".join(linker.page(page) for page in split_pages(text))
+    report = linker.report()
+    document_id = documents.put(content, document_id)
+    linker.index_as(document_id)
+    log_near_duplicates(document_id, report)
+    return content, document_id, report
+
+def index_document(document_id: str, content: str):
+    """Chunk and embed a stored document for grounded chat in the background; returns the task (None without a vector DB)."""
+    if vector_db is None:
+        return None
+    task = indexing.get(document_id)
+    if task is None:
+        task = asyncio.create_task(vector_db.update_document(document_id, content, {}))
+        indexing[document_id] = task
+
+        def done(t):
+            # clear the in-flight marker whatever the outcome, so a later request retries a failed index
+            if indexing.get(document_id) is t:
+                del indexing[document_id]
+            if t.cancelled():
+                logger.warning(f"⚠️ Indexing of document {document_id} was cancelled")
+            elif t.exception() is not None:
+                e = t.exception()
+                logger.error(f"❌ Indexing of document {document_id} failed: {e}", exc_info=e)
+            elif t.result():
+                indexed_documents.add(document_id)
+            else:
+                logger.warning(f"⚠️ Document {document_id} was not indexed; it will be retried on next use")
+        task.add_done_callback(done)
+    return task
+
+async def ensure_indexed(document_ids: List[str]):
+    """Wait for in-flight indexing of the documents; index those stored before they could be."""
+    pending = []
+    for document_id in document_ids:
+        if document_id in indexed_documents:
+            continue
+        task = indexing.get(document_id)
+        if task is None:
+            if await vector_db.has_document(document_id):
+                indexed_documents.add(document_id)
+                continue
+            text = await asyncio.to_thread(documents.get, document_id)
+            if text is None:
+                raise HTTPException(status_code=404, detail=f"Unknown document_id '{document_id}'")
+            task = index_document(document_id, text)
+        pending.append(task)
+    await asyncio.gather(*pending)
+
+async def retrieve_for_chat(message: str, history: list, document_ids: List[str]) -> List[dict]:
+    """
+    Chunks of the given documents relevant to a chat turn, best first. The previous
+    user message is searched in the same batch, so a follow-up ("and the second
+    one?") still finds its topic; the current message's hits lead.
+    """
+    if vector_db is None:
+        raise HTTPException(status_code=503, detail="Document retrieval is unavailable (vector database not loaded)")
+    await ensure_indexed(document_ids)
+    queries = [message]
+    previous = next((m.get("content", "") for m in reversed(history) if m.get("role") == "user"), "")
+    if previous.strip():
+        queries.append(previous)
+    where = {"document_id": {"$in": document_ids}} if len(document_ids) > 1 else {"document_id": document_ids[0]}
+    rankings = await vector_db.search_many(queries, RAG_TOP_K, where)
+    hits, seen = [], set()
+    for rank in range(RAG_TOP_K):
+        for ranking in rankings:
+            if rank < len(ranking):
+                meta = ranking[rank]["metadata"]
+                chunk = (meta.get("document_id"), meta.get("chunk_index"))
+                if chunk not in seen:
+                    seen.add(chunk)
+                    hits.append(ranking[rank])
+    logger.info(f"📚 Retrieved {len(hits)} chunks from {len(document_ids)} document(s) for chat")
+    return hits[:RAG_TOP_K]
+
+def log_near_duplicates(document_id: str, report: dict):
+    match = report["near_duplicate_of"]
+    if match or report["linked_pages"]:
+        logger.info(f"🔗 {document_id[:12]}: {report['linked_pages']}/{report['pages']} pages linked to stored pages "
+                    f"({report['identical_pages']} identical)"
+                    + (f", near-duplicate of {match['document_id'][:12]} ({match['similarity']:.2f})" if match else ""))
+
+# -------------------- generation (shared by endpoints and the job worker) --------------------
+
+def passage_source():
+    """Passage embeddings for quiz/flashcard passage selection, or None to map every chunk."""
+    return vector_db.embed_passages if CHUNK_SELECTION_ENABLED and vector_db is not None else None
+
+def map_cache_for(regenerate: bool):
+    """Map-output cache for a run; regenerations re-run the (sampled) maps too, for new material."""
+    return None if regenerate else cache
+
+async def run_summary(content: str, title: str, progress=None, stream_reduce: bool = False, regenerate: bool = False):
+    gen = SummaryGenerator(model_manager.get("summary"), map_cache=map_cache_for(regenerate), progress=progress,
+                           stream_reduce=stream_reduce)
+    key = result_key("summary", gen, content=content, title=title)
+    return await cached_generation(key, lambda: gen.generate(content, title), regenerate)
+
+async def run_quiz(content: str, title: str, num_questions: int = 8, progress=None, stream_reduce: bool = False,
+                   regenerate: bool = False):
+    gen = QuizGenerator(model_manager.get("quiz"), map_cache=map_cache_for(regenerate), progress=progress,
+                        stream_reduce=stream_reduce, passages=passage_source())
+    key = result_key("quiz", gen, content=content, title=title, num_questions=num_questions)
+    return await cached_generation(key, lambda: gen.generate(content, title, num_questions), regenerate)
+
+async def run_flashcards(content: str, title: str, num_cards: int = 12, progress=None, stream_reduce: bool = False,
+                         regenerate: bool = False):
+    gen = FlashcardGenerator(model_manager.get("flashcards"), map_cache=map_cache_for(regenerate), progress=progress,
+                             stream_reduce=stream_reduce, passages=passage_source())
+    key = result_key("flashcards", gen, content=content, title=title, num_cards=num_cards)
+    return await cached_generation(key, lambda: gen.generate(content, title, num_cards), regenerate)
+
+async def run_study_pack(content: str, title: str, num_questions: int = 8, num_cards: int = 12, progress=None,
+                         regenerate: bool = False):
+    gen = StudyPackGenerator(model_manager.get("summary"), map_cache=map_cache_for(regenerate), progress=progress)
+    # cached under its own key only: the pack's shared prompts, greedy reduces and full map
+    # differ from the standalone generators, so it must not answer /generate/quiz etc.
+    key = result_key("study_pack", gen, content=content, title=title, num_questions=num_questions, num_cards=num_cards)
+    return await cached_generation(key, lambda: gen.generate(content, title, num_questions, num_cards), regenerate)
+
+def sse_generation(runner) -> StreamingResponse:
+    """
+    Stream a map/reduce generation as Server-Sent Events.
+
+    Emits the generator's progress events as they happen ("plan", "chunk" with the
+    chunk's partial bullets/questions/cards, "reduce", "reduce_token"), then a final
+    "done" event carrying the full result. Cached results go straight to "done";
+    a request coalesced onto an identical in-flight job only receives "done".
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            result = await runner(queue.put_nowait)
+            queue.put_nowait({"event": "done", "data": result})
+        except Exception as e:
+            logger.error(f"❌ Streaming generation failed: {e}", exc_info=True)
+            queue.put_nowait({"event": "error", "message": str(e)})
+        finally:
+            queue.put_nowait(None)
+
+    async def stream():
+        task = asyncio.create_task(produce())
+        background_tasks.add(task)  # strong ref: keeps running if the client disconnects
+        task.add_done_callback(background_tasks.discard)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield f"data: {json.dumps(event)}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            # generation keeps running for the cache/other waiters if the client leaves
+            if not task.done():
+                logger.info("🔌 SSE client disconnected; generation continues in background")
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
 
 @app.on_event("startup")
 async def startup_event():
+    global vector_db
     await model_manager.load_models()
+    if CHAT_RETRIEVAL_ENABLED or CHUNK_SELECTION_ENABLED:
+        vector_db = await asyncio.to_thread(get_vector_db)
+    await asyncio.to_thread(jobs.requeue_orphans)
+    app.state.job_worker = asyncio.create_task(job_worker())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    processor.shutdown()
+    if vector_db is not None:
+        vector_db.shutdown()
 
 class SummaryReq(BaseModel):
-    content: str
+    content: Optional[str] = None
+    document_id: Optional[str] = None  # alternative to content: a stored document
     title: str
+    regenerate: bool = False  # skip the cached result and generate anew
 
 @app.post("/generate/summary")
 async def generate_summary(req: SummaryReq):
+    content = await resolve_content(req.content, req.document_id)
     try:
-        logger.info(f"📝 Generating summary for: {req.title[:50]}... (content length: {len(req.content)} chars)")
-        gen = SummaryGenerator(model_manager.get("summary"))
-        result = await gen.generate(req.content, req.title)
+        logger.info(f"📝 Generating summary for: {req.title[:50]}... (content length: {len(content)} chars)")
+        result = await run_summary(content, req.title, regenerate=req.regenerate)
         logger.info(f"✅ Summary generated successfully")
         return {"success": True, "data": result}
     except Exception as e:
@@ -43,16 +283,18 @@ async def generate_summary(req: SummaryReq):
         raise HTTPException(status_code=500, detail=str(e))
 
 class QuizReq(BaseModel):
-    content: str
+    content: Optional[str] = None
+    document_id: Optional[str] = None  # alternative to content: a stored document
     title: str
     num_questions: int = 8
+    regenerate: bool = False  # skip the cached result and generate anew
 
 @app.post("/generate/quiz")
 async def generate_quiz(req: QuizReq):
+    content = await resolve_content(req.content, req.document_id)
     try:
-        logger.info(f"🎲 Generating quiz for: {req.title[:50]}... (content: {len(req.content)} chars, questions: {req.num_questions})")
-        gen = QuizGenerator(model_manager.get("quiz"))
-        result = await gen.generate(req.content, req.title, req.num_questions)
+        logger.info(f"🎲 Generating quiz for: {req.title[:50]}... (content: {len(content)} chars, questions: {req.num_questions})")
+        result = await run_quiz(content, req.title, req.num_questions, regenerate=req.regenerate)
         logger.info("✅ Quiz generated successfully")
         return {"success": True, "data": result}
     except Exception as e:
@@ -60,35 +302,275 @@ async def generate_quiz(req: QuizReq):
         raise HTTPException(status_code=500, detail=str(e))
 
 class FlashReq(BaseModel):
-    content: str
+    content: Optional[str] = None
+    document_id: Optional[str] = None  # alternative to content: a stored document
     title: str
     num_cards: int = 12
+    regenerate: bool = False  # skip the cached result and generate anew
 
 @app.post("/generate/flashcards")
 async def generate_flashcards(req: FlashReq):
-    gen = FlashcardGenerator(model_manager.get("flashcards"))
-    result = await gen.generate(req.content, req.title, req.num_cards)
+    content = await resolve_content(req.content, req.document_id)
+    result = await run_flashcards(content, req.title, req.num_cards, regenerate=req.regenerate)
     return {"success": True, "data": result}
 
+@app.post("/generate/summary/stream")
+async def generate_summary_stream(req: SummaryReq):
+    content = await resolve_content(req.content, req.document_id)
+    return sse_generation(lambda cb: run_summary(content, req.title, progress=cb, stream_reduce=True,
+                                                 regenerate=req.regenerate))
+
+@app.post("/generate/quiz/stream")
+async def generate_quiz_stream(req: QuizReq):
+    content = await resolve_content(req.content, req.document_id)
+    return sse_generation(lambda cb: run_quiz(content, req.title, req.num_questions, progress=cb, stream_reduce=True,
+                                              regenerate=req.regenerate))
+
+@app.post("/generate/flashcards/stream")
+async def generate_flashcards_stream(req: FlashReq):
+    content = await resolve_content(req.content, req.document_id)
+    return sse_generation(lambda cb: run_flashcards(content, req.title, req.num_cards, progress=cb, stream_reduce=True,
+                                                    regenerate=req.regenerate))
+
+class StudyPackReq(BaseModel):
+    content: Optional[str] = None
+    document_id: Optional[str] = None  # alternative to content: a stored document
+    title: str
+    num_questions: int = 8
+    num_cards: int = 12
+    regenerate: bool = False  # skip the cached result and generate anew
+
+@app.post("/generate/study-pack")
+async def generate_study_pack(req: StudyPackReq):
+    """Summary, quiz and flashcards from one shared map pass over the document."""
+    content = await resolve_content(req.content, req.document_id)
+    try:
+        logger.info(f"📚 Generating study pack for: {req.title[:50]}... (content length: {len(content)} chars)")
+        result = await run_study_pack(content, req.title, req.num_questions, req.num_cards, regenerate=req.regenerate)
+        logger.info("✅ Study pack generated successfully")
+        return {"success": True, "data": result}
+    except Exception as e:
+        logger.error(f"❌ Study pack generation failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+# -------------------- async jobs --------------------
+
+JOB_TASKS = {
+    "summary": lambda p, cb: run_summary(p["content"], p["title"], progress=cb, regenerate=p.get("regenerate", False)),
+    "quiz": lambda p, cb: run_quiz(p["content"], p["title"], p.get("num_questions", 8), progress=cb,
+                                   regenerate=p.get("regenerate", False)),
+    "flashcards": lambda p, cb: run_flashcards(p["content"], p["title"], p.get("num_cards", 12), progress=cb,
+                                               regenerate=p.get("regenerate", False)),
+    "study-pack": lambda p, cb: run_study_pack(p["content"], p["title"], p.get("num_questions", 8),
+                                               p.get("num_cards", 12), progress=cb, regenerate=p.get("regenerate", False)),
+}
+
+def _job_progress(job_id: str):
+    """
+    Map generator progress events onto a 0..1 job progress (map phase = 90%).
+    Events arrive on the event loop; one writer task per job saves the latest
+    state in a worker thread, in order, skipping states superseded meanwhile.
+    """
+    latest = []
+    writer = None
+
+    async def write():
+        while latest:
+            progress, stage = latest.pop()
+            await asyncio.to_thread(jobs.update_progress, job_id, progress, stage)
+
+    def save(progress: float, stage: str):
+        nonlocal writer
+        latest[:] = [(progress, stage)]
+        if writer is None or writer.done():
+            writer = asyncio.create_task(write())
+            background_tasks.add(writer)
+            writer.add_done_callback(background_tasks.discard)
+
+    def report(event):
+        if event["event"] == "plan":
+            save(0.0, f"map 0/{event['chunks']}")
+        elif event["event"] == "chunk":
+            save(0.9 * event["done"] / max(1, event["total"]), f"map {event['done']}/{event['total']}")
+        elif event["event"] == "reduce":
+            save(0.9, "reduce")
+    return report
+
+async def job_worker():
+    """Run queued jobs one at a time on this process's model."""
+    while True:
+        job = await asyncio.to_thread(jobs.claim_next)
+        if job is None:
+            jobs_wakeup.clear()
+            try:
+                await asyncio.wait_for(jobs_wakeup.wait(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        logger.info(f"🛠️  Job {job['id']} started ({job['task']})")
+        try:
+            payload = job["payload"]
+            if payload.get("content") is None:
+                payload["content"] = await asyncio.to_thread(documents.get, payload.get("document_id") or "")
+                if payload["content"] is None:
+                    raise ValueError(f"Document {payload.get('document_id')} is no longer stored")
+            result = await JOB_TASKS[job["task"]](payload, _job_progress(job["id"]))
+            await asyncio.to_thread(jobs.complete, job["id"], result)
+            logger.info(f"✅ Job {job['id']} done")
+        except Exception as e:
+            logger.error(f"❌ Job {job['id']} failed: {e}", exc_info=True)
+            await asyncio.to_thread(jobs.fail, job["id"], str(e))
+
+class JobReq(BaseModel):
+    task: str
+    content: Optional[str] = None
+    document_id: Optional[str] = None
+    title: str
+    num_questions: int = 8
+    num_cards: int = 12
+    regenerate: bool = False  # skip the cached result and generate anew
+
+@app.post("/jobs")
+async def create_job(req: JobReq):
+    if req.task not in JOB_TASKS:
+        raise HTTPException(status_code=400, detail=f"Unknown task '{req.task}'. Expected one of: {', '.join(JOB_TASKS)}")
+    if req.content is None:
+        await resolve_content(None, req.document_id)  # 400/404 now rather than a failed job later
+    # document_id jobs store only the id; the worker loads the text when it runs
+    job_id = await asyncio.to_thread(jobs.submit, req.task, req.model_dump(exclude={"task"}, exclude_none=True))
+    jobs_wakeup.set()
+    return {"success": True, "job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "job": job}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """SSE progress stream; ends with the finished job (including its result)."""
+    if await asyncio.to_thread(jobs.get, job_id, include_result=False) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        last = None
+        while True:
+            job = await asyncio.to_thread(jobs.get, job_id, include_result=False)
+            state = (job["status"], job["progress"], job["stage"])
+            if job["status"] in ("done", "failed"):
+                yield f"data: {json.dumps(await asyncio.to_thread(jobs.get, job_id))}\n\n"
+                yield "data: [DONE]\n\n"
+                return
+            if state != last:
+                last = state
+                yield f"data: {json.dumps(job)}\n\n"
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
 @app.post("/upload/document")
 async def upload_document(file: UploadFile = File(...)):
+    """Extract text; the response's digest (SHA-256 of the file) identifies the document."""
     try:
-        text = await processor.process_file(file)
-        return {"success": True, "content": text}
+        doc = await processor.process_upload(file)
+        content, document_id, linked = await asyncio.to_thread(store_document, doc["content"], doc["digest"])
+        index_document(document_id, content)
+        return {"success": True, "content": content, "digest": doc["digest"], "cached": doc["cached"],
+                "document_id": document_id, "near_duplicate": public_report(linked)}
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+UPLOAD_GENERATORS = {
+    "summary": lambda: SummaryGenerator(model_manager.get("summary"), map_cache=cache),
+    "quiz": lambda: QuizGenerator(model_manager.get("quiz"), map_cache=cache),
+    "flashcards": lambda: FlashcardGenerator(model_manager.get("flashcards"), map_cache=cache),
+}
+
+@app.post("/upload/generate/{task}")
+async def upload_and_generate(task: str, file: UploadFile = File(...), title: str = Form(""),
+                              num_questions: int = Form(8), num_cards: int = Form(12)):
+    """
+    Upload a document and generate from it in one request. Pages are tokenized and
+    chunk maps start while later pages are still being extracted, instead of waiting
+    for the whole document first. Returns the extracted text along with the result.
+    Near-duplicate pages are linked on arrival, as in store_document. Passage
+    selection needs the whole text, so every chunk is mapped on this path.
+    """
+    if task not in UPLOAD_GENERATORS:
+        raise HTTPException(status_code=400, detail=f"Unknown task '{task}'. Expected one of: {', '.join(UPLOAD_GENERATORS)}")
+    if not processor.validate_file(file):
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    title = title or file.filename or "Document"
+    try:
+        async with processor.open_pages(file) as (digest, page_count, pages):
+            extracted = []
+            linker = PageLinker(near_dups, documents.get, digest)
+
+            async def tee():
+                async for item in pages:
+                    for page in split_pages(item):
+                        page = await asyncio.to_thread(linker.page, page)
+                        extracted.append(page)
+                        yield page
+
+            logger.info(f"📥 Upload+{task} for: {title[:50]}... ({page_count} pages)")
+            count = {"quiz": num_questions, "flashcards": num_cards}.get(task, 0)
+            result = await UPLOAD_GENERATORS[task]().generate_pages(tee(), title, page_count, count)
+        content = "\n\n".join(extracted).strip()
+        linked = linker.report()
+        await asyncio.to_thread(documents.put, content, digest)
+        await asyncio.to_thread(linker.index_as, digest)
+        log_near_duplicates(digest, linked)
+        index_document(digest, content)
+        return {"success": True, "content": content, "digest": digest, "document_id": digest, "data": result,
+                "near_duplicate": public_report(linked)}
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Upload+{task} failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+class DocumentReq(BaseModel):
+    content: str
+
+@app.post("/documents")
+async def register_document(req: DocumentReq):
+    """Store already-extracted text; later requests can pass the returned document_id instead of content."""
+    content, document_id, linked = await asyncio.to_thread(store_document, req.content)
+    index_document(document_id, content)
+    return {"success": True, "document_id": document_id, "near_duplicate": public_report(linked)}
+
+@app.get("/documents/{document_id}")
+async def get_document(document_id: str, include_content: bool = False):
+    text = await asyncio.to_thread(documents.get, document_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    doc = {"document_id": document_id, "chars": len(text)}
+    if include_content:
+        doc["content"] = text
+    return {"success": True, "document": doc}
+
 class ChatReq(BaseModel):
     message: str
     history: list = []
+    document_ids: List[str] = []  # stored documents to answer from: relevant chunks are retrieved and cited
 
 @app.post("/chat")
 async def chat(req: ChatReq):
+    context = await retrieve_for_chat(req.message, req.history, req.document_ids) if req.document_ids else None
     try:
         logger.info(f"💬 Chat request - message: {req.message[:50]}..., history: {len(req.history)} messages")
         gen = ChatGenerator(model_manager.get("summary"))  # Use same model as summary
         # Increased max_tokens for complete responses, balanced temperature
-        result = await gen.generate(req.message, req.history, max_tokens=1000, temperature=0.5)
+        # Sampled output: identical in-flight requests are coalesced but never cached
+        key = make_key("chat", message=req.message, history=req.history, document_ids=sorted(req.document_ids))
+        result = await flights.do(
+            key, lambda: gen.generate(req.message, req.history, max_tokens=1000, temperature=0.5, context=context)
+        )
         logger.info(f"✅ Chat response generated successfully")
         return {"success": True, "message": result["message"], "data": result}
     except Exception as e:
@@ -100,11 +582,18 @@ async def chat_stream(req: ChatReq):
     """
     Stream chat response token by token using Server-Sent Events (SSE).
     This provides true streaming like ChatGPT - tokens appear as they're generated.
+    With document_ids, a "sources" event lists the retrieved excerpts before the message.
     """
+    context = await retrieve_for_chat(req.message, req.history, req.document_ids) if req.document_ids else None
+
     async def generate():
         try:
             gen = ChatGenerator(model_manager.get("summary"))
-            for chunk in gen.generate_stream(req.message, req.history, max_tokens=1000, temperature=0.5):
+            key = make_key("chat_stream", message=req.message, history=req.history, document_ids=sorted(req.document_ids))
+            stream = flights.stream(
+                key, lambda: gen.generate_stream(req.message, req.history, max_tokens=1000, temperature=0.5, context=context)
+            )
+            async for chunk in stream:
                 yield f"data: {json.dumps(chunk)}\n\n"
             yield "data: [DONE]\n\n"
         except Exception as e:
@@ -116,3 +605,10 @@ async def chat_stream(req: ChatReq):
 @app.get("/health")
 async def health():
     return await model_manager.health_check()
+
+@app.get("/metrics")
+async def metrics():
+    extraction = await asyncio.to_thread(processor.extract_cache.stats) if processor.extract_cache else None
+    return {"coalescing": flights.stats(), "cache": await cache.health_check(), "jobs": await asyncio.to_thread(jobs.stats),
+            "extraction_cache": extraction, "documents": await asyncio.to_thread(documents.stats), "near_duplicates": near_dups.stats(),
+            "vector_db": await vector_db.health_check() if vector_db else None}
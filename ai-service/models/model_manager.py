@@ -1,5 +1,6 @@
 # models/model_manager.py
 import logging
+import threading
 from typing import Dict, Any
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
@@ -36,7 +37,8 @@ class ModelManager:
         # from transformers import GenerationConfig
         # model.generation_config = GenerationConfig.from_model_config(model.config)  # default cache impl
 
-        self.shared_base = {"tokenizer": tokenizer, "model": model, "config": model.config}
+        # lock serializes GPU work when generations run in worker threads
+        self.shared_base = {"tokenizer": tokenizer, "model": model, "config": model.config, "lock": threading.RLock()}
 
         # Reuse the same instance for all tasks
         self.models["summary"] = self.shared_base
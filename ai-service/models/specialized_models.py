@@ -1,17 +1,76 @@
+from collections import OrderedDict
 from datetime import datetime
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple, Optional
+import asyncio
+import copy
+import hashlib
+import math
+import os
+import re
+import threading
+import zlib
 import torch
 import time
 
+from utils.boilerplate import BoilerplateDetector, strip_boilerplate
+from utils.cache_manager import make_key
+from utils.chunk_selection import group_in_order, mmr_select
+from utils.chunking import Chunk
+
+_PAGE_MARKER = re.compile(r"^\[Page \d+\]$", re.MULTILINE)
+MAP_CACHE_TTL = int(os.getenv("MAP_CACHE_TTL", str(30 * 24 * 3600)))
+PLAN_CACHE_ITEMS = int(os.getenv("PLAN_CACHE_ITEMS", "32"))
+STRIP_BOILERPLATE = os.getenv("STRIP_BOILERPLATE", "1") == "1"
+SELECT_OVERSAMPLE = float(os.getenv("SELECT_OVERSAMPLE", "1.5"))  # passages mapped per requested question/card
+SELECT_DIVERSITY = float(os.getenv("SELECT_DIVERSITY", "0.7"))  # MMR weight of novelty against centrality
+SELECT_MIN_TOKENS = int(os.getenv("SELECT_MIN_TOKENS", "32"))  # shorter passages (headings, captions) are never selected
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))  # chat-model tokens of retrieved excerpts per grounded turn
+# page packing closes a chunk at an anchor page only once it is this full, so chunks stay near the window size
+ANCHOR_MIN_FILL = float(os.getenv("ANCHOR_MIN_FILL", "0.8"))
+
+# (generator class, content sha256) -> (total_tokens, chunks, stripped_tokens); see MapReduceGenerator._plan
+_plan_cache: "OrderedDict[Tuple[str, str], Tuple[int, List[str], int]]" = OrderedDict()
+
 class BaseChatWrapper:
     def __init__(self, model_data: Dict[str, Any]):
         self.tok = model_data["tokenizer"]
         self.model = model_data["model"]
         self.config = model_data["config"]
+        # Model calls run in worker threads (see _call); the shared lock keeps them one at a time
+        self.lock = model_data.get("lock") or threading.RLock()
         self.model.eval()
         if self.tok.pad_token_id is None and self.tok.eos_token_id is not None:
             self.tok.pad_token = self.tok.eos_token
 
+    async def _call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking model call off the event loop."""
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def _stream_tokens(self, messages: List[Dict[str, str]], max_new_tokens: int = 600, temperature: float = 0.0) -> AsyncIterator[str]:
+        """Async view of _chat_stream; each decoding step runs in a worker thread."""
+        end = object()
+        it = self._chat_stream(messages, max_new_tokens=max_new_tokens, temperature=temperature)
+        while True:
+            token = await asyncio.to_thread(next, it, end)
+            if token is end:
+                return
+            yield token
+
+    def _generate_kwargs(self, max_new_tokens: int, temperature: float) -> Dict[str, Any]:
+        do_sample = temperature is not None and temperature > 0.0
+        return dict(
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            temperature=temperature if do_sample else None,
+            top_p=0.9 if do_sample else None,
+            repetition_penalty=1.05,
+            eos_token_id=self.tok.eos_token_id,
+            pad_token_id=(self.tok.pad_token_id or self.tok.eos_token_id),
+            use_cache=True,
+            num_beams=1,  # Greedy decoding for speed
+            early_stopping=True,  # Stop early if EOS is generated
+        )
+
     def _chat(self, messages: List[Dict[str, str]], max_new_tokens: int = 600, temperature: float = 0.0) -> str:
         prompt = self.tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
         inputs = self.tok(prompt, return_tensors="pt")
@@ -20,31 +79,66 @@ class BaseChatWrapper:
         print(f"🔧 Device: {device} | inputs_device BEFORE move: {inputs['input_ids'].device}")
         inputs = {k: v.to(device) for k, v in inputs.items()}
         print(f"🔧 inputs_device AFTER move: {inputs['input_ids'].device}")
-        do_sample = temperature is not None and temperature > 0.0
-        
+
         import time
         start = time.time()
         print("🔄 Starting model.generate()...")
-        with torch.no_grad():
-            out = self.model.generate(
-                **inputs,
-                max_new_tokens=max_new_tokens,
-                do_sample=do_sample,
-                temperature=temperature if do_sample else None,
-                top_p=0.9 if do_sample else None,
-                repetition_penalty=1.05,
-                eos_token_id=self.tok.eos_token_id,
-                pad_token_id=(self.tok.pad_token_id or self.tok.eos_token_id),
-                use_cache=True,
-                num_beams=1,  # Greedy decoding for speed
-                early_stopping=True,  # Stop early if EOS is generated
-            )
+        with self.lock, torch.no_grad():
+            out = self.model.generate(**inputs, **self._generate_kwargs(max_new_tokens, temperature))
         gen_time = time.time() - start
         actual_tokens = out.shape[1] - inputs["input_ids"].shape[1]
         print(f"⚡ Generation took {gen_time:.2f}s for {actual_tokens} tokens ({actual_tokens/gen_time:.1f} tok/s)")
         print(f"⚡ Output shape: {out.shape}")
         return self.tok.decode(out[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True).strip()
 
+    def _encode_chat(self, messages: List[Dict[str, str]]) -> List[int]:
+        prompt = self.tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        return self.tok(prompt)["input_ids"]
+
+    def _prefill(self, ids: List[int]):
+        """Run the prompt prefix through the model once and return its KV cache."""
+        device = next(self.model.parameters()).device
+        with self.lock, torch.no_grad():
+            out = self.model(input_ids=torch.tensor([ids], device=device), use_cache=True)
+        return out.past_key_values
+
+    def _chat_ids(self, ids: List[int], max_new_tokens: int = 600, temperature: float = 0.0, prefix_cache=None) -> str:
+        """
+        Generate from already-tokenized prompt ids. With prefix_cache (from _prefill on a
+        prefix of ids), only the uncached suffix is prefilled; the cache is copied so one
+        prefix can branch into several continuations.
+        """
+        device = next(self.model.parameters()).device
+        input_ids = torch.tensor([ids], device=device)
+        kwargs = self._generate_kwargs(max_new_tokens, temperature)
+        if prefix_cache is not None:
+            kwargs["past_key_values"] = copy.deepcopy(prefix_cache)
+        with self.lock, torch.no_grad():
+            out = self.model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), **kwargs)
+        return self.tok.decode(out[0][len(ids):], skip_special_tokens=True).strip()
+
+    def _chat_batch(self, conversations: List[List[Dict[str, str]]], max_new_tokens: List[int], temperature: float = 0.0) -> List[str]:
+        """
+        Generate several independent conversations in one left-padded batch.
+        Each output is cut to its own budget; the batch runs to the largest one.
+        """
+        prompts = [self.tok.apply_chat_template(m, tokenize=False, add_generation_prompt=True) for m in conversations]
+        padding_side = self.tok.padding_side
+        self.tok.padding_side = "left"
+        try:
+            inputs = self.tok(prompts, return_tensors="pt", padding=True)
+        finally:
+            self.tok.padding_side = padding_side
+        device = next(self.model.parameters()).device
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        with self.lock, torch.no_grad():
+            out = self.model.generate(**inputs, **self._generate_kwargs(max(max_new_tokens), temperature))
+        prompt_len = inputs["input_ids"].shape[1]
+        return [
+            self.tok.decode(row[prompt_len:prompt_len + budget], skip_special_tokens=True).strip()
+            for row, budget in zip(out, max_new_tokens)
+        ]
+
     def _chat_stream(self, messages: List[Dict[str, str]], max_new_tokens: int = 600, temperature: float = 0.0):
         """
         Stream tokens as they're generated - true streaming like ChatGPT.
@@ -55,57 +149,160 @@ class BaseChatWrapper:
         device = next(self.model.parameters()).device
         inputs = {k: v.to(device) for k, v in inputs.items()}
         do_sample = temperature is not None and temperature > 0.0
-        
+
         input_length = inputs["input_ids"].shape[1]
         generated_tokens = []
-        
+
         print("🔄 Starting streaming generation...")
         import time
         start = time.time()
-        
+
         with torch.no_grad():
-            # Use generate with yield to stream tokens
+            # Prefill the prompt once, then feed one token per step against the KV cache
             # We'll manually decode as tokens come in
-            generated = inputs["input_ids"].clone()
-            
+            next_input = inputs["input_ids"]
+            past = None
+
             for _ in range(max_new_tokens):
-                outputs = self.model(generated, use_cache=True)
+                # lock per step: other requests' model calls can interleave between tokens
+                with self.lock:
+                    outputs = self.model(input_ids=next_input, past_key_values=past, use_cache=True)
+                past = outputs.past_key_values
                 logits = outputs.logits[:, -1, :]
-                
+
                 if do_sample:
                     import torch.nn.functional as F
                     probs = F.softmax(logits / temperature, dim=-1)
                     next_token = torch.multinomial(probs, num_samples=1)
                 else:
                     next_token = torch.argmax(logits, dim=-1).unsqueeze(-1)
-                
+
                 # Check for EOS
                 if next_token.item() == self.tok.eos_token_id:
                     break
-                
-                generated = torch.cat([generated, next_token], dim=-1)
+
+                next_input = next_token
                 generated_tokens.append(next_token.item())
-                
+
                 # Decode the new token and yield immediately (no delay for speed)
                 decoded = self.tok.decode([next_token.item()], skip_special_tokens=True)
                 yield decoded
-        
+
         gen_time = time.time() - start
         print(f"⚡ Streaming generation took {gen_time:.2f}s for {len(generated_tokens)} tokens")
 
-class SummaryGenerator(BaseChatWrapper):
+def _without_markers(text: str) -> str:
+    """Text with its [Page N] marker lines removed: the same pages at other page numbers compare equal."""
+    return _PAGE_MARKER.sub("", text)
+
+
+def _is_anchor(page: str) -> bool:
+    """Content-defined cut point, decided by the page body so renumbered pages keep their anchors."""
+    return zlib.crc32(_without_markers(page).encode("utf-8")) % 3 == 0
+
+
+class _PagePacker:
+    """
+    Incremental page packing for MapReduceGenerator._chunk_by_pages: pages are
+    added one at a time and each closed chunk is returned as soon as it closes,
+    so chunks can be mapped while later pages are still being extracted.
+    dropped_pages counts the pages left out once MAX_CHUNKS chunks are emitted.
+    """
+
+    def __init__(self, gen: "MapReduceGenerator", max_tokens: int, overlap: int):
+        self.gen = gen
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.emitted = 0
+        self.pages = 0
+        self.dropped_pages = 0
+        self.cur: List[str] = []
+        self.cur_tokens = 0
+
+    @property
+    def full(self) -> bool:
+        return self.emitted >= self.gen.MAX_CHUNKS
+
+    def _close(self) -> List[Tuple[str, int]]:
+        if not self.cur:
+            return []
+        chunk = ("\n\n".join(self.cur), len(self.cur))
+        self.cur, self.cur_tokens = [], 0
+        return [chunk]
+
+    def _emit(self, chunks: List[Tuple[str, int]]) -> List[str]:
+        """(chunk, pages starting in it) pairs -> the chunks that still fit under MAX_CHUNKS."""
+        keep = max(0, self.gen.MAX_CHUNKS - self.emitted)
+        self.dropped_pages += sum(pages for _, pages in chunks[keep:])
+        self.emitted += len(chunks[:keep])
+        return [chunk for chunk, _ in chunks[:keep]]
+
+    def add(self, page: str, ids: List[int]) -> List[str]:
+        """Add one page; returns the chunks it closed (possibly none)."""
+        self.pages += 1
+        if self.full:
+            self.dropped_pages += 1
+            return []
+        n = len(ids)
+        if n > self.max_tokens:
+            windows = self.gen._chunk_by_tokens(ids, self.max_tokens, self.overlap)
+            return self._emit(self._close() + [(w, 1 if i == 0 else 0) for i, w in enumerate(windows)])
+        out = []
+        if self.cur and self.cur_tokens + n > self.max_tokens:
+            out = self._close()
+        self.cur.append(page)
+        self.cur_tokens += n
+        if self.cur_tokens >= self.max_tokens * ANCHOR_MIN_FILL and _is_anchor(page):
+            out += self._close()
+        return self._emit(out)
+
+    def flush(self) -> List[str]:
+        """Close the last partial chunk."""
+        return self._emit(self._close())
+
+class MapReduceGenerator(BaseChatWrapper):
+    """
+    Shared tokenization, chunking and map-output caching for the map → reduce generators.
+
+    Map outputs are cached per (chunk content hash, task, budget, prompt version), so
+    re-generating an edited document only re-runs the map on chunks whose text changed.
+    The hash ignores [Page N] markers: pages that near-duplicate linking finds identical
+    to a stored document's (utils.near_duplicate) reuse its map outputs even when a
+    revision inserted or removed pages before them.
+    Bump PROMPT_VERSION whenever a map or reduce prompt changes: it is part of the map-cache
+    and result-cache keys.
+    """
     MAX_INPUT_TOKENS = 120_000
-    MAX_CHUNKS = 24
+    MAX_CHUNKS = 20
+    MAX_PER_CHUNK = 6  # items (questions, cards) asked of one map call
+    PROMPT_VERSION = 1
+    TASK = "map"
+    ESTIMATE_SAMPLE_PAGES = 8
+
+    def __init__(self, model_data: Dict[str, Any], map_cache=None, progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 stream_reduce: bool = False, passages: Optional[Callable[[str], Any]] = None):
+        super().__init__(model_data)
+        self.map_cache = map_cache
+        # async text -> (chunks, embeddings), e.g. VectorDB.embed_passages: enables passage selection (see _generate_selected)
+        self.passages = passages
+        self.map_cache_hits = 0
+        self.progress = progress
+        # with a progress callback: emit the reduce output token by token ("reduce_token" events)
+        self.stream_reduce = stream_reduce
+        self._maps_done = 0
+        self.stripped_tokens = 0  # boilerplate/reference tokens removed from the last planned document
+
+    def _report(self, event: str, **data: Any):
+        """Send a progress event ("plan", "chunk", "reduce") to the progress callback, if any."""
+        if self.progress is not None:
+            self.progress({"event": event, "task": self.TASK, **data})
 
     def _scan_input(self, text: str) -> Tuple[int, List[int]]:
         ids = self.tok.encode(text)
         return len(ids), ids
 
     def _choose_chunking(self, total_tokens: int) -> Tuple[int, int]:
-        if total_tokens <= 2_000:   return 1_000, 60
-        if total_tokens <= 8_000:   return 1_600, 100
-        if total_tokens <= 20_000:  return 1_900, 140
-        return 2_100, 160
+        raise NotImplementedError
 
     def _chunk_by_tokens(self, ids: List[int], max_tokens: int, overlap: int) -> List[str]:
         chunks, start, n = [], 0, len(ids)
@@ -114,9 +311,319 @@ class SummaryGenerator(BaseChatWrapper):
             chunks.append(self.tok.decode(ids[start:end]))
             if end == n: break
             start = max(0, end - overlap)
-            if len(chunks) >= self.MAX_CHUNKS: break
+            if len(chunks) >= self.MAX_CHUNKS:
+                print(f"⚠️  {self.TASK}: MAX_CHUNKS ({self.MAX_CHUNKS}) reached, last {n - end} tokens not mapped")
+                break
         return chunks
 
+    def _split_pages(self, content: str) -> List[str]:
+        """Split extracted text on its [Page N] markers (any preamble joins page 1)."""
+        starts = [m.start() for m in _PAGE_MARKER.finditer(content)]
+        if not starts:
+            return []
+        starts[0] = 0
+        bounds = starts + [len(content)]
+        return [content[a:b].strip() for a, b in zip(bounds, bounds[1:])]
+
+    def _chunk_by_pages(self, pages: List[str], page_ids: List[List[int]], max_tokens: int, overlap: int) -> List[str]:
+        """
+        Pack whole pages into chunks of at most max_tokens.
+
+        Cut points are content-defined: once a chunk is ANCHOR_MIN_FILL full it is
+        closed after any "anchor" page (chosen by a hash of the page text). An edit
+        to one page therefore only changes the chunk holding it; the following
+        chunks re-align at the next anchor instead of all shifting as fixed token
+        windows do. Unlike those windows, chunks do not overlap: each page is in
+        exactly one chunk, and overlap only applies between the windows of a page
+        too long for one chunk. Pages past MAX_CHUNKS are dropped and logged.
+        """
+        packer = _PagePacker(self, max_tokens, overlap)
+        chunks: List[str] = []
+        for page, ids in zip(pages, page_ids):
+            chunks.extend(packer.add(page, ids))
+        chunks.extend(packer.flush())
+        self._log_dropped(packer)
+        return chunks
+
+    def _log_dropped(self, packer: _PagePacker):
+        dropped, pages = packer.dropped_pages, packer.pages
+        if dropped:
+            print(f"⚠️  {self.TASK}: MAX_CHUNKS ({self.MAX_CHUNKS}) reached, last {dropped}/{pages} pages not mapped")
+
+    def _plan(self, content: str) -> Tuple[int, List[str]]:
+        """
+        Tokenize once and split into map chunks; returns (total_tokens, chunks).
+        Plans are kept per document and generator, so repeat requests on the same
+        text skip tokenization entirely. Headers/footers and the reference section
+        are stripped first (STRIP_BOILERPLATE); see stripped_tokens.
+        """
+        key = (type(self).__name__, hashlib.sha256(content.encode("utf-8")).hexdigest())
+        plan = _plan_cache.get(key)
+        if plan is None:
+            plan = self._plan_uncached(content)
+            _plan_cache[key] = plan
+            while len(_plan_cache) > PLAN_CACHE_ITEMS:
+                _plan_cache.popitem(last=False)
+        else:
+            _plan_cache.move_to_end(key)
+        total, chunks, self.stripped_tokens = plan
+        return total, list(chunks)
+
+    def _strip_pages(self, pages: List[str]) -> Tuple[List[str], int]:
+        """Remove boilerplate and references; returns (pages, tokens saved)."""
+        pages, removed, stats = strip_boilerplate(pages)
+        if not removed:
+            return pages, 0
+        saved = len(self.tok.encode("\n".join(removed)))
+        print(f"🧹 Stripped {stats['boilerplate_lines']} header/footer lines ({stats['boilerplate_patterns']} patterns) "
+              f"and {stats['reference_lines']} reference lines: ~{saved} tokens saved")
+        return pages, saved
+
+    def _plan_uncached(self, content: str) -> Tuple[int, List[str], int]:
+        pages = self._split_pages(content)
+        stripped = 0
+        if STRIP_BOILERPLATE and len(pages) >= 2:
+            pages, stripped = self._strip_pages(pages)
+        if len(pages) >= 2:
+            page_ids = [self.tok.encode(p) for p in pages]
+            total = sum(len(ids) for ids in page_ids)
+        else:
+            total, ids = self._scan_input(content)
+        if total > self.MAX_INPUT_TOKENS:
+            raise ValueError(f"Input too large ({total} tokens). Split the PDF (< {self.MAX_INPUT_TOKENS}).")
+        win, ov = self._choose_chunking(total)
+        if len(pages) >= 2:
+            return total, self._chunk_by_pages(pages, page_ids, win, ov), stripped
+        return total, self._chunk_by_tokens(ids, win, ov), stripped
+
+    async def _map_cached(self, chunk: str, budget: int, run: Callable[[], str], task: Optional[str] = None, **params: Any) -> str:
+        """Return the cached map output for this chunk/task/budget, else run() and cache it."""
+        if self.map_cache is None:
+            return await self._call(run)
+        key = make_key(
+            f"map:{task or self.TASK}",
+            chunk=hashlib.sha256(_without_markers(chunk).encode("utf-8")).hexdigest(),
+            budget=budget,
+            prompt_version=self.PROMPT_VERSION,
+            **params,
+        )
+        cached = await self.map_cache.get(key)
+        if cached is not None:
+            self.map_cache_hits += 1
+            return cached
+        out = await self._call(run)
+        await self.map_cache.set(key, out, ttl=MAP_CACHE_TTL)
+        return out
+
+    async def _reduce(self, messages: List[Dict[str, str]], max_new_tokens: int, temperature: float) -> str:
+        """Run the reduce; streamed through the progress callback when stream_reduce is on."""
+        if not (self.stream_reduce and self.progress is not None):
+            return await self._call(self._chat, messages, max_new_tokens=max_new_tokens, temperature=temperature)
+        text = ""
+        async for token in self._stream_tokens(messages, max_new_tokens=max_new_tokens, temperature=temperature):
+            text += token
+            self._report("reduce_token", token=token)
+        return text.strip()
+
+    # ---- per-task hooks for the map → reduce driver below ----
+
+    def _setup(self, total_tokens: int, num_chunks: int) -> Dict[str, Any]:
+        """Budgets/target counts for a document of this size (passed to the hooks below)."""
+        raise NotImplementedError
+
+    async def _map_chunk(self, chunk: str, setup: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def _reduce_call(self, mapped: List[str], setup: Dict[str, Any]) -> Tuple[List[Dict[str, str]], int, float]:
+        """(messages, max_new_tokens, temperature) for the reduce."""
+        raise NotImplementedError
+
+    def _result(self, final: str, title: str, setup: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def _map_step(self, i: int, chunk: str, setup: Dict[str, Any], num_chunks: int) -> str:
+        t0 = time.time()
+        print(f"🧩 {self.TASK} map chunk {i+1}/{num_chunks}...")
+        out = await self._map_chunk(chunk, setup)
+        self._maps_done += 1
+        print(f"✅ Map {i+1} in {time.time()-t0:.1f}s ({len(out)} chars)")
+        self._report("chunk", index=i, done=self._maps_done, total=num_chunks, output=out)
+        return out
+
+    async def _finish(self, mapped: List[str], title: str, setup: Dict[str, Any]) -> Dict[str, Any]:
+        setup["num_chunks"] = len(mapped)
+        if self.map_cache_hits:
+            print(f"♻️  Reused {self.map_cache_hits}/{len(mapped)} cached map outputs")
+        messages, max_new_tokens, temperature = self._reduce_call(mapped, setup)
+        print(f"🔄 Combining {len(mapped)} chunks (budget: {max_new_tokens} tokens)...")
+        self._report("reduce", total=len(mapped))
+        t0 = time.time()
+        final = await self._reduce(messages, max_new_tokens=max_new_tokens, temperature=temperature)
+        print(f"✅ Reduce complete in {time.time()-t0:.1f}s")
+        return self._result(final, title, setup)
+
+    def _setup_for(self, total_tokens: int, num_chunks: int, target_total: int = 0) -> Dict[str, Any]:
+        """_setup, with the requested number of items (questions, cards) when one is given."""
+        setup = self._setup(total_tokens, num_chunks)
+        if target_total:
+            setup["target_total"] = target_total
+        return setup
+
+    async def _generate(self, content: str, title: str, target_total: int = 0) -> Dict[str, Any]:
+        total, chunks = self._plan(content)
+        return await self._map_reduce(total, chunks, title, self._setup_for(total, len(chunks), target_total))
+
+    async def _map_reduce(self, total: int, chunks: List[str], title: str, setup: Dict[str, Any], **plan: Any) -> Dict[str, Any]:
+        self._report("plan", total_tokens=total, chunks=len(chunks), stripped_tokens=self.stripped_tokens, **plan)
+        self._maps_done = 0
+        mapped = [await self._map_step(i, c, setup, len(chunks)) for i, c in enumerate(chunks)]
+        return await self._finish(mapped, title, setup)
+
+    # ---- passage selection (quiz / flashcards) ----
+
+    async def _select(self, content: str, target_total: int, num_chunks: int) -> Optional[List[List[Chunk]]]:
+        """
+        Passages to map instead of every chunk: about SELECT_OVERSAMPLE per requested
+        item, picked by maximal marginal relevance over their embeddings (see
+        utils.chunk_selection) and grouped, in document order, into as few map
+        windows as MAX_PER_CHUNK items per call allows. None when that would not
+        save map calls or there are too few substantial passages.
+        """
+        wanted = math.ceil(target_total * SELECT_OVERSAMPLE)
+        windows = -(-wanted // self.MAX_PER_CHUNK)
+        if windows >= num_chunks:
+            return None
+        passages, embeddings = await self.passages(content)
+        eligible = [tokens >= SELECT_MIN_TOKENS for _, _, _, tokens in passages]
+        picked = mmr_select(embeddings, wanted, SELECT_DIVERSITY, eligible)
+        if len(picked) < wanted:
+            return None
+        return [[passages[i] for i in run] for run in group_in_order(picked, windows)]
+
+    @staticmethod
+    def _window(passages: List[Chunk]) -> str:
+        """Selected passages as one map chunk, with a [Page N] marker wherever the page changes."""
+        parts, page = [], None
+        for text, page_start, _, _ in passages:
+            if page_start and page_start != page:
+                parts.append(f"[Page {page_start}]")
+                page = page_start
+            parts.append(text.strip())
+        return "\n\n".join(parts)
+
+    async def _generate_selected(self, content: str, title: str, target_total: int = 0) -> Dict[str, Any]:
+        """
+        Map → reduce over selected passages (_select) sized to the requested number
+        of items (target_total, else the size-based default), so a long document
+        costs a few map calls instead of one per chunk. Short documents, where
+        selection would not save calls, are mapped in full.
+        """
+        total, chunks = self._plan(content)
+        setup = self._setup_for(total, len(chunks), target_total)
+        groups = await self._select(content, setup["target_total"], len(chunks))
+        if groups is None:
+            return await self._map_reduce(total, chunks, title, setup)
+        selected = sum(len(g) for g in groups)
+        setup["per_chunk"] = -(-selected // len(groups))
+        print(f"🎯 Mapping {selected} selected passages in {len(groups)} calls instead of {len(chunks)} chunks")
+        return await self._map_reduce(total, [self._window(g) for g in groups], title, setup, selected_passages=selected)
+
+    async def generate_pages(self, pages: AsyncIterator[str], title: str, page_count: int,
+                             target_total: int = 0) -> Dict[str, Any]:
+        """
+        Map → reduce over pages as they are extracted (DocumentProcessor.iter_pages),
+        for target_total items (questions, cards) when given, else the size-based default.
+
+        Pages are tokenized on arrival and each chunk's map is scheduled as soon as
+        the chunk closes, so the model works on the first chunks while later pages
+        are still being extracted. The total size is only known at the end, so the
+        window and budgets are sized from an estimate (sampled pages × page_count).
+        """
+        t0 = time.time()
+        packer: Optional[_PagePacker] = None
+        setup: Dict[str, Any] = {}
+        est_chunks = 0
+        total = 0
+        tasks: List[asyncio.Future] = []
+        self._maps_done = 0
+
+        def schedule(chunks: List[str]):
+            for chunk in chunks:
+                if not tasks:
+                    print(f"⏱️  First chunk ready after {time.time()-t0:.1f}s")
+                tasks.append(asyncio.ensure_future(self._map_step(len(tasks), chunk, setup, est_chunks)))
+
+        def encode(page: str) -> Tuple[str, List[int]]:
+            nonlocal total
+            if detector is not None:
+                page, removed = detector.clean_page(page)
+                if removed:
+                    self.stripped_tokens += len(self.tok.encode("\n".join(removed)))
+            ids = self.tok.encode(page)
+            total += len(ids)
+            if total > self.MAX_INPUT_TOKENS:
+                raise ValueError(f"Input too large (> {self.MAX_INPUT_TOKENS} tokens). Split the PDF.")
+            return page, ids
+
+        def start(page_count: int) -> _PagePacker:
+            nonlocal est_chunks, detector
+            # headers/footers are learned from the sample; the reference section needs
+            # the whole document, so only the non-streaming path strips it
+            if STRIP_BOILERPLATE:
+                detector = BoilerplateDetector().fit(sample)
+            encoded = [encode(page) for page in sample]
+            estimate = total * page_count // len(sample)
+            win, ov = self._choose_chunking(estimate)
+            est_chunks = min(self.MAX_CHUNKS, max(1, -(-estimate // win)))
+            setup.update(self._setup_for(estimate, est_chunks, target_total))
+            self._report("plan", total_tokens=estimate, chunks=est_chunks)
+            packer = _PagePacker(self, win, ov)
+            for page, ids in encoded:
+                schedule(packer.add(page, ids))
+            return packer
+
+        # the first few pages are sampled to estimate the document size before packing starts
+        sample: List[str] = []
+        sample_size = min(self.ESTIMATE_SAMPLE_PAGES, max(1, page_count))
+        detector: Optional[BoilerplateDetector] = None
+        self.stripped_tokens = 0
+        try:
+            async for item in pages:
+                for page in self._split_pages(item) or [item]:
+                    if packer is not None:
+                        schedule(packer.add(*encode(page)))
+                        continue
+                    sample.append(page)
+                    if len(sample) >= sample_size:
+                        packer = start(max(page_count, len(sample)))
+            if packer is None:
+                if not sample:
+                    raise ValueError("No text could be extracted from the document")
+                packer = start(len(sample))
+            schedule(packer.flush())
+            self._log_dropped(packer)
+            mapped = list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        if self.stripped_tokens:
+            print(f"🧹 Stripped ~{self.stripped_tokens} header/footer tokens")
+        print(f"📄 {total} tokens in {len(mapped)} chunks (estimated {est_chunks}), maps done after {time.time()-t0:.1f}s")
+        return await self._finish(mapped, title, setup)
+
+class SummaryGenerator(MapReduceGenerator):
+    MAX_INPUT_TOKENS = 120_000
+    MAX_CHUNKS = 24
+    TASK = "summary"
+    SYS_MAP = "Summarize accurately. Bullet points only. No hallucinations. No paragraphs."
+
+    def _choose_chunking(self, total_tokens: int) -> Tuple[int, int]:
+        if total_tokens <= 2_000:   return 1_000, 60
+        if total_tokens <= 8_000:   return 1_600, 100
+        if total_tokens <= 20_000:  return 1_900, 140
+        return 2_100, 160
+
     def _gen_budgets(self, num_chunks: int) -> Tuple[int, int]:
         # Reduced token budgets for faster generation
         if num_chunks <= 4:   return 120, 700
@@ -124,32 +631,14 @@ class SummaryGenerator(BaseChatWrapper):
         if num_chunks <= 16:  return 80, 500
         return 60, 400
 
-    async def generate(self, content: str, title: str, max_length: int = 0) -> Dict[str, Any]:
-        total, ids = self._scan_input(content)
-        if total > self.MAX_INPUT_TOKENS:
-            raise ValueError(f"Input too large ({total} tokens). Split the PDF (< {self.MAX_INPUT_TOKENS}).")
+    def _map_instruction(self) -> str:
+        return "Summarize into crisp bullet points. Keep definitions and mechanisms."
 
-        win, ov = self._choose_chunking(total)
-        chunks = self._chunk_by_tokens(ids, win, ov)
-        num_chunks = len(chunks)
-        map_nt, reduce_nt = self._gen_budgets(num_chunks)
-
-        import time
-        sys_map = "Summarize accurately. Bullet points only. No hallucinations. No paragraphs."
-        chunk_summaries: List[str] = []
-        for i, c in enumerate(chunks):
-            start_time = time.time()
-            print(f"🔹 Processing chunk {i+1}/{len(chunks)} (budget: {map_nt} tokens)...")
-            s = self._chat(
-                [{"role": "system", "content": sys_map},
-                 {"role": "user", "content": f"Summarize into crisp bullet points. Keep definitions and mechanisms.\n\n{c}"}],
-                max_new_tokens=map_nt,
-                temperature=0.0
-            )
-            elapsed = time.time() - start_time
-            print(f"✅ Chunk {i+1} done in {elapsed:.1f}s ({len(s)} chars)")
-            chunk_summaries.append(s)
+    def _map_messages(self, chunk: str) -> List[Dict[str, str]]:
+        return [{"role": "system", "content": self.SYS_MAP},
+                {"role": "user", "content": f"{self._map_instruction()}\n\n{chunk}"}]
 
+    def _reduce_messages(self, chunk_summaries: List[str]) -> List[Dict[str, str]]:
         joined = "\n\n-----\n\n".join(chunk_summaries)
         reduce_prompt = (
             "Convert the combined notes into structured study notes.\n\n"
@@ -164,16 +653,10 @@ class SummaryGenerator(BaseChatWrapper):
             "### Cause → Effect (if applicable)\n\n"
             f"{joined}"
         )
-        print(f"🔄 Combining {num_chunks} chunks (budget: {reduce_nt} tokens)...")
-        start_reduce = time.time()
-        final = self._chat(
-            [{"role": "system", "content": "You produce exam-ready structured notes."},
-             {"role": "user", "content": reduce_prompt}],
-            max_new_tokens=reduce_nt,
-            temperature=0.0
-        )
-        reduce_time = time.time() - start_reduce
-        print(f"✅ Reduce complete in {reduce_time:.1f}s")
+        return [{"role": "system", "content": "You produce exam-ready structured notes."},
+                {"role": "user", "content": reduce_prompt}]
+
+    def _finalize(self, final: str, title: str, map_nt: int, reduce_nt: int, num_chunks: int) -> Dict[str, Any]:
         return {
             "content": final.strip(),
             "title": title,
@@ -181,13 +664,34 @@ class SummaryGenerator(BaseChatWrapper):
             "timestamp": datetime.utcnow().isoformat(),
         }
 
-class QuizGenerator(BaseChatWrapper):
+    def _setup(self, total_tokens: int, num_chunks: int) -> Dict[str, Any]:
+        map_nt, reduce_nt = self._gen_budgets(num_chunks)
+        return {"map_nt": map_nt, "reduce_nt": reduce_nt}
+
+    async def _map_chunk(self, chunk: str, setup: Dict[str, Any]) -> str:
+        return await self._map_cached(chunk, setup["map_nt"], lambda: self._chat(
+            self._map_messages(chunk),
+            max_new_tokens=setup["map_nt"],
+            temperature=0.0
+        ))
+
+    def _reduce_call(self, mapped: List[str], setup: Dict[str, Any]) -> Tuple[List[Dict[str, str]], int, float]:
+        return self._reduce_messages(mapped), setup["reduce_nt"], 0.0
+
+    def _result(self, final: str, title: str, setup: Dict[str, Any]) -> Dict[str, Any]:
+        return self._finalize(final, title, setup["map_nt"], setup["reduce_nt"], setup["num_chunks"])
+
+    async def generate(self, content: str, title: str, max_length: int = 0) -> Dict[str, Any]:
+        return await self._generate(content, title)
+
+class QuizGenerator(MapReduceGenerator):
     MAX_INPUT_TOKENS = 120_000
     MAX_CHUNKS = 20
-
-    def _scan_input(self, text: str) -> Tuple[int, List[int]]:
-        ids = self.tok.encode(text)
-        return len(ids), ids
+    TASK = "quiz"
+    MAX_PER_CHUNK = 6
+    SYS_MAP = "Generate high-quality MCQs for exams. Strong distractors."
+    MAP_TOKENS, MAP_TEMPERATURE = 180, 0.25
+    REDUCE_TOKENS, REDUCE_TEMPERATURE = 600, 0.2
 
     def _choose_chunking(self, total_tokens: int) -> Tuple[int, int]:
         # Slightly bigger windows than summary because we want more context per chunk
@@ -196,44 +700,14 @@ class QuizGenerator(BaseChatWrapper):
         if total_tokens <= 20_000:  return 2_200, 150
         return 2_400, 180
 
-    def _chunk_by_tokens(self, ids: List[int], max_tokens: int, overlap: int) -> List[str]:
-        chunks, start, n = [], 0, len(ids)
-        while start < n:
-            end = min(start + max_tokens, n)
-            chunks.append(self.tok.decode(ids[start:end]))
-            if end == n: break
-            start = max(0, end - overlap)
-            if len(chunks) >= self.MAX_CHUNKS: break
-        return chunks
-
     def _target_counts(self, total_tokens: int, num_chunks: int) -> Tuple[int, int]:
         # Aim for 12–30 questions based on document size
         baseline = max(12, min(30, total_tokens // 2500 + 10))
-        per_chunk = max(3, min(6, baseline // max(1, num_chunks)))
+        per_chunk = max(3, min(self.MAX_PER_CHUNK, baseline // max(1, num_chunks)))
         return baseline, per_chunk
 
-    async def generate(self, content: str, title: str, num_questions: int = 0):
-        total, ids = self._scan_input(content)
-        if total > self.MAX_INPUT_TOKENS:
-            raise ValueError(f"Input too large ({total} tokens). Split the PDF (< {self.MAX_INPUT_TOKENS}).")
-
-        win, ov = self._choose_chunking(total)
-        chunks = self._chunk_by_tokens(ids, win, ov)
-        num_chunks = len(chunks)
-        target_total, per_chunk = self._target_counts(total, num_chunks)
-
-        # Map: fast small generations per chunk
-        sys_map = (
-            "Generate high-quality MCQs for exams. Strong distractors."
-        )
-        mapped: List[str] = []
-        for i, c in enumerate(chunks):
-            t0 = time.time()
-            print(f"🧩 MCQ map chunk {i+1}/{num_chunks}: {per_chunk} Qs, budget 180 tokens")
-            out = self._chat(
-                [
-                    {"role": "system", "content": sys_map},
-                    {"role": "user", "content": f"""
+    def _map_instruction(self, per_chunk: int) -> str:
+        return f"""
 Write {per_chunk} MCQs from the text. Follow strictly:
 - One sentence per question
 - 4 options A–D, only one correct
@@ -247,17 +721,18 @@ B) Option
 C) Option
 D) Option
 Correct: <Letter>
+"""
 
+    def _map_messages(self, chunk: str, per_chunk: int) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.SYS_MAP},
+            {"role": "user", "content": f"""{self._map_instruction(per_chunk)}
 TEXT:
-{c}
+{chunk}
 """}
-                ],
-                max_new_tokens=180,
-                temperature=0.25,
-            )
-            print(f"✅ Map {i+1} in {time.time()-t0:.1f}s ({len(out)} chars)")
-            mapped.append(out)
+        ]
 
+    def _reduce_messages(self, mapped: List[str], target_total: int) -> List[Dict[str, str]]:
         joined = "\n\n-----\n\n".join(mapped)
 
         # Reduce: consolidate and trim to target_total
@@ -271,29 +746,49 @@ Rules:
 MCQs:
 {joined}
 """
-        print(f"🧮 Reducing to {target_total} questions (budget 600 tokens)...")
-        final = self._chat(
-            [
-                {"role": "system", "content": "You are a meticulous exam MCQ editor. Output strictly the MCQ list only."},
-                {"role": "user", "content": reduce_prompt},
-            ],
-            max_new_tokens=600,
-            temperature=0.2,
-        )
+        return [
+            {"role": "system", "content": "You are a meticulous exam MCQ editor. Output strictly the MCQ list only."},
+            {"role": "user", "content": reduce_prompt},
+        ]
 
+    def _finalize(self, final: str, title: str, target_total: int) -> Dict[str, Any]:
         return {
             "questions": final.strip(),
             "title": title,
             "num_questions": target_total,
         }
 
-class FlashcardGenerator(BaseChatWrapper):
+    def _setup(self, total_tokens: int, num_chunks: int) -> Dict[str, Any]:
+        target_total, per_chunk = self._target_counts(total_tokens, num_chunks)
+        return {"target_total": target_total, "per_chunk": per_chunk}
+
+    async def _map_chunk(self, chunk: str, setup: Dict[str, Any]) -> str:
+        per_chunk = setup["per_chunk"]
+        return await self._map_cached(chunk, self.MAP_TOKENS, lambda: self._chat(
+            self._map_messages(chunk, per_chunk),
+            max_new_tokens=self.MAP_TOKENS,
+            temperature=self.MAP_TEMPERATURE,
+        ), per_chunk=per_chunk)
+
+    def _reduce_call(self, mapped: List[str], setup: Dict[str, Any]) -> Tuple[List[Dict[str, str]], int, float]:
+        return self._reduce_messages(mapped, setup["target_total"]), self.REDUCE_TOKENS, self.REDUCE_TEMPERATURE
+
+    def _result(self, final: str, title: str, setup: Dict[str, Any]) -> Dict[str, Any]:
+        return self._finalize(final, title, setup["target_total"])
+
+    async def generate(self, content: str, title: str, num_questions: int = 0):
+        if self.passages is not None:
+            return await self._generate_selected(content, title, num_questions)
+        return await self._generate(content, title, num_questions)
+
+class FlashcardGenerator(MapReduceGenerator):
     MAX_INPUT_TOKENS = 120_000
     MAX_CHUNKS = 20
-
-    def _scan_input(self, text: str) -> Tuple[int, List[int]]:
-        ids = self.tok.encode(text)
-        return len(ids), ids
+    TASK = "flashcards"
+    MAX_PER_CHUNK = 7
+    SYS_MAP = "Generate concise flashcards for memory recall. Deterministic."
+    MAP_TOKENS, MAP_TEMPERATURE = 200, 0.0
+    REDUCE_TOKENS, REDUCE_TEMPERATURE = 700, 0.0
 
     def _choose_chunking(self, total_tokens: int) -> Tuple[int, int]:
         if total_tokens <= 2_000:   return 1_400, 80
@@ -301,56 +796,29 @@ class FlashcardGenerator(BaseChatWrapper):
         if total_tokens <= 20_000:  return 2_200, 150
         return 2_400, 180
 
-    def _chunk_by_tokens(self, ids: List[int], max_tokens: int, overlap: int) -> List[str]:
-        chunks, start, n = [], 0, len(ids)
-        while start < n:
-            end = min(start + max_tokens, n)
-            chunks.append(self.tok.decode(ids[start:end]))
-            if end == n: break
-            start = max(0, end - overlap)
-            if len(chunks) >= self.MAX_CHUNKS: break
-        return chunks
-
     def _target_counts(self, total_tokens: int, num_chunks: int) -> Tuple[int, int]:
         # Aim for 15–35 flashcards based on document size
         baseline = max(15, min(35, total_tokens // 2000 + 15))
-        per_chunk = max(4, min(7, baseline // max(1, num_chunks)))
+        per_chunk = max(4, min(self.MAX_PER_CHUNK, baseline // max(1, num_chunks)))
         return baseline, per_chunk
 
-    async def generate(self, content: str, title: str, num_cards: int = 0):
-        total, ids = self._scan_input(content)
-        if total > self.MAX_INPUT_TOKENS:
-            raise ValueError(f"Input too large ({total} tokens). Split the PDF (< {self.MAX_INPUT_TOKENS}).")
-
-        win, ov = self._choose_chunking(total)
-        chunks = self._chunk_by_tokens(ids, win, ov)
-        num_chunks = len(chunks)
-        target_total, per_chunk = self._target_counts(total, num_chunks)
-
-        # Map: fast small generations per chunk
-        sys_map = "Generate concise flashcards for memory recall. Deterministic."
-        mapped: List[str] = []
-        for i, c in enumerate(chunks):
-            t0 = time.time()
-            print(f"🧩 Flashcard map chunk {i+1}/{num_chunks}: {per_chunk} cards, budget 200 tokens")
-            out = self._chat(
-                [
-                    {"role": "system", "content": sys_map},
-                    {"role": "user", "content": f"""
+    def _map_instruction(self, per_chunk: int) -> str:
+        return f"""
 Generate {per_chunk} flashcards. Format (repeat for each):
 Term: X
 Definition: Y
+"""
 
+    def _map_messages(self, chunk: str, per_chunk: int) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.SYS_MAP},
+            {"role": "user", "content": f"""{self._map_instruction(per_chunk)}
 TEXT:
-{c}
+{chunk}
 """}
-                ],
-                max_new_tokens=200,
-                temperature=0.0,
-            )
-            print(f"✅ Map {i+1} in {time.time()-t0:.1f}s ({len(out)} chars)")
-            mapped.append(out)
+        ]
 
+    def _reduce_messages(self, mapped: List[str], target_total: int) -> List[Dict[str, str]]:
         joined = "\n\n-----\n\n".join(mapped)
 
         # Reduce: consolidate and trim to target_total
@@ -364,16 +832,12 @@ Rules:
 Flashcards:
 {joined}
 """
-        print(f"🧮 Reducing to {target_total} flashcards (budget 700 tokens)...")
-        final = self._chat(
-            [
-                {"role": "system", "content": "You are a meticulous flashcard editor. Output strictly the flashcard list only."},
-                {"role": "user", "content": reduce_prompt},
-            ],
-            max_new_tokens=700,
-            temperature=0.0,
-        )
+        return [
+            {"role": "system", "content": "You are a meticulous flashcard editor. Output strictly the flashcard list only."},
+            {"role": "user", "content": reduce_prompt},
+        ]
 
+    def _finalize(self, final: str, title: str) -> Dict[str, Any]:
         # Parse the final output into cards
         cards: List[Dict[str, str]] = []
         for block in final.split("Term:")[1:]:
@@ -385,11 +849,164 @@ Flashcards:
 
         return {"flashcards": cards, "raw": final.strip(), "title": title, "num_cards": len(cards)}
 
+    def _setup(self, total_tokens: int, num_chunks: int) -> Dict[str, Any]:
+        target_total, per_chunk = self._target_counts(total_tokens, num_chunks)
+        return {"target_total": target_total, "per_chunk": per_chunk}
+
+    async def _map_chunk(self, chunk: str, setup: Dict[str, Any]) -> str:
+        per_chunk = setup["per_chunk"]
+        return await self._map_cached(chunk, self.MAP_TOKENS, lambda: self._chat(
+            self._map_messages(chunk, per_chunk),
+            max_new_tokens=self.MAP_TOKENS,
+            temperature=self.MAP_TEMPERATURE,
+        ), per_chunk=per_chunk)
+
+    def _reduce_call(self, mapped: List[str], setup: Dict[str, Any]) -> Tuple[List[Dict[str, str]], int, float]:
+        return self._reduce_messages(mapped, setup["target_total"]), self.REDUCE_TOKENS, self.REDUCE_TEMPERATURE
+
+    def _result(self, final: str, title: str, setup: Dict[str, Any]) -> Dict[str, Any]:
+        return self._finalize(final, title)
+
+    async def generate(self, content: str, title: str, num_cards: int = 0):
+        if self.passages is not None:
+            return await self._generate_selected(content, title, num_cards)
+        return await self._generate(content, title, num_cards)
+
+def _common_prefix_len(seqs: List[List[int]]) -> int:
+    n = min(len(s) for s in seqs)
+    for i in range(n):
+        tok = seqs[0][i]
+        if any(s[i] != tok for s in seqs[1:]):
+            return i
+    return n
+
+class StudyPackGenerator(MapReduceGenerator):
+    """
+    Summary, quiz and flashcards from ONE map pass.
+
+    The document is tokenized and chunked once (summary windows). Each chunk is
+    prefilled once behind a shared system/TEXT prefix; the three task prompts only
+    differ in the trailing instruction, so each map output branches from a copy of
+    the chunk's KV cache and prefills just its instruction. The three reduces then
+    run together in one batch (greedy decoding for all three).
+    """
+    SYS_SHARED = "You are a study assistant. Work only from the given text. No hallucinations. Follow the task format exactly."
+    TASK = "study_pack"
+
+    def __init__(self, model_data: Dict[str, Any], map_cache=None, progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        super().__init__(model_data, map_cache, progress)
+        self.summary = SummaryGenerator(model_data)
+        self.quiz = QuizGenerator(model_data)
+        self.flash = FlashcardGenerator(model_data)
+
+    def _branch_messages(self, chunk: str, instruction: str) -> List[Dict[str, str]]:
+        return [{"role": "system", "content": self.SYS_SHARED},
+                {"role": "user", "content": f"TEXT:\n{chunk}\n\nTASK:\n{instruction.strip()}"}]
+
+    async def generate(self, content: str, title: str, num_questions: int = 0, num_cards: int = 0) -> Dict[str, Any]:
+        total, chunks = self.summary._plan(content)
+        num_chunks = len(chunks)
+        map_nt, reduce_nt = self.summary._gen_budgets(num_chunks)
+        q_total, q_per = self.quiz._target_counts(total, num_chunks)
+        f_total, f_per = self.flash._target_counts(total, num_chunks)
+        # requested counts size the reduces, as in QuizGenerator/FlashcardGenerator.generate
+        q_total, f_total = num_questions or q_total, num_cards or f_total
+
+        branches = [
+            ("summary", self.summary._map_instruction(), map_nt, 0.0),
+            ("quiz", self.quiz._map_instruction(q_per), self.quiz.MAP_TOKENS, self.quiz.MAP_TEMPERATURE),
+            ("flashcards", self.flash._map_instruction(f_per), self.flash.MAP_TOKENS, self.flash.MAP_TEMPERATURE),
+        ]
+        mapped: Dict[str, List[str]] = {name: [] for name, *_ in branches}
+        self._report("plan", total_tokens=total, chunks=num_chunks, stripped_tokens=self.summary.stripped_tokens)
+        prefilled = 0
+        t_start = time.time()
+        for i, c in enumerate(chunks):
+            t0 = time.time()
+            ids = [self._encode_chat(self._branch_messages(c, instr)) for _, instr, _, _ in branches]
+            # keep at least one uncached token per branch so generate() has logits to start from
+            prefix_len = min(_common_prefix_len(ids), min(len(x) for x in ids) - 1)
+            state: Dict[str, Any] = {}
+
+            def branch(branch_ids: List[int], budget: int, temp: float) -> str:
+                # prefill lazily: a chunk whose three map outputs are all cached costs nothing
+                if "cache" not in state:
+                    state["cache"] = self._prefill(branch_ids[:prefix_len])
+                return self._chat_ids(branch_ids, budget, temp, prefix_cache=state["cache"])
+
+            for (name, instr, budget, temp), branch_ids in zip(branches, ids):
+                mapped[name].append(await self._map_cached(
+                    c, budget, lambda b=branch_ids, n=budget, t=temp: branch(b, n, t),
+                    task=f"study_pack:{name}", instruction=instr,
+                ))
+            if "cache" in state:
+                prefilled += prefix_len
+            state.clear()
+            print(f"✅ Study-pack chunk {i+1}/{num_chunks} in {time.time()-t0:.1f}s (shared prefix {prefix_len} tokens)")
+            self._report("chunk", index=i, done=i + 1, total=num_chunks,
+                         output={name: outs[-1] for name, outs in mapped.items()})
+
+        print(f"🧮 Batched reduce: summary/quiz/flashcards (budgets {reduce_nt}/{self.quiz.REDUCE_TOKENS}/{self.flash.REDUCE_TOKENS})")
+        self._report("reduce", total=num_chunks)
+        t0 = time.time()
+        final_summary, final_quiz, final_cards = await self._call(
+            self._chat_batch,
+            [
+                self.summary._reduce_messages(mapped["summary"]),
+                self.quiz._reduce_messages(mapped["quiz"], q_total),
+                self.flash._reduce_messages(mapped["flashcards"], f_total),
+            ],
+            [reduce_nt, self.quiz.REDUCE_TOKENS, self.flash.REDUCE_TOKENS],
+            temperature=0.0,
+        )
+        print(f"✅ Study pack done in {time.time()-t_start:.1f}s (reduce {time.time()-t0:.1f}s, {prefilled} shared prefill tokens)")
+
+        return {
+            "summary": self.summary._finalize(final_summary, title, map_nt, reduce_nt, num_chunks),
+            "quiz": self.quiz._finalize(final_quiz, title, q_total),
+            "flashcards": self.flash._finalize(final_cards, title),
+            "title": title,
+            "chunks": num_chunks,
+        }
 
 class ChatGenerator(BaseChatWrapper):
     """Chat interface using Qwen model for conversational interactions."""
+
+    def _ground(self, message: str, context: Optional[List[Dict[str, Any]]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        User turn for an answer grounded in retrieved chunks (VectorDB.search
+        results, best first): the excerpts are numbered for citation and packed
+        until RAG_CONTEXT_TOKENS, so the prompt stays the same size however long
+        the documents are. Returns the turn and the cited sources.
+        """
+        if not context:
+            return message, []
+        blocks, sources, used = [], [], 0
+        for hit in context:
+            meta = hit.get("metadata") or {}
+            start, end = meta.get("page_start"), meta.get("page_end")
+            if not start:  # no "[Page N]" markers in the document
+                where = f"chunk {meta.get('chunk_index', 0)}"
+            else:
+                where = f"p. {start}" if start == end else f"pp. {start}-{end}"
+            block = f"[{len(blocks) + 1}] ({where}) {hit['text'].strip()}"
+            tokens = len(self.tok(block, add_special_tokens=False)["input_ids"])
+            if used + tokens > RAG_CONTEXT_TOKENS:
+                continue  # a shorter, lower-ranked excerpt may still fit
+            used += tokens
+            blocks.append(block)
+            sources.append({"ref": len(blocks), "document_id": meta.get("document_id"), "chunk_index": meta.get("chunk_index"),
+                            "page_start": start, "page_end": end, "score": hit.get("score")})
+        if not blocks:
+            return message, []
+        print(f"📎 Grounding chat in {len(blocks)}/{len(context)} excerpts ({used} tokens)")
+        prompt = ("Answer the question using these excerpts from the student's documents. Cite the excerpts you use "
+                  "as [1], [2], ... If they do not contain the answer, say so.\n\n"
+                  + "\n\n".join(blocks) + f"\n\nQuestion: {message}")
+        return prompt, sources
     
-    async def generate(self, message: str, history: Optional[List[Dict[str, str]]] = None, max_tokens: int = 1000, temperature: float = 0.5, include_thinking: bool = True) -> Dict[str, Any]:
+    async def generate(self, message: str, history: Optional[List[Dict[str, str]]] = None, max_tokens: int = 1000, temperature: float = 0.5, include_thinking: bool = True,
+                       context: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
         """
         Generate a chat response with optional thinking/reasoning step.
         
@@ -399,9 +1016,10 @@ class ChatGenerator(BaseChatWrapper):
             max_tokens: Maximum tokens to generate (default: 1000 for complete responses)
             temperature: Sampling temperature (0.0 = deterministic, 1.0 = creative) (default: 0.5 for balanced speed/quality)
             include_thinking: Whether to generate a thinking/reasoning step (default: True)
+            context: Retrieved chunks to ground the answer in (see _ground)
         
         Returns:
-            Dict with 'message', 'thinking' (optional), and 'model' fields
+            Dict with 'message', 'thinking' (optional), 'sources' (with context) and 'model' fields
         """
         try:
             import time
@@ -435,7 +1053,8 @@ class ChatGenerator(BaseChatWrapper):
                     "content": f"Think step by step about how to answer this question: {message}\n\nProvide your reasoning as if you're planning your response. Use bullet points to break down your thought process."
                 }]
                 
-                thinking = self._chat(
+                thinking = await self._call(
+                    self._chat,
                     thinking_messages,
                     max_new_tokens=300,
                     temperature=0.7
@@ -443,15 +1062,17 @@ class ChatGenerator(BaseChatWrapper):
                 print(f"🧠 Thinking generated: {len(thinking)} chars")
             
             # Generate actual response
+            prompt, sources = self._ground(message, context)
             response_messages = messages + [{
                 "role": "user",
-                "content": message
+                "content": prompt
             }]
             
             print(f"💬 Chat request - message: {message[:50]}..., history: {len(history) if history else 0} messages, max_tokens: {max_tokens}")
             
             # Generate response with optimized parameters
-            response = self._chat(
+            response = await self._call(
+                self._chat,
                 response_messages,
                 max_new_tokens=max_tokens,
                 temperature=temperature
@@ -468,6 +1089,8 @@ class ChatGenerator(BaseChatWrapper):
             
             if thinking:
                 result["thinking"] = thinking
+            if context is not None:
+                result["sources"] = sources
             
             return result
             
@@ -475,10 +1098,12 @@ class ChatGenerator(BaseChatWrapper):
             print(f"❌ Chat generation error: {e}")
             raise
 
-    def generate_stream(self, message: str, history: Optional[List[Dict[str, str]]] = None, max_tokens: int = 1000, temperature: float = 0.5, include_thinking: bool = True):
+    def generate_stream(self, message: str, history: Optional[List[Dict[str, str]]] = None, max_tokens: int = 1000, temperature: float = 0.5, include_thinking: bool = True,
+                        context: Optional[List[Dict[str, Any]]] = None):
         """
         Stream chat response token by token - true streaming like ChatGPT.
-        Yields: "thinking" or "message" type with token chunks.
+        Yields: "thinking" or "message" type with token chunks; with context, a
+        "sources" event listing the cited excerpts precedes the message.
         """
         try:
             # Build conversation messages
@@ -516,11 +1141,14 @@ class ChatGenerator(BaseChatWrapper):
                 yield {"type": "thinking_complete", "text": thinking_text}
             
             # Generate actual response
+            prompt, sources = self._ground(message, context)
             response_messages = messages + [{
                 "role": "user",
-                "content": message
+                "content": prompt
             }]
             
+            if context is not None:
+                yield {"type": "sources", "sources": sources}
             yield {"type": "message_start"}
             response_text = ""
             for token in self._chat_stream(response_messages, max_new_tokens=max_tokens, temperature=temperature):
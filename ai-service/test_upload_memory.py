@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Verify that upload handling keeps peak memory bounded regardless of file size.
+
+Generates a large PDF (a few text pages plus a big incompressible attachment),
+then processes it through DocumentProcessor.process_file in a fresh
+interpreter and checks that peak RSS grew by far less than the file size.
+Extraction normally runs in the spawned process pool, where the parent's
+getrusage cannot see it, so the test runs the pool jobs in-process instead.
+
+Usage:
+    python -m pytest test_upload_memory.py    (or: python test_upload_memory.py)
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PDF_MB = int(os.getenv("TEST_UPLOAD_PDF_MB", "200"))
+
+MAKE_PDF = textwrap.dedent("""
+    import os, sys, fitz
+    doc = fitz.open()
+    for p in range(10):
+        doc.new_page().insert_text((50, 60), f"Page {p+1}: memory bounded upload test", fontsize=11)
+    doc.embfile_add("blob.bin", os.urandom(int(sys.argv[2]) * 1024 * 1024))
+    doc.save(sys.argv[1])
+""")
+
+PROCESS_UPLOAD = textwrap.dedent("""
+    import asyncio, resource, sys
+    sys.path.insert(0, sys.argv[2])
+    import fitz  # noqa: F401  (imported before the baseline so its own footprint is not counted)
+    from fastapi import UploadFile
+    from utils.data_processor import DocumentProcessor
+
+    async def in_process(fn, *args):
+        return fn(*args)
+
+    async def main():
+        processor = DocumentProcessor(max_workers=1, max_upload_bytes=1024 ** 3)
+        processor._in_pool = in_process  # extraction in this process, so RUSAGE_SELF measures it
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        with open(sys.argv[1], "rb") as f:
+            text = await processor.process_file(UploadFile(file=f, filename="big.pdf"))
+        after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        processor.shutdown()
+        assert "[Page 10]" in text, text[:200]
+        print((after - before) * 1024)  # ru_maxrss is KiB on Linux
+
+    asyncio.run(main())
+""")
+
+
+def test_large_pdf_upload_peak_rss_is_bounded(tmp_path):
+    """Peak RSS growth while processing must stay well below the upload size."""
+    pytest.importorskip("fitz")
+    pdf_path = str(tmp_path / "big.pdf")
+    subprocess.run([sys.executable, "-c", MAKE_PDF, pdf_path, str(PDF_MB)], check=True)
+    size = os.path.getsize(pdf_path)
+
+    env = {**os.environ, "EXTRACT_CACHE_PATH": str(tmp_path / "extracted.sqlite3")}
+    out = subprocess.run(
+        [sys.executable, "-c", PROCESS_UPLOAD, pdf_path, HERE],
+        check=True, capture_output=True, text=True, env=env,
+    )
+    growth = int(out.stdout.strip().splitlines()[-1])
+    print(f"Upload size: {size / 1e6:.1f} MB | peak RSS growth: {growth / 1e6:.1f} MB")
+    assert growth < size / 4, f"peak RSS grew by {growth} bytes for a {size} byte upload"
+
+
+def test_upload_over_cap_is_rejected(tmp_path):
+    """Uploads over the cap fail with UploadTooLarge before being fully read."""
+    import asyncio
+    import io
+
+    sys.path.insert(0, HERE)
+    from fastapi import UploadFile
+    from utils.data_processor import DocumentProcessor, UploadTooLarge
+    from utils.disk_cache import DiskCache
+
+    processor = DocumentProcessor(max_upload_bytes=4 * 1024 * 1024,
+                                  extract_cache=DiskCache(path=str(tmp_path / "extracted.sqlite3")))
+    upload = UploadFile(file=io.BytesIO(b"x" * (16 * 1024 * 1024)), filename="big.txt")
+    try:
+        asyncio.run(processor.process_file(upload))
+    except UploadTooLarge:
+        assert upload.file.tell() <= 6 * 1024 * 1024
+        print("✅ Oversized upload rejected early")
+        return
+    raise AssertionError("oversized upload was accepted")
+
+
+if __name__ == "__main__":
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp:
+        test_upload_over_cap_is_rejected(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_large_pdf_upload_peak_rss_is_bounded(pathlib.Path(tmp))
+    print("✅ Upload memory tests passed")
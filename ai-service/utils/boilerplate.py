@@ -0,0 +1,176 @@
+"""Header/footer boilerplate and reference-section detection
+
+Lecture slides and papers repeat course titles, slide footers, page numbers
+and copyright lines on every page; papers end in a reference list. None of it
+helps a summary, quiz or flashcard set, but all of it costs prefill tokens in
+the map phase. This module finds and strips it from "[Page N]" text before
+tokenization.
+
+Boilerplate is found from line statistics across pages: a line (compared with
+digits masked, so "Slide 3" and "Slide 4" match) that sits in the first or
+last few lines of at least half of the pages, or appears anywhere on almost
+every page, is treated as a header/footer. The anywhere rule only considers
+lines of at least ANYWHERE_MIN_CHARS with letters in them, so recurring short
+headings ("Example #", "Solution:") and numeric table cells are kept. Its
+first occurrence is kept, so a course or lecture title still appears once;
+bare page numbers in the edge zones are always dropped.
+"""
+import re
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+_PAGE_MARKER = re.compile(r"^\[Page \d+\]$")
+# matched against the masked form (digits -> "#")
+_PAGE_NUMBER = re.compile(r"^(page|slide|p\.)?\s*#\s*((of|/)\s*#)?$")
+_REF_HEADING = re.compile(
+    r"^(\d+(\.\d+)*\.?\s*)?(references|bibliography|works cited|literature cited|citations)\s*:?$",
+    re.IGNORECASE,
+)
+_LETTER = re.compile(r"[^\W\d_]")
+_CITATION = re.compile(r"((19|20)\d\d[a-z]?\b|et al\.|\bdoi\b|https?://|\bpp?\.\s*\d|^\[\d+\])", re.IGNORECASE)
+
+EDGE_LINES = 3         # lines at the top/bottom of a page checked for headers/footers
+EDGE_RATIO = 0.5       # header/footer: in the edge zone of at least this share of pages
+ANYWHERE_RATIO = 0.8   # short lines repeated on nearly every page, wherever they sit
+ANYWHERE_MIN_CHARS = 25  # shorter lines (headings, table cells) only count in the edge zone
+MIN_PAGES = 3          # fewer pages give no useful statistics
+MAX_LINE_CHARS = 120
+REF_MIN_POSITION = 0.5  # a reference heading must be in the second half of the document
+REF_MIN_DENSITY = 0.3   # share of citation-looking lines for a page to count as references
+
+
+def _mask(line: str) -> str:
+    return _SPACES.sub(" ", _DIGITS.sub("#", line.strip().lower()))
+
+
+def _split(page: str) -> Tuple[str, List[str]]:
+    """Separate the "[Page N]" marker line from the page body."""
+    lines = page.split("\n")
+    if lines and _PAGE_MARKER.match(lines[0]):
+        return lines[0], lines[1:]
+    return "", lines
+
+
+def _join(marker: str, lines: List[str]) -> str:
+    body = "\n".join(lines).strip()
+    if not marker:
+        return body
+    return f"{marker}\n{body}" if body else f"{marker}\n"
+
+
+def _edge_indexes(lines: List[str], edge: int) -> Set[int]:
+    filled = [i for i, ln in enumerate(lines) if ln.strip()]
+    return set(filled[:edge] + filled[-edge:])
+
+
+class BoilerplateDetector:
+    """Learn repeated header/footer lines from a set of pages, then strip them from any page."""
+
+    def __init__(self, edge_lines: int = EDGE_LINES):
+        self.edge_lines = edge_lines
+        self.edge_keys: Set[str] = set()
+        self.anywhere_keys: Set[str] = set()
+        self._seen: Set[str] = set()
+
+    def fit(self, pages: List[str]) -> "BoilerplateDetector":
+        edge_counts: Counter = Counter()
+        anywhere_counts: Counter = Counter()
+        for page in pages:
+            _, lines = _split(page)
+            edges = _edge_indexes(lines, self.edge_lines)
+            edge_counts.update({_mask(lines[i]) for i in edges})
+            anywhere_counts.update({_mask(ln) for ln in lines if ln.strip()})
+
+        n = len(pages)
+        if n < MIN_PAGES:
+            return self
+        self.edge_keys = {
+            key for key, count in edge_counts.items()
+            if count >= max(MIN_PAGES, EDGE_RATIO * n) and len(key) <= MAX_LINE_CHARS
+        }
+        self.anywhere_keys = {
+            key for key, count in anywhere_counts.items()
+            if count >= max(MIN_PAGES, ANYWHERE_RATIO * n) and ANYWHERE_MIN_CHARS <= len(key) <= MAX_LINE_CHARS
+            and _LETTER.search(key)
+        }
+        return self
+
+    def clean_page(self, page: str) -> Tuple[str, List[str]]:
+        """Return (page without boilerplate, removed lines)."""
+        marker, lines = _split(page)
+        edges = _edge_indexes(lines, self.edge_lines)
+        kept, removed = [], []
+        for i, line in enumerate(lines):
+            key = _mask(line)
+            if key and i in edges and _PAGE_NUMBER.match(key):
+                removed.append(line)
+            elif key and (key in self.anywhere_keys or (i in edges and key in self.edge_keys)):
+                if key in self._seen:
+                    removed.append(line)
+                else:
+                    self._seen.add(key)
+                    kept.append(line)
+            else:
+                kept.append(line)
+        return _join(marker, kept), removed
+
+
+def _citation_density(lines: List[str]) -> float:
+    filled = [ln for ln in lines if ln.strip()]
+    if not filled:
+        return 0.0
+    return sum(1 for ln in filled if _CITATION.search(ln)) / len(filled)
+
+
+def strip_references(pages: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Drop a trailing reference section: a "References"/"Bibliography" heading in
+    the second half of the document, followed by citation-looking lines. Pages
+    after it are dropped while they still look like references, so appendices
+    after the bibliography are kept. Returns (pages, removed lines).
+    """
+    start = int(len(pages) * REF_MIN_POSITION)
+    for p in range(len(pages) - 1, start - 1, -1):
+        marker, lines = _split(pages[p])
+        heading = next((i for i, ln in enumerate(lines) if _REF_HEADING.match(ln.strip())), None)
+        if heading is None:
+            continue
+        rest = lines[heading + 1:]
+        following = rest if any(ln.strip() for ln in rest) else (_split(pages[p + 1])[1] if p + 1 < len(pages) else [])
+        if _citation_density(following) < REF_MIN_DENSITY:
+            return pages, []
+
+        out = pages[:p] + [_join(marker, lines[:heading])]
+        removed = lines[heading:]
+        q = p + 1
+        while q < len(pages):
+            q_marker, q_lines = _split(pages[q])
+            if _citation_density(q_lines) < REF_MIN_DENSITY:
+                break
+            out.append(_join(q_marker, []))  # keep the page marker so page numbering stays intact
+            removed.extend(q_lines)
+            q += 1
+        return out + pages[q:], removed
+    return pages, []
+
+
+def strip_boilerplate(pages: List[str]) -> Tuple[List[str], List[str], Dict[str, int]]:
+    """Strip headers/footers and the reference section; returns (pages, removed lines, stats)."""
+    detector = BoilerplateDetector().fit(pages)
+    cleaned, removed = [], []
+    for page in pages:
+        text, dropped = detector.clean_page(page)
+        cleaned.append(text)
+        removed.extend(dropped)
+    boilerplate_lines = len(removed)
+    cleaned, references = strip_references(cleaned)
+    removed.extend(references)
+    stats = {
+        "boilerplate_patterns": len(detector.edge_keys | detector.anywhere_keys),
+        "boilerplate_lines": boilerplate_lines,
+        "reference_lines": len(references),
+        "removed_chars": sum(len(ln) + 1 for ln in removed),
+    }
+    return cleaned, removed, stats
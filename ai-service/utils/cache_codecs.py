@@ -0,0 +1,261 @@
+"""Binary value codecs for the AI service cache
+
+Every encoded entry starts with a small header that records which codec and
+which compressor produced it, so the default codec can be changed on a live
+cache: old entries keep decoding with whatever wrote them, new entries use
+the new default. Entries without the header are legacy ``json.dumps`` values.
+
+Header layout (5 bytes)::
+
+    b"NQC" | codec id (1 byte) | compression id (1 byte)
+"""
+import json
+import logging
+import os
+import pickle
+import struct
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.frame
+    LZ4_AVAILABLE = True
+except ImportError:
+    LZ4_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+MAGIC = b"NQC"
+HEADER_SIZE = len(MAGIC) + 2
+
+CODEC_IDS = {"json": 0, "pickle": 1, "msgpack": 2}
+COMPRESSION_IDS = {"none": 0, "zlib": 1, "lz4": 2, "zstd": 3}
+
+_CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+_COMPRESSION_NAMES = {v: k for k, v in COMPRESSION_IDS.items()}
+
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+
+# -------------------- codecs --------------------
+
+def _json_encode(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _json_decode(data: memoryview) -> Any:
+    return json.loads(bytes(data).decode("utf-8"))
+
+
+def _pickle_encode(value: Any) -> bytes:
+    """Pickle protocol 5 with out-of-band buffers.
+
+    Large contiguous buffers (numpy arrays, bytearrays wrapped in
+    PickleBuffer) are not copied into the pickle stream; they are appended
+    to the frame after it::
+
+        u32 n_buffers | u64 pickle_len | pickle | (u64 len | raw) * n_buffers
+    """
+    buffers: List[pickle.PickleBuffer] = []
+    body = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+    parts = [_U32.pack(len(buffers)), _U64.pack(len(body)), body]
+    for buf in buffers:
+        raw = buf.raw()
+        parts.append(_U64.pack(raw.nbytes))
+        parts.append(raw)
+    return b"".join(parts)
+
+
+def _pickle_decode(data: memoryview) -> Any:
+    n_buffers = _U32.unpack_from(data, 0)[0]
+    body_len = _U64.unpack_from(data, 4)[0]
+    offset = 12
+    body = data[offset:offset + body_len]
+    offset += body_len
+    buffers = []
+    for _ in range(n_buffers):
+        size = _U64.unpack_from(data, offset)[0]
+        offset += 8
+        # slices of the frame: arrays are rebuilt on top of them without a copy
+        buffers.append(data[offset:offset + size])
+        offset += size
+    return pickle.loads(body, buffers=buffers)
+
+
+_ND_KEY = "__nd__"
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if NUMPY_AVAILABLE and isinstance(obj, np.ndarray):
+        arr = np.ascontiguousarray(obj)
+        return {_ND_KEY: arr.dtype.str, "shape": list(arr.shape), "data": memoryview(arr).cast("B")}
+    if NUMPY_AVAILABLE and isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not msgpack serializable")
+
+
+def _msgpack_object_hook(obj: Dict[Any, Any]) -> Any:
+    if _ND_KEY in obj and NUMPY_AVAILABLE:
+        # np.frombuffer views the unpacked bytes object directly (read-only)
+        return np.frombuffer(obj["data"], dtype=np.dtype(obj[_ND_KEY])).reshape(obj["shape"])
+    return obj
+
+
+def _msgpack_encode(value: Any) -> bytes:
+    return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+
+def _msgpack_decode(data: memoryview) -> Any:
+    return msgpack.unpackb(data, object_hook=_msgpack_object_hook, raw=False, strict_map_key=False)
+
+
+_ENCODERS: Dict[str, Tuple[Callable[[Any], bytes], Callable[[memoryview], Any]]] = {
+    "json": (_json_encode, _json_decode),
+    "pickle": (_pickle_encode, _pickle_decode),
+    "msgpack": (_msgpack_encode, _msgpack_decode),
+}
+
+
+# -------------------- compression --------------------
+
+def _compress(name: str, data: bytes, level: Optional[int] = None) -> bytes:
+    if name == "zstd":
+        return zstandard.ZstdCompressor(level=level or 3).compress(data)
+    if name == "lz4":
+        return lz4.frame.compress(data, compression_level=level or 0)
+    if name == "zlib":
+        return zlib.compress(data, level or 6)
+    return data
+
+
+def _decompress(name: str, data: memoryview) -> memoryview:
+    if name == "zstd":
+        return memoryview(zstandard.ZstdDecompressor().decompress(data))
+    if name == "lz4":
+        return memoryview(lz4.frame.decompress(data))
+    if name == "zlib":
+        return memoryview(zlib.decompress(data))
+    return data
+
+
+def available_codecs() -> List[str]:
+    """Codecs usable in this environment."""
+    codecs = ["json", "pickle"]
+    if MSGPACK_AVAILABLE:
+        codecs.append("msgpack")
+    return codecs
+
+
+def available_compressions() -> List[str]:
+    """Compressors usable in this environment (zlib is always present)."""
+    names = ["none", "zlib"]
+    if LZ4_AVAILABLE:
+        names.append("lz4")
+    if ZSTD_AVAILABLE:
+        names.append("zstd")
+    return names
+
+
+def _default_codec() -> str:
+    return "msgpack" if MSGPACK_AVAILABLE else "pickle"
+
+
+def _default_compression() -> str:
+    if ZSTD_AVAILABLE:
+        return "zstd"
+    if LZ4_AVAILABLE:
+        return "lz4"
+    return "zlib"
+
+
+class CacheCodec:
+    """Encode/decode cache values with a self-describing header.
+
+    Args:
+        codec: "msgpack", "pickle" or "json" (default: CACHE_CODEC env, then
+            msgpack if installed, else pickle). Pickle entries are only safe
+            on a cache that untrusted parties cannot write to.
+        compression: "zstd", "lz4", "zlib" or "none" (default: CACHE_COMPRESSION
+            env, then the best installed compressor).
+        compress_min_bytes: payloads smaller than this are stored raw.
+    """
+
+    def __init__(self, codec: Optional[str] = None, compression: Optional[str] = None,
+                 compress_min_bytes: Optional[int] = None, level: Optional[int] = None):
+        codec = codec or os.getenv("CACHE_CODEC") or _default_codec()
+        compression = compression or os.getenv("CACHE_COMPRESSION") or _default_compression()
+
+        if codec not in available_codecs():
+            logger.warning(f"⚠️  Cache codec '{codec}' not available, using {_default_codec()}")
+            codec = _default_codec()
+        if compression not in available_compressions():
+            logger.warning(f"⚠️  Cache compression '{compression}' not available, using {_default_compression()}")
+            compression = _default_compression()
+
+        self.codec = codec
+        self.compression = compression
+        self.compress_min_bytes = (
+            compress_min_bytes if compress_min_bytes is not None
+            else int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+        )
+        self.level = level
+        self._encode = _ENCODERS[codec][0]
+
+    def dumps(self, value: Any) -> bytes:
+        """Encode a value into a framed entry."""
+        payload = self._encode(value)
+        compression = "none"
+        if self.compression != "none" and len(payload) >= self.compress_min_bytes:
+            packed = _compress(self.compression, payload, self.level)
+            # incompressible payloads (already-compressed data, random floats) stay raw
+            if len(packed) < len(payload):
+                payload, compression = packed, self.compression
+        header = MAGIC + bytes((CODEC_IDS[self.codec], COMPRESSION_IDS[compression]))
+        return header + payload
+
+    def loads(self, data: Any) -> Any:
+        """Decode an entry written by any codec, including legacy JSON strings."""
+        if isinstance(data, str):
+            return json.loads(data)
+        view = memoryview(data)
+        if view[:len(MAGIC)] != MAGIC:
+            return json.loads(bytes(view).decode("utf-8"))
+
+        codec = _CODEC_NAMES.get(view[3])
+        compression = _COMPRESSION_NAMES.get(view[4])
+        if codec is None or compression is None:
+            raise ValueError(f"Unknown cache entry format (codec={view[3]}, compression={view[4]})")
+        payload = _decompress(compression, view[HEADER_SIZE:])
+        return _ENCODERS[codec][1](payload)
+
+    @staticmethod
+    def describe(data: Any) -> Dict[str, str]:
+        """Return the codec/compression recorded in an entry header."""
+        view = memoryview(data.encode("utf-8") if isinstance(data, str) else data)
+        if view[:len(MAGIC)] != MAGIC:
+            return {"codec": "json", "compression": "none", "legacy": "true"}
+        return {
+            "codec": _CODEC_NAMES.get(view[3], "unknown"),
+            "compression": _COMPRESSION_NAMES.get(view[4], "unknown"),
+        }
@@ -1,19 +1,42 @@
 """Cache management for AI service"""
 import asyncio
+import hashlib
 import json
 import logging
+import os
+from collections import OrderedDict
 from typing import Any, Optional
 from datetime import datetime, timedelta
 
+from .cache_codecs import CacheCodec
+from .disk_cache import DiskCache
+
 logger = logging.getLogger(__name__)
 
+
+def make_key(task: str, **params: Any) -> str:
+    """Stable cache key for a task and its request parameters."""
+    blob = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return f"nq:{task}:{hashlib.sha256(blob.encode('utf-8')).hexdigest()}"
+
+
 class CacheManager:
-    """Simple in-memory cache manager"""
-    
-    def __init__(self):
-        self.cache = {}
+    """Tiered cache manager.
+
+    Redis when reachable; otherwise an in-memory LRU (L1) on top of a
+    SQLite-backed disk tier (L2) that survives restarts and is shared by all
+    worker processes on the host.
+    """
+
+    def __init__(self, codec: Optional[CacheCodec] = None, max_memory_items: Optional[int] = None,
+                 disk_cache: Optional[DiskCache] = None):
+        self.cache: "OrderedDict[str, dict]" = OrderedDict()
+        self.max_memory_items = max_memory_items or int(os.getenv("CACHE_MEMORY_MAX_ITEMS", "1024"))
         self.redis_available = False
-        
+        # Serialization for out-of-process tiers; in-memory entries are stored as-is
+        self.codec = codec or CacheCodec()
+        self.disk = None
+
         # Try to connect to Redis if available
         try:
             import redis
@@ -22,7 +45,7 @@ class CacheManager:
                     host='localhost',
                     port=6379,
                     db=0,
-                    decode_responses=True
+                    decode_responses=False  # entries are binary codec frames
                 )
                 # Test connection
                 self.redis_client.ping()
@@ -30,38 +53,74 @@ class CacheManager:
                 logger.info("✅ Redis cache connected")
             except:
                 self.redis_client = None
-                logger.warning("⚠️  Redis not available, using in-memory cache")
+                logger.warning("⚠️  Redis not available, using in-memory + disk cache")
         except ImportError:
             self.redis_client = None
-            logger.warning("⚠️  Redis package not installed, using in-memory cache")
-    
+            logger.warning("⚠️  Redis package not installed, using in-memory + disk cache")
+
+        if not self.redis_available:
+            if disk_cache is not None:
+                self.disk = disk_cache
+            elif os.getenv("CACHE_DISK_ENABLED", "1").lower() not in ("0", "false", "no"):
+                try:
+                    self.disk = DiskCache()
+                except Exception as e:
+                    logger.warning(f"⚠️  Disk cache unavailable ({e}), using in-memory cache only")
+
     async def initialize(self):
         """Initialize cache manager"""
         logger.info("Cache manager initialized")
-    
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        item = self.cache.get(key)
+        if item is None:
+            return None
+        # Check if expired
+        if datetime.now() < item['expires_at']:
+            self.cache.move_to_end(key)
+            return item['value']
+        del self.cache[key]
+        return None
+
+    def _memory_set(self, key: str, value: Any, ttl: float):
+        self.cache[key] = {
+            'value': value,
+            'expires_at': datetime.now() + timedelta(seconds=ttl)
+        }
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_memory_items:
+            self.cache.popitem(last=False)
+
+    def _disk_get(self, key: str):
+        value = self.disk.get(key)
+        if value is None:
+            return None, None
+        return self.codec.loads(value), self.disk.ttl(key)
+
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
         try:
             if self.redis_available and self.redis_client:
                 value = self.redis_client.get(key)
                 if value:
-                    return json.loads(value)
+                    return self.codec.loads(value)
             else:
-                # In-memory cache
-                if key in self.cache:
-                    item = self.cache[key]
-                    # Check if expired
-                    if datetime.now() < item['expires_at']:
-                        return item['value']
-                    else:
-                        del self.cache[key]
-            
+                value = self._memory_get(key)
+                if value is not None:
+                    return value
+                if self.disk is not None:
+                    value, remaining = await asyncio.to_thread(self._disk_get, key)
+                    if value is not None:
+                        # promote into L1 with whatever lifetime the entry has left
+                        self._memory_set(key, value, remaining or 1)
+                        return value
+
             return None
-            
+
         except Exception as e:
             logger.error(f"Cache get error: {e}")
             return None
-    
+
     async def set(self, key: str, value: Any, ttl: int = 3600):
         """Set value in cache with TTL"""
         try:
@@ -69,28 +128,27 @@ class CacheManager:
                 self.redis_client.setex(
                     key,
                     ttl,
-                    json.dumps(value)
+                    self.codec.dumps(value)
                 )
             else:
-                # In-memory cache
-                self.cache[key] = {
-                    'value': value,
-                    'expires_at': datetime.now() + timedelta(seconds=ttl)
-                }
+                self._memory_set(key, value, ttl)
+                if self.disk is not None:
+                    await asyncio.to_thread(self.disk.set, key, self.codec.dumps(value), ttl)
         except Exception as e:
             logger.error(f"Cache set error: {e}")
-    
+
     async def delete(self, key: str):
         """Delete key from cache"""
         try:
             if self.redis_available and self.redis_client:
                 self.redis_client.delete(key)
             else:
-                if key in self.cache:
-                    del self.cache[key]
+                self.cache.pop(key, None)
+                if self.disk is not None:
+                    await asyncio.to_thread(self.disk.delete, key)
         except Exception as e:
             logger.error(f"Cache delete error: {e}")
-    
+
     async def clear(self):
         """Clear all cache"""
         try:
@@ -98,9 +156,11 @@ class CacheManager:
                 self.redis_client.flushdb()
             else:
                 self.cache.clear()
+                if self.disk is not None:
+                    await asyncio.to_thread(self.disk.clear)
         except Exception as e:
             logger.error(f"Cache clear error: {e}")
-    
+
     async def health_check(self) -> dict:
         """Check cache health"""
         try:
@@ -109,17 +169,24 @@ class CacheManager:
                 return {
                     "status": "healthy",
                     "type": "redis",
-                    "size": self.redis_client.dbsize()
+                    "size": self.redis_client.dbsize(),
+                    "codec": self.codec.codec,
+                    "compression": self.codec.compression
                 }
             else:
-                return {
+                result = {
                     "status": "healthy",
-                    "type": "in-memory",
-                    "size": len(self.cache)
+                    "type": "in-memory+disk" if self.disk is not None else "in-memory",
+                    "size": len(self.cache),
+                    "max_memory_items": self.max_memory_items
                 }
+                if self.disk is not None:
+                    result["disk"] = await asyncio.to_thread(self.disk.stats)
+                    result["codec"] = self.codec.codec
+                    result["compression"] = self.codec.compression
+                return result
         except Exception as e:
             return {
                 "status": "unhealthy",
                 "error": str(e)
             }
-
@@ -0,0 +1,68 @@
+"""Representative passage selection for quiz/flashcard generation
+
+Mapping every chunk of a long document and letting the reduce throw most of the
+questions away wastes model calls. Instead a diverse, representative subset of
+the document's passages (VectorDB chunks) is picked by maximal marginal
+relevance: relevance is similarity to the document centroid, and each pick is
+penalized by its similarity to the passages already picked, so the subset
+spreads over the document's topics rather than repeating its dominant one.
+
+``coverage`` is the offline metric used to compare selections: the mean, over
+all passages, of the similarity to the closest selected passage.
+"""
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def _unit(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def mmr_select(embeddings: np.ndarray, k: int, diversity: float = 0.5,
+               eligible: Optional[Sequence[bool]] = None) -> List[int]:
+    """
+    Indices of k passages picked greedily by maximal marginal relevance, in pick
+    order. diversity (0..1) weighs the redundancy penalty against centrality;
+    passages marked not eligible (e.g. too short) are never picked.
+    """
+    vectors = _unit(embeddings)
+    n = len(vectors)
+    if n == 0 or k <= 0:
+        return []
+    centroid = vectors.mean(axis=0)
+    relevance = vectors @ (centroid / max(float(np.linalg.norm(centroid)), 1e-12))
+    redundancy = np.full(n, -np.inf, dtype=np.float32)  # max similarity to a picked passage
+    available = np.ones(n, dtype=bool) if eligible is None else np.array(eligible, dtype=bool)
+    picked: List[int] = []
+    while len(picked) < k and available.any():
+        score = (1 - diversity) * relevance - (diversity * redundancy if picked else 0.0)
+        score[~available] = -np.inf
+        best = int(np.argmax(score))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, vectors @ vectors[best], out=redundancy)
+    return picked
+
+
+def coverage(embeddings: np.ndarray, selected: Sequence[int]) -> float:
+    """Mean similarity of every passage to its closest selected passage (1.0 when all are selected)."""
+    if not len(selected):
+        return 0.0
+    vectors = _unit(embeddings)
+    return float((vectors @ vectors[list(selected)].T).max(axis=1).mean())
+
+
+def group_in_order(selected: Sequence[int], groups: int) -> List[List[int]]:
+    """Split the selected indices, in document order, into `groups` contiguous runs of near-equal size."""
+    ordered = sorted(selected)
+    groups = max(1, min(groups, len(ordered)))
+    size, extra = divmod(len(ordered), groups)
+    runs, start = [], 0
+    for g in range(groups):
+        end = start + size + (1 if g < extra else 0)
+        runs.append(ordered[start:end])
+        start = end
+    return runs
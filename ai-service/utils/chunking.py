@@ -0,0 +1,110 @@
+"""Token-aware chunking of "[Page N]" text for the vector index
+
+Chunks are measured in the embedding model's own tokens, so none silently
+overflows its window, and are cut only at sentence or line ends. Each chunk
+records the pages it came from.
+
+Packing is greedy up to the target size. Once a chunk is half full it is also
+closed at a paragraph/page end or after an "anchor" unit (chosen by a hash of
+its text), so cut points are content-defined: an edit only changes the chunks
+around it (see VectorDB.update_document). Everything is a single pass over the
+text plus one batched tokenizer call, so time is linear in the input size.
+"""
+import re
+import zlib
+from typing import Any, Iterator, List, Tuple
+
+_PAGE_MARKER = re.compile(r"^\[Page (\d+)\]$", re.MULTILINE)
+# a unit is a sentence (punctuation followed by spaces) or a line
+_UNIT_END = re.compile(r"[.!?][\"')\]]*[ \t]+|[ \t]*\n\s*")
+
+ANCHOR_EVERY = 4  # about one unit in this many may end a half-full chunk
+OVERLAP_TOKENS = 32  # between the windows of a single unit longer than a chunk
+
+Chunk = Tuple[str, int, int, int]  # (text, first page, last page, tokens); pages are 0 without markers
+_Unit = Tuple[str, int, bool]  # (text with trailing whitespace, page, ends a paragraph)
+
+
+def _pages(text: str) -> Iterator[Tuple[int, str]]:
+    markers = list(_PAGE_MARKER.finditer(text))
+    if not markers:
+        yield 0, text
+        return
+    preamble = text[:markers[0].start()]  # joins page 1
+    for i, m in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        yield int(m.group(1)), (preamble if i == 0 else "") + text[m.end():end]
+
+
+def _units(text: str) -> Iterator[_Unit]:
+    for page, body in _pages(text):
+        units: List[_Unit] = []
+        pos = 0
+        for m in _UNIT_END.finditer(body):
+            if body[pos:m.end()].strip():
+                units.append((body[pos:m.end()], page, m.group().count("\n") >= 2))
+            pos = m.end()
+        if body[pos:].strip():
+            units.append((body[pos:], page, True))
+        if units:
+            units[-1] = (units[-1][0], page, True)  # a page end is a paragraph end
+        yield from units
+
+
+def _windows(unit: str, tokenizer: Any, size: int, overlap: int) -> Iterator[Tuple[str, int]]:
+    """Split one over-long unit into token windows, moving each cut back to a space when there is one."""
+    offsets = tokenizer(unit, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    start = 0
+    while start < len(offsets):
+        stop = min(start + size, len(offsets))
+        a, b = offsets[start][0], offsets[stop - 1][1]
+        if stop < len(offsets):
+            space = unit.rfind(" ", a, b)
+            if space > a:
+                while stop - 1 > start and offsets[stop - 1][0] >= space:
+                    stop -= 1
+                b = space
+        yield unit[a:b].strip(), stop - start
+        if stop == len(offsets):
+            break
+        start = max(start + 1, stop - overlap)
+
+
+def chunk_document(text: str, tokenizer: Any, target_tokens: int, overlap_tokens: int = OVERLAP_TOKENS) -> List[Chunk]:
+    """
+    Split text into chunks of at most target_tokens tokens (of tokenizer, a Hugging
+    Face tokenizer) along sentence and line boundaries; see the module docstring.
+    """
+    units = list(_units(text))
+    if not units:
+        return []
+    counts = [len(ids) for ids in tokenizer([u for u, _, _ in units], add_special_tokens=False)["input_ids"]]
+
+    chunks: List[Chunk] = []
+    current: List[str] = []
+    first_page = last_page = tokens = 0
+
+    def close():
+        nonlocal tokens
+        if current:
+            chunks.append(("".join(current).strip(), first_page, last_page, tokens))
+            current.clear()
+            tokens = 0
+
+    for (unit, page, paragraph_end), n in zip(units, counts):
+        if n > target_tokens:
+            close()
+            chunks.extend((piece, page, page, size)
+                          for piece, size in _windows(unit, tokenizer, target_tokens, overlap_tokens) if piece)
+            continue
+        if tokens + n > target_tokens:
+            close()
+        if not current:
+            first_page = page
+        current.append(unit)
+        last_page = page
+        tokens += n
+        if tokens >= target_tokens // 2 and (paragraph_end or zlib.crc32(unit.encode("utf-8")) % ANCHOR_EVERY == 0):
+            close()
+    close()
+    return chunks
@@ -1,84 +1,550 @@
 """Document processing utilities (robust PDF extraction)"""
+import asyncio
+import contextlib
+import hashlib
 import logging
-from typing import Any
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
 from fastapi import UploadFile
 
+from .cache_codecs import CacheCodec
+from .cache_manager import make_key
+from .disk_cache import DiskCache
+
 logger = logging.getLogger(__name__)
 
-def _normalize_ws(text: str) -> str:
-    # collapse weird whitespace while preserving paragraphs and bullets
-    import re
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Bump whenever extraction or normalization output changes, so cached text is not reused
+EXTRACTOR_VERSION = 5
+EXTRACT_CACHE_TTL = int(os.getenv("EXTRACT_CACHE_TTL", str(30 * 24 * 3600)))
+STREAM_LEAD_PAGES = 4  # size of the first page range when streaming, so generation can start early
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+
+# Extraction sources are a file path (uploads are spooled to disk) or raw bytes
+Source = Union[str, bytes]
+
+
+class UploadTooLarge(ValueError):
+    """Upload exceeded the configured size cap."""
+
+# Patterns for _normalize_ws, compiled once. The bullet pattern starts with a
+# literal "\n", which lets the regex engine skip ahead between matches.
+_BULLET = re.compile(r"\n[•\-\u2022]+[ \t]*")
+# a word split across a line break: a lowercase letter, "-", newline, then a lowercase
+# continuation that is not itself hyphenated ("state-\nof-the-art" is a real compound)
+_HYPHEN_BREAK = re.compile(r"-\n(?<=[^\W\d_A-Z]-\n)(?=[a-z][^\W\d_]*(?![\w-]))")
+
+# Unicode cleanup: ligatures expanded, soft hyphens and zero-width characters
+# dropped, exotic spaces turned into plain ones (then collapsed as usual)
+_UNICODE_MAP = {
+    "\ufb00": "ff", "\ufb01": "fi", "\ufb02": "fl", "\ufb03": "ffi",
+    "\ufb04": "ffl", "\ufb05": "st", "\ufb06": "st",
+    "\u00ad": "", "\u200b": "", "\u200c": "", "\u200d": "", "\u2060": "", "\ufeff": "",
+    "\u00a0": " ", "\u2002": " ", "\u2003": " ", "\u2004": " ", "\u2005": " ",
+    "\u2006": " ", "\u2007": " ", "\u2008": " ", "\u2009": " ", "\u200a": " ",
+    "\u202f": " ", "\u205f": " ", "\u3000": " ",
+}
+UNICODE_CLEANUP = os.getenv("EXTRACT_UNICODE_CLEANUP", "1") == "1"
+
+
+def _normalize_ws(text: str, unicode_cleanup: bool = False) -> str:
+    """
+    Collapse weird whitespace while preserving paragraphs and bullets.
+
+    Works on the whole text with C-level str passes (each "in" check and replace
+    is one scan; a regex with a Python callback per match is several times
+    slower). With unicode_cleanup, ligatures, soft hyphens and zero-width
+    characters are cleaned up first and words hyphenated across a line break
+    are re-joined.
+    """
     text = text.replace("\r", "")
-    # keep blank lines (paragraphs), but normalize runs of spaces/tabs
-    lines = [re.sub(r"[ \t]+", " ", ln).strip() for ln in text.split("\n")]
+    if unicode_cleanup and not text.isascii():
+        for char, replacement in _UNICODE_MAP.items():
+            if char in text:
+                text = text.replace(char, replacement)
+    # collapse runs of spaces/tabs, then strip every line (blank lines are kept)
+    if "\t" in text:
+        text = text.replace("\t", " ")
+    while "  " in text:
+        text = text.replace("  ", " ")
+    text = "\n".join([ln.strip() for ln in text.split("\n")])
+    if unicode_cleanup and "-\n" in text:
+        text = _HYPHEN_BREAK.sub("", text)
     # remove leading bullet artifacts like '•  ' duplicated
-    lines = [re.sub(r"^[•\-\u2022]+[ \t]*", "- ", ln) for ln in lines]
-    # rebuild with single newline, keep empty lines
-    return "\n".join(lines).strip()
+    text = _BULLET.sub("\n- ", "\n" + text)[1:]
+    return text.strip()
+
+
+# -------------------- extraction workers (run in the process pool) --------------------
+
+def _open_pdf(source: Source):
+    import fitz  # PyMuPDF
+
+    # a path lets MuPDF read pages on demand instead of holding the whole file in memory
+    if isinstance(source, str):
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
+
+def _pdf_page_count(source: Source) -> int:
+    """Open the PDF, check it is readable, and return its page count."""
+    doc = _open_pdf(source)
+    try:
+        if doc.needs_pass:
+            # try empty password; otherwise bail early with a clear error
+            if not doc.authenticate(""):
+                raise ValueError("Encrypted PDF: password required")
+        return len(doc)
+    finally:
+        doc.close()
+
+def _extract_pdf_pages(source: Source, start: int, end: int) -> List[str]:
+    """Extract pages [start, end) with PyMuPDF, each prefixed with its [Page N] marker."""
+    doc = _open_pdf(source)
+    try:
+        if doc.needs_pass:
+            doc.authenticate("")
+        pages = []
+        for i in range(start, end):
+            page = doc.load_page(i)
+            # "text" is good for paragraphs; "blocks" if you want layout later
+            txt = _normalize_ws(page.get_text("text"), UNICODE_CLEANUP)
+            # add explicit page markers for downstream summarizer
+            if txt:
+                pages.append(f"[Page {i+1}]\n{txt}")
+            else:
+                pages.append(f"[Page {i+1}]\n")  # keep placeholder so page count matches
+        return pages
+    finally:
+        doc.close()
+
+def _extract_pdf_pypdf2(source: Source) -> str:
+    """Fallback PDF extraction with PyPDF2 (less reliable layout)."""
+    import PyPDF2
+    import io
+
+    # PdfReader seeks within a path-backed file; only raw bytes need a BytesIO wrapper
+    reader = PyPDF2.PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+    if reader.is_encrypted:
+        try:
+            reader.decrypt("")  # try empty password
+        except Exception:
+            raise ValueError("Encrypted PDF: password required")
+
+    pages = []
+    for i, page in enumerate(reader.pages):
+        try:
+            t = page.extract_text() or ""
+        except Exception:
+            t = ""
+        t = _normalize_ws(t, UNICODE_CLEANUP)
+        pages.append(f"[Page {i+1}]\n{t}")
+    return "\n\n".join(pages).strip()
+
+def _extract_docx(source: Source) -> str:
+    import docx
+    import io
+
+    doc = docx.Document(source if isinstance(source, str) else io.BytesIO(source))
+
+    lines = []
+    for p in doc.paragraphs:
+        txt = (p.text or "").rstrip()
+        if txt:
+            lines.append(txt)
+        else:
+            lines.append("")  # preserve paragraph gaps
+
+    # Add a synthetic page header for consistency with PDF output
+    text = "[Page 1]\n" + "\n".join(lines)
+    return _normalize_ws(text, UNICODE_CLEANUP)
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_TYPE = _W + "type"
+_W_VAL = _W + "val"
+_W_OFF = ("0", "false", "off")  # on/off properties are on unless w:val says otherwise
+
+
+def _extract_docx_stream(source: Source) -> str:
+    """
+    Stream word/document.xml with iterparse instead of building python-docx's
+    object model. Paragraphs and table rows (cells joined with " | ") come out
+    in document order; page breaks, rendered page boundaries and section breaks
+    become [Page N] markers like the PDF path. Memory stays flat: every
+    top-level block is discarded once its text has been collected.
+    """
+    import io
+    import zipfile
+    from xml.etree.ElementTree import iterparse
+
+    pages: List[str] = []  # finished pages, already normalized
+    lines: List[str] = []  # current page
+    para: List[str] = []
+    tables: List[Tuple[List[str], List[str]]] = []  # (row cells, current cell paragraphs) per open table
+    pending_break = False  # page break seen inside a table, applied after it
+    section_break = False
+    in_ppr = False
+    body = None
+    depth = 0
+
+    def close_page():
+        txt = _normalize_ws("\n".join(lines), UNICODE_CLEANUP)
+        pages.append(f"[Page {len(pages) + 1}]\n{txt}" if txt else f"[Page {len(pages) + 1}]\n")
+        lines.clear()
+
+    def page_break():
+        nonlocal pending_break
+        if tables:
+            pending_break = True
+            return
+        if para:
+            lines.append("".join(para))
+            para.clear()
+        if any(line.strip() for line in lines):
+            close_page()
+
+    with zipfile.ZipFile(source if isinstance(source, str) else io.BytesIO(source)) as zf:
+        with zf.open("word/document.xml") as xml:
+            for event, el in iterparse(xml, events=("start", "end")):
+                tag = el.tag
+                if event == "start":
+                    depth += 1
+                    if tag == _W + "body":
+                        body = el
+                    elif tag == _W + "tbl":
+                        tables.append(([], []))
+                    elif tag == _W + "pPr":
+                        in_ppr = True
+                    continue
+
+                depth -= 1
+                if tag == _W + "t":
+                    para.append(el.text or "")
+                elif tag == _W + "tab":
+                    if not in_ppr:  # w:pPr/w:tabs/w:tab defines a tab stop, not content
+                        para.append("\t")
+                elif tag in (_W + "br", _W + "cr"):
+                    if el.get(_W_TYPE) == "page":
+                        page_break()
+                    else:
+                        para.append("\n")
+                elif tag == _W + "lastRenderedPageBreak":
+                    page_break()
+                elif tag == _W + "pageBreakBefore":
+                    if el.get(_W_VAL, "true").lower() not in _W_OFF:
+                        page_break()
+                elif tag == _W + "pPr":
+                    in_ppr = False
+                elif tag == _W + "sectPr" and in_ppr:
+                    section_break = True  # section ends with this paragraph
+                elif tag == _W + "p":
+                    text = "".join(para)
+                    para.clear()
+                    if tables:
+                        tables[-1][1].append(text)
+                    else:
+                        lines.append(text)
+                    if section_break:
+                        section_break = False
+                        page_break()
+                elif tag == _W + "tc":
+                    cells, cell = tables[-1]
+                    cells.append(" ".join(t.strip() for t in cell if t.strip()))
+                    cell.clear()
+                elif tag == _W + "tr":
+                    cells = tables[-1][0]
+                    row = " | ".join(cells)
+                    cells.clear()
+                    # rows of a nested table become text of the enclosing cell
+                    (tables[-2][1] if len(tables) > 1 else lines).append(row)
+                elif tag == _W + "tbl":
+                    tables.pop()
+                    if not tables and pending_break:
+                        pending_break = False
+                        page_break()
+
+                if depth == 2 and body is not None:
+                    body.clear()  # finished a top-level block (document > body > block)
+
+    if lines or not pages:
+        close_page()
+    return "\n\n".join(pages).strip()
 
 
 class DocumentProcessor:
-    """Process uploaded documents and extract text"""
+    """Process uploaded documents and extract text
+
+    Extraction is CPU-bound, so it runs in a bounded process pool instead of on
+    the event loop. Large PDFs are split into page ranges extracted in parallel
+    and reassembled in page order. Extracted text is cached on local disk by the
+    SHA-256 of the upload bytes, so re-uploading the same file skips extraction.
+    """
 
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None, pages_per_task: Optional[int] = None,
+                 max_upload_bytes: Optional[int] = None, extract_cache: Optional[DiskCache] = None):
         self.supported_formats = ['.txt', '.pdf', '.docx', '.md']
+        self.max_upload_bytes = max_upload_bytes or MAX_UPLOAD_BYTES
+        self.spool_dir = os.getenv("UPLOAD_SPOOL_DIR") or None  # None: system temp dir
+        self.max_workers = max_workers or int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.pages_per_task = pages_per_task or int(os.getenv("EXTRACT_PAGES_PER_TASK", "32"))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.extract_cache = extract_cache
+        if extract_cache is None and os.getenv("EXTRACT_CACHE_ENABLED", "1") == "1":
+            try:
+                self.extract_cache = DiskCache(
+                    path=os.getenv("EXTRACT_CACHE_PATH", "./cache/extracted.sqlite3"),
+                    max_bytes=int(os.getenv("EXTRACT_CACHE_MAX_BYTES", str(1024 ** 3))),
+                )
+            except Exception as e:
+                logger.warning(f"⚠️  Extraction cache unavailable ({e}), extracting every upload")
+        # text compresses well; always compress, whatever the size
+        self.extract_codec = CacheCodec(codec="json", compress_min_bytes=0)
 
-    async def process_file(self, file: UploadFile) -> str:
-        """Process uploaded file and extract text content (returns a single string)."""
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that already runs CUDA/threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"🧵 Extraction pool started ({self.max_workers} workers)")
+        return self._pool
+
+    async def _in_pool(self, fn, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), fn, *args)
+
+    def shutdown(self):
+        """Stop the extraction pool (called on app shutdown)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _page_ranges(self, page_count: int, lead: int = 0) -> List[range]:
+        # enough ranges to keep every worker busy, none larger than pages_per_task;
+        # an optional short lead range gets the first pages back quickly when streaming
+        per_task = max(1, min(self.pages_per_task, -(-page_count // self.max_workers)))
+        lead = min(lead, per_task, page_count)
+        ranges = [range(0, lead)] if lead else []
+        return ranges + [range(s, min(s + per_task, page_count)) for s in range(lead, page_count, per_task)]
+
+    async def _spool_upload(self, file: UploadFile) -> Tuple[str, str]:
+        """
+        Stream the upload to a temp file in fixed-size chunks; returns (path, sha256 hex digest).
+        Memory use stays at one chunk regardless of file size; uploads over the
+        cap are rejected as soon as they cross it.
+        """
+        fd, path = tempfile.mkstemp(prefix="nq_upload_", dir=self.spool_dir)
+        digest = hashlib.sha256()
+        size = 0
         try:
-            content = await file.read()
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise UploadTooLarge(
+                            f"Upload exceeds {self.max_upload_bytes // (1024 * 1024)} MB limit"
+                        )
+                    digest.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+        return path, digest.hexdigest()
 
-            # Get file extension
-            filename = (file.filename or "").lower()
-            file_ext = filename.split('.')[-1] if '.' in filename else ""
+    def _read_text(self, path: str) -> str:
+        with open(path, "rb") as f:
+            return f.read().decode('utf-8', errors='ignore').strip()
 
-            if file_ext in ['txt', 'text', 'md', 'markdown']:
-                return content.decode('utf-8', errors='ignore').strip()
+    def _file_ext(self, file: UploadFile) -> str:
+        filename = (file.filename or "").lower()
+        return filename.split('.')[-1] if '.' in filename else ""
 
-            if file_ext == 'pdf':
-                return await self._process_pdf_pymupdf(content)
+    def _extract_key(self, digest: str, file_ext: str) -> str:
+        return make_key("extract", digest=digest, ext=file_ext, version=EXTRACTOR_VERSION,
+                        unicode_cleanup=UNICODE_CLEANUP)
 
-            if file_ext in ['docx', 'doc']:
-                return await self._process_docx(content)
+    def _cache_get(self, key: str) -> Optional[str]:
+        data = self.extract_cache.get(key)
+        return None if data is None else self.extract_codec.loads(data)
 
-            # Fallback: best-effort text decode
-            logger.warning(f"Unknown file type: {file_ext}, attempting text decode")
-            return content.decode('utf-8', errors='ignore').strip()
+    async def _cached_text(self, key: str) -> Optional[str]:
+        if self.extract_cache is None:
+            return None
+        try:
+            return await asyncio.to_thread(self._cache_get, key)
+        except Exception as e:
+            logger.warning(f"Extraction cache read failed: {e}")
+            return None
 
+    async def _store_text(self, key: str, text: str):
+        if self.extract_cache is None:
+            return
+        try:
+            await asyncio.to_thread(self.extract_cache.set, key, self.extract_codec.dumps(text), EXTRACT_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Extraction cache write failed: {e}")
+
+    async def _extract(self, path: str, file_ext: str) -> str:
+        if file_ext in ['txt', 'text', 'md', 'markdown']:
+            return self._read_text(path)
+
+        if file_ext == 'pdf':
+            return await self._process_pdf_pymupdf(path)
+
+        if file_ext in ['docx', 'doc']:
+            return await self._process_docx(path)
+
+        # Fallback: best-effort text decode
+        logger.warning(f"Unknown file type: {file_ext}, attempting text decode")
+        return self._read_text(path)
+
+    async def process_upload(self, file: UploadFile) -> Dict[str, Any]:
+        """
+        Process an uploaded file; returns {"content", "digest", "cached"}.
+
+        digest is the SHA-256 of the upload bytes. Repeat uploads of the same
+        bytes are served from the extraction cache without re-extracting.
+        """
+        path = None
+        try:
+            path, digest = await self._spool_upload(file)
+            file_ext = self._file_ext(file)
+            key = self._extract_key(digest, file_ext)
+
+            text = await self._cached_text(key)
+            if text is not None:
+                logger.info(f"♻️  Extraction cache hit {digest[:12]}")
+                return {"content": text, "digest": digest, "cached": True}
+
+            text = await self._extract(path, file_ext)
+            await self._store_text(key, text)
+            return {"content": text, "digest": digest, "cached": False}
+
+        except UploadTooLarge:
+            raise
         except Exception as e:
             logger.error(f"Document processing failed: {e}")
             raise ValueError(f"Failed to process document: {str(e)}")
+        finally:
+            if path is not None:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    async def process_file(self, file: UploadFile) -> str:
+        """Process uploaded file and extract text content (returns a single string)."""
+        return (await self.process_upload(file))["content"]
+
+    @contextlib.asynccontextmanager
+    async def open_pages(self, file: UploadFile):
+        """
+        Spool the upload and yield (digest, page_count, pages), where pages is an
+        async iterator over "[Page N]\n..." strings in page order. PDF pages arrive
+        while later page ranges are still being extracted, so callers can start
+        work on the first pages early. Other formats, and uploads already in the
+        extraction cache, come through as a single item.
+
+            async with processor.open_pages(file) as (digest, page_count, pages):
+                async for page in pages: ...
+        """
+        path, digest = await self._spool_upload(file)
+        pages = None
+        try:
+            file_ext = self._file_ext(file)
+            key = self._extract_key(digest, file_ext)
+            text = await self._cached_text(key)
+            if text is not None:
+                logger.info(f"♻️  Extraction cache hit {digest[:12]}")
+                pages = self._iter_text(text)
+                yield digest, max(1, text.count("[Page ")), pages
+                return
+
+            page_count = 1
+            if file_ext == 'pdf':
+                try:
+                    import fitz  # noqa: F401  (PyMuPDF)
+                    page_count = await self._in_pool(_pdf_page_count, path)
+                    pages = self._iter_pdf_pages(path, page_count)
+                except ImportError:
+                    logger.warning("PyMuPDF (pymupdf) not installed, falling back to PyPDF2")
+                except Exception as e:
+                    logger.error(f"PyMuPDF PDF processing error: {e}")
+            if pages is None:
+                pages = self._iter_whole(path, file_ext)
+            pages = self._iter_and_store(pages, key)
+            yield digest, page_count, pages
+        finally:
+            if pages is not None:
+                await pages.aclose()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    async def _iter_text(self, text: str) -> AsyncIterator[str]:
+        yield text
+
+    async def _iter_and_store(self, pages: AsyncIterator[str], key: str) -> AsyncIterator[str]:
+        """Pass pages through; once all have been read, cache the joined text."""
+        seen = []
+        try:
+            async for page in pages:
+                seen.append(page)
+                yield page
+        finally:
+            await pages.aclose()
+        await self._store_text(key, "\n\n".join(seen).strip())
+
+    async def _iter_pdf_pages(self, path: str, page_count: int) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        # every range is submitted up front; pages are yielded in order as each range completes
+        futures = [
+            loop.run_in_executor(pool, _extract_pdf_pages, path, r.start, r.stop)
+            for r in self._page_ranges(page_count, lead=STREAM_LEAD_PAGES)
+        ]
+        try:
+            for fut in futures:
+                for page in await fut:
+                    yield page
+        finally:
+            for fut in futures:
+                fut.cancel()
+
+    async def _iter_whole(self, path: str, file_ext: str) -> AsyncIterator[str]:
+        if file_ext == 'pdf':
+            yield await self._process_pdf_pypdf2(path)
+        elif file_ext in ['docx', 'doc']:
+            yield await self._process_docx(path)
+        else:
+            yield self._read_text(path)
 
     # -------------------- PDF (preferred: PyMuPDF) --------------------
 
-    async def _process_pdf_pymupdf(self, content: bytes) -> str:
+    async def _process_pdf_pymupdf(self, content: Source) -> str:
         """
         Extract text with PyMuPDF (fitz), preserving page boundaries and
         more reliable paragraph order than PyPDF2. Falls back to PyPDF2 if needed.
         """
         try:
-            import fitz  # PyMuPDF
-            import io
-
-            doc = fitz.open(stream=content, filetype="pdf")
-            if doc.needs_pass:
-                # try empty password; otherwise bail early with a clear error
-                if not doc.authenticate(""):
-                    raise ValueError("Encrypted PDF: password required")
-
-            pages = []
-            for i in range(len(doc)):
-                page = doc.load_page(i)
-                # "text" is good for paragraphs; "blocks" if you want layout later
-                txt = page.get_text("text")
-                txt = _normalize_ws(txt)
-                # add explicit page markers for downstream summarizer
-                if txt:
-                    pages.append(f"[Page {i+1}]\n{txt}")
-                else:
-                    pages.append(f"[Page {i+1}]\n")  # keep placeholder so page count matches
-
-            doc.close()
+            import fitz  # noqa: F401  (PyMuPDF; imported here only to detect availability)
+
+            page_count = await self._in_pool(_pdf_page_count, content)
+            ranges = self._page_ranges(page_count)
+            parts = await asyncio.gather(*(
+                self._in_pool(_extract_pdf_pages, content, r.start, r.stop) for r in ranges
+            ))
+            # gather preserves submission order, so pages come back in sequence
+            pages = [page for part in parts for page in part]
             return "\n\n".join(pages).strip()
 
         except ImportError:
@@ -92,29 +558,11 @@ class DocumentProcessor:
             except Exception:
                 raise
 
-    async def _process_pdf_pypdf2(self, content: bytes) -> str:
+    async def _process_pdf_pypdf2(self, content: Source) -> str:
         """Fallback PDF extraction with PyPDF2 (less reliable layout)."""
         try:
-            import PyPDF2
-            import io
-
-            pdf_file = io.BytesIO(content)
-            reader = PyPDF2.PdfReader(pdf_file)
-            if reader.is_encrypted:
-                try:
-                    reader.decrypt("")  # try empty password
-                except Exception:
-                    raise ValueError("Encrypted PDF: password required")
-
-            pages = []
-            for i, page in enumerate(reader.pages):
-                try:
-                    t = page.extract_text() or ""
-                except Exception:
-                    t = ""
-                t = _normalize_ws(t)
-                pages.append(f"[Page {i+1}]\n{t}")
-            return "\n\n".join(pages).strip()
+            import PyPDF2  # noqa: F401
+            return await self._in_pool(_extract_pdf_pypdf2, content)
 
         except ImportError:
             logger.error("PyPDF2 not installed; cannot process PDFs without PyMuPDF.")
@@ -125,26 +573,16 @@ class DocumentProcessor:
 
     # -------------------- DOCX --------------------
 
-    async def _process_docx(self, content: bytes) -> str:
-        """Process DOCX file."""
+    async def _process_docx(self, content: Source) -> str:
+        """Process DOCX file (streaming XML extractor; python-docx as a fallback)."""
+        try:
+            return await self._in_pool(_extract_docx_stream, content)
+        except Exception as e:
+            logger.warning(f"Streaming DOCX extraction failed ({e}), falling back to python-docx")
+
         try:
-            import docx
-            import io
-
-            doc_file = io.BytesIO(content)
-            doc = docx.Document(doc_file)
-
-            lines = []
-            for p in doc.paragraphs:
-                txt = (p.text or "").rstrip()
-                if txt:
-                    lines.append(txt)
-                else:
-                    lines.append("")  # preserve paragraph gaps
-
-            # Add a synthetic page header for consistency with PDF output
-            text = "[Page 1]\n" + "\n".join(lines)
-            return _normalize_ws(text)
+            import docx  # noqa: F401
+            return await self._in_pool(_extract_docx, content)
 
         except ImportError:
             logger.warning("python-docx not installed, cannot process DOCX")
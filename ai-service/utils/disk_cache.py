@@ -0,0 +1,190 @@
+"""Persistent local cache tier backed by SQLite (WAL mode)
+
+Used by CacheManager as the L2 tier under the in-memory LRU when Redis is not
+available. The database file can be shared by every uvicorn worker on the
+host: SQLite's WAL mode allows concurrent readers with a single writer, and
+each process/thread gets its own connection.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key         TEXT PRIMARY KEY,
+    value       BLOB NOT NULL,
+    size        INTEGER NOT NULL,
+    expires_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_expires ON entries(expires_at);
+CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at);
+
+-- running total of stored bytes, kept exact across processes by triggers
+CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), total_bytes INTEGER NOT NULL);
+INSERT OR IGNORE INTO stats (id, total_bytes) VALUES (0, 0);
+
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    UPDATE stats SET total_bytes = total_bytes + NEW.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    UPDATE stats SET total_bytes = total_bytes - OLD.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE OF size ON entries BEGIN
+    UPDATE stats SET total_bytes = total_bytes - OLD.size + NEW.size WHERE id = 0;
+END;
+"""
+
+
+class DiskCache:
+    """Size-capped, TTL-aware key/value store in a single SQLite file.
+
+    Values are opaque bytes (CacheManager stores codec frames). When the
+    stored total exceeds ``max_bytes`` the least recently accessed entries
+    are evicted down to ``low_watermark`` of the cap.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None,
+                 low_watermark: float = 0.9):
+        self.path = path or os.getenv("CACHE_DISK_PATH", "./cache/ai_cache.sqlite3")
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv("CACHE_DISK_MAX_BYTES", str(2 * 1024 ** 3))
+        )
+        self.low_watermark = low_watermark
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+        logger.info(f"✅ Disk cache ready at {self.path} (cap {self.max_bytes / 1024 ** 2:.0f} MB)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # one connection per (process, thread); forked workers must not share handles
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the stored bytes, or None if missing/expired."""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= now:
+            conn.execute("DELETE FROM entries WHERE key = ? AND expires_at <= ?", (key, now))
+            return None
+        conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """Stored bytes for the keys that are present and unexpired, in one query per 500 keys."""
+        conn = self._connect()
+        now = time.time()
+        found: Dict[str, bytes] = {}
+        for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            batch = keys[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            found.update(conn.execute(
+                f"SELECT key, value FROM entries WHERE key IN ({marks}) AND expires_at > ?", (*batch, now)
+            ).fetchall())
+            conn.execute(f"UPDATE entries SET accessed_at = ? WHERE key IN ({marks})", (now, *batch))
+        return found
+
+    def ttl(self, key: str) -> Optional[float]:
+        """Seconds until expiry, or None if missing/expired."""
+        row = self._connect().execute("SELECT expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        remaining = row[0] - time.time()
+        return remaining if remaining > 0 else None
+
+    def set(self, key: str, value: bytes, ttl: int = 3600):
+        """Store bytes under key for ttl seconds, evicting if over capacity."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+            "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+            (key, sqlite3.Binary(value), len(value), now + ttl, now),
+        )
+        if self.total_bytes() > self.max_bytes:
+            self.evict()
+
+    def set_many(self, items: Dict[str, bytes], ttl: int = 3600):
+        """Store several entries in one transaction."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                [(key, sqlite3.Binary(value), len(value), now + ttl, now) for key, value in items.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if self.total_bytes() > self.max_bytes:
+            self.evict()
+
+    def delete(self, key: str):
+        self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM entries")
+
+    def total_bytes(self) -> int:
+        return self._connect().execute("SELECT total_bytes FROM stats WHERE id = 0").fetchone()[0]
+
+    def evict(self):
+        """Drop expired entries, then least recently accessed ones down to the low watermark."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+            target = int(self.max_bytes * self.low_watermark)
+            total = conn.execute("SELECT total_bytes FROM stats WHERE id = 0").fetchone()[0]
+            if total > target:
+                # walk oldest-first and cut at the running sum that frees enough
+                excess = total - target
+                freed, victims = 0, []
+                for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+                    victims.append((key,))
+                    freed += size
+                    if freed >= excess:
+                        break
+                conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+                logger.info(f"🧹 Disk cache evicted {len(victims)} entries ({freed / 1024 ** 2:.1f} MB)")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        count = self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+        }
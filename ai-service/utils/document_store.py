@@ -0,0 +1,68 @@
+"""Local store of extracted document text, keyed by content digest
+
+Lets clients upload or register a document once and then refer to it by
+``document_id`` in generation requests instead of re-sending several MB of
+text each time. Uploads use the SHA-256 of the file bytes (the digest returned
+by /upload/document); text registered directly uses the SHA-256 of the text.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .cache_codecs import CacheCodec
+from .disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_TTL = int(os.getenv("DOCUMENT_TTL", str(90 * 24 * 3600)))
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DocumentStore:
+    """Compressed text on disk (SQLite) with a small in-memory LRU of hot documents."""
+
+    def __init__(self, disk: Optional[DiskCache] = None, max_memory_items: Optional[int] = None):
+        self.disk = disk or DiskCache(
+            path=os.getenv("DOCUMENT_STORE_PATH", "./cache/documents.sqlite3"),
+            max_bytes=int(os.getenv("DOCUMENT_STORE_MAX_BYTES", str(2 * 1024 ** 3))),
+        )
+        self.codec = CacheCodec(codec="json", compress_min_bytes=0)
+        self.max_memory_items = max_memory_items or int(os.getenv("DOCUMENT_MEMORY_ITEMS", "16"))
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, document_id: str, text: str):
+        with self._lock:
+            self._memory[document_id] = text
+            self._memory.move_to_end(document_id)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def put(self, text: str, document_id: Optional[str] = None) -> str:
+        """Store text (under document_id, default: its SHA-256) and return the id."""
+        document_id = document_id or text_digest(text)
+        self.disk.set(f"doc:{document_id}", self.codec.dumps(text), DOCUMENT_TTL)
+        self._remember(document_id, text)
+        return document_id
+
+    def get(self, document_id: str) -> Optional[str]:
+        with self._lock:
+            text = self._memory.get(document_id)
+            if text is not None:
+                self._memory.move_to_end(document_id)
+                return text
+        data = self.disk.get(f"doc:{document_id}")
+        if data is None:
+            return None
+        text = self.codec.loads(data)
+        self._remember(document_id, text)
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memory_items": len(self._memory), **self.disk.stats()}
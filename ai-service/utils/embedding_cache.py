@@ -0,0 +1,109 @@
+"""Embedding cache keyed by chunk content
+
+Chunk embeddings depend only on the model and the chunk text, so they are
+stored once per (model, SHA-256 of the text) and reused when a document is
+re-indexed, re-uploaded under another id, or shares chunks with another
+document. Vectors are stored as raw float32 bytes in a SQLite DiskCache.
+
+Search queries are short and repeat across students ("what is osmosis"), so
+their embeddings are kept in a small in-process LRU keyed by the normalized
+query text.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from .disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", str(90 * 24 * 3600)))
+QUERY_CACHE_ITEMS = int(os.getenv("QUERY_CACHE_ITEMS", "4096"))
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Chunk text -> float32 vector, persisted across restarts and shared by worker processes."""
+
+    def __init__(self, model_name: str, disk: Optional[DiskCache] = None):
+        self.model_name = model_name
+        self.disk = disk or DiskCache(
+            path=os.getenv("EMBED_CACHE_PATH", "./cache/embeddings.sqlite3"),
+            max_bytes=int(os.getenv("EMBED_CACHE_MAX_BYTES", str(1024 ** 3))),
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, digest: str) -> str:
+        return f"emb:{self.model_name}:{digest}"
+
+    def embed(self, texts: List[str], encode: Callable[[List[str]], np.ndarray],
+              digests: Optional[List[str]] = None) -> np.ndarray:
+        """Vectors for texts; only the ones not cached yet go through encode (in one call)."""
+        digests = digests or [chunk_hash(t) for t in texts]
+        keys = [self._key(d) for d in digests]
+        found = self.disk.get_many(list(set(keys)))
+        missing = list({key: text for key, text in zip(keys, texts) if key not in found}.items())
+        self.hits += len(texts) - sum(1 for key in keys if key not in found)
+        self.misses += len(missing)
+        if missing:
+            vectors = np.asarray(encode([text for _, text in missing]), dtype=np.float32)
+            fresh = {key: vector.tobytes() for (key, _), vector in zip(missing, vectors)}
+            self.disk.set_many(fresh, EMBED_CACHE_TTL)
+            found.update(fresh)
+        return np.stack([np.frombuffer(found[key], dtype=np.float32) for key in keys])
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def normalize_query(query: str) -> str:
+    # the embedding model is uncased, so case and spacing do not change the vector
+    return " ".join(query.lower().split())
+
+
+class QueryEmbeddingCache:
+    """In-memory LRU of query embeddings keyed by normalized query text."""
+
+    def __init__(self, max_items: int = QUERY_CACHE_ITEMS):
+        self.max_items = max_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, queries: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Vectors for queries; the ones not cached go through encode in one call."""
+        keys = [normalize_query(q) for q in queries]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+        missing = list({key: query for key, query in zip(keys, queries) if key not in found}.items())
+        self.hits += len(keys) - sum(1 for key in keys if key not in found)
+        self.misses += len(missing)
+        if missing:
+            vectors = np.asarray(encode([query for _, query in missing]), dtype=np.float32)
+            with self._lock:
+                for (key, _), vector in zip(missing, vectors):
+                    found[key] = self._memory[key] = vector
+                    self._memory.move_to_end(key)
+                while len(self._memory) > self.max_items:
+                    self._memory.popitem(last=False)
+        return np.stack([found[key] for key in keys])
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"items": len(self._memory), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
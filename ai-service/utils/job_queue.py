@@ -0,0 +1,177 @@
+"""Persistent job queue for long-running document generation
+
+Jobs live in a local SQLite database (WAL mode), so queued work and finished
+results survive a restart and are visible to every worker process on the
+host. A worker claims jobs atomically; jobs left "running" by a process that
+no longer exists are re-queued on startup. Workers are identified by host, pid
+and a random per-process instance id, so a restarted service that gets the
+same pid (PID 1 in a container) still recognizes its predecessor's jobs.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    task        TEXT NOT NULL,
+    payload     TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    progress    REAL NOT NULL DEFAULT 0,
+    stage       TEXT,
+    result      TEXT,
+    error       TEXT,
+    worker      TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+"""
+
+
+def _new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class JobQueue:
+    """SQLite-backed job store with atomic claiming."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("JOBS_DB_PATH", "./cache/jobs.sqlite3")
+        self.worker_id = _new_worker_id()
+        self._pid = os.getpid()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        # worker id must follow forks
+        if self._pid != os.getpid():
+            self.worker_id, self._pid = _new_worker_id(), os.getpid()
+        return conn
+
+    def submit(self, task: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, task, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, task, json.dumps(payload), QUEUED, now, now),
+        )
+        return job_id
+
+    def get(self, job_id: str, include_result: bool = True) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "id": row["id"],
+            "task": row["task"],
+            "status": row["status"],
+            "progress": row["progress"],
+            "stage": row["stage"],
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+        if include_result and row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        return job
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job to running and return it with its payload."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, task, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, stage = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, self.worker_id, "started", time.time(), row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {"id": row["id"], "task": row["task"], "payload": json.loads(row["payload"])}
+
+    def update_progress(self, job_id: str, progress: float, stage: Optional[str] = None):
+        self._connect().execute(
+            "UPDATE jobs SET progress = ?, stage = COALESCE(?, stage), updated_at = ? WHERE id = ? AND status = ?",
+            (max(0.0, min(1.0, progress)), stage, time.time(), job_id, RUNNING),
+        )
+
+    def complete(self, job_id: str, result: Any):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, progress = 1, stage = ?, result = ?, updated_at = ? WHERE id = ?",
+            (DONE, "done", json.dumps(result), time.time(), job_id),
+        )
+
+    def fail(self, job_id: str, error: str):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, stage = ?, error = ?, updated_at = ? WHERE id = ?",
+            (FAILED, "failed", error, time.time(), job_id),
+        )
+
+    def requeue_orphans(self) -> int:
+        """
+        Re-queue running jobs whose worker process on this host is gone: its pid is
+        dead, or it is this process's pid under another instance id (a previous run
+        of a restarted service). Call before this process claims any job.
+        """
+        conn = self._connect()
+        host, own_pid = socket.gethostname(), str(os.getpid())
+        orphans = []
+        for row in conn.execute("SELECT id, worker FROM jobs WHERE status = ?", (RUNNING,)).fetchall():
+            worker = row["worker"] or ""
+            worker_host, pid = (worker.split(":") + ["", ""])[:2]  # host:pid[:instance]
+            if worker_host != host or not pid.isdigit() or worker == self.worker_id:
+                continue
+            if pid == own_pid or not _pid_alive(int(pid)):
+                orphans.append((QUEUED, "requeued", time.time(), row["id"]))
+        conn.executemany(
+            "UPDATE jobs SET status = ?, stage = ?, progress = 0, worker = NULL, updated_at = ? WHERE id = ?",
+            orphans,
+        )
+        if orphans:
+            logger.info(f"🔁 Re-queued {len(orphans)} interrupted job(s)")
+        return len(orphans)
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
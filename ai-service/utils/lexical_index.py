@@ -0,0 +1,216 @@
+"""BM25 inverted index over the vector store's chunks
+
+Dense retrieval misses queries that hinge on an exact course term, a formula
+or an acronym ("ATP", "PV = nRT", "O(n log n)"). This index keeps postings
+(term, chunk, term frequency) for every chunk VectorDB stores, maintained
+incrementally as chunks are added, re-numbered and removed, and scores queries
+with Okapi BM25. VectorDB.search fuses its ranking with the dense one.
+
+Chunks are stored with their text and metadata, so lexical hits need no round
+trip to the vector backend and accept the same ``where`` filters (compiled to
+SQL over the metadata JSON). Document frequencies and corpus totals are kept in
+their own tables, so a query reads only the postings of its own terms. Lives in
+SQLite (WAL) so every worker process shares it.
+"""
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with".split()
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id    TEXT PRIMARY KEY,
+    document_id TEXT NOT NULL,
+    length      INTEGER NOT NULL,
+    text        TEXT NOT NULL,
+    metadata    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_document ON chunks (document_id);
+CREATE TABLE IF NOT EXISTS postings (
+    term     TEXT NOT NULL,
+    chunk_id TEXT NOT NULL,
+    tf       INTEGER NOT NULL,
+    PRIMARY KEY (term, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), chunks INTEGER NOT NULL, tokens INTEGER NOT NULL);
+INSERT OR IGNORE INTO totals (id, chunks, tokens) VALUES (0, 0, 0);
+"""
+
+_SQL_COMPARE = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+Hit = Dict[str, Any]  # {"id", "text", "metadata", "score"}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens without stopwords; digits and identifiers ("h2o", "n_log_n") stay whole."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _where_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Chroma-style where filter as a SQL condition over chunks.metadata."""
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_sql(sub) for sub in condition]
+            clauses.append("(" + (" AND " if key == "$and" else " OR ").join(sql for sql, _ in parts) + ")")
+            params += [p for _, sub_params in parts for p in sub_params]
+            continue
+        column = f"json_extract(c.metadata, '$.\"{key.replace(chr(34), '')}\"')"
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, value in condition.items():
+            if op in _SQL_COMPARE:
+                clauses.append(f"{column} {_SQL_COMPARE[op]} ?")
+                params.append(value)
+            elif op in ("$in", "$nin"):
+                negate = "NOT " if op == "$nin" else ""
+                clauses.append(f"{column} {negate}IN ({','.join('?' * len(value))})" if value else
+                               ("1" if negate else "0"))
+                params += list(value)
+            else:
+                raise ValueError(f"Unsupported filter operator '{op}'")
+    return " AND ".join(clauses) or "1", params
+
+
+class BM25Index:
+    """Persistent inverted index with BM25 scoring; see the module docstring."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("LEXICAL_INDEX_PATH", "./cache/lexical_index.sqlite3")
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _remove(self, conn: sqlite3.Connection, chunk_ids: Sequence[str]):
+        for i in range(0, len(chunk_ids), 500):  # stay under SQLite's bound-parameter limit
+            batch = list(chunk_ids[i:i + 500])
+            marks = ",".join("?" * len(batch))
+            df = Counter(term for (term,) in conn.execute(f"SELECT term FROM postings WHERE chunk_id IN ({marks})", batch))
+            conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, term) for term, n in df.items()])
+            conn.executemany("DELETE FROM terms WHERE term = ? AND df <= 0", [(term,) for term in df])
+            count, tokens = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE chunk_id IN ({marks})", batch
+            ).fetchone()
+            conn.execute("UPDATE totals SET chunks = chunks - ?, tokens = tokens - ? WHERE id = 0", (count, tokens))
+            conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", batch)
+            conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", batch)
+
+    def add(self, chunk_ids: Sequence[str], texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]):
+        """Index chunks (replacing any already stored under the same ids) in one transaction."""
+        chunks, postings, df = [], [], Counter()
+        for chunk_id, text, metadata in zip(chunk_ids, texts, metadatas):
+            tf = Counter(tokenize(text))
+            chunks.append((chunk_id, metadata.get("document_id", ""), sum(tf.values()), text, json.dumps(metadata)))
+            postings += [(term, chunk_id, n) for term, n in tf.items()]
+            df.update(tf.keys())
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._remove(conn, chunk_ids)
+            conn.executemany("INSERT INTO chunks (chunk_id, document_id, length, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                             chunks)
+            conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+            conn.executemany("INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT (term) DO UPDATE SET df = df + excluded.df",
+                             df.items())
+            conn.execute("UPDATE totals SET chunks = chunks + ?, tokens = tokens + ? WHERE id = 0",
+                         (len(chunks), sum(c[2] for c in chunks)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update_metadata(self, chunk_ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]):
+        # document_id is denormalized from the metadata for remove_document: keep both in step
+        self._connect().executemany("UPDATE chunks SET metadata = ?, document_id = ? WHERE chunk_id = ?",
+                                    [(json.dumps(m), m.get("document_id", ""), chunk_id)
+                                     for chunk_id, m in zip(chunk_ids, metadatas)])
+
+    def remove(self, chunk_ids: Sequence[str]):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._remove(conn, chunk_ids)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remove_document(self, document_id: str) -> int:
+        chunk_ids = [c for (c,) in self._connect().execute("SELECT chunk_id FROM chunks WHERE document_id = ?",
+                                                           (document_id,))]
+        if chunk_ids:
+            self.remove(chunk_ids)
+        return len(chunk_ids)
+
+    def search(self, query: str, n_results: int, where: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """Top chunks by BM25 score for the query's terms, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        conn = self._connect()
+        total_chunks, total_tokens = conn.execute("SELECT chunks, tokens FROM totals WHERE id = 0").fetchone()
+        if not total_chunks:
+            return []
+        marks = ",".join("?" * len(terms))
+        idf = {
+            term: math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+            for term, df in conn.execute(f"SELECT term, df FROM terms WHERE term IN ({marks})", terms)
+        }
+        if not idf:
+            return []
+        avg_length = total_tokens / total_chunks
+        condition, params = _where_sql(where or {})
+        scores: Dict[str, float] = {}
+        for term, chunk_id, tf, length in conn.execute(
+            f"SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+            f"WHERE p.term IN ({','.join('?' * len(idf))}) AND {condition}",
+            list(idf) + params,
+        ):
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf[term] * tf * (BM25_K1 + 1) / norm
+        top = sorted(scores, key=scores.get, reverse=True)[:n_results]
+        if not top:
+            return []
+        rows = {
+            chunk_id: (text, metadata)
+            for chunk_id, text, metadata in conn.execute(
+                f"SELECT chunk_id, text, metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(top))})", top
+            )
+        }
+        return [{"id": c, "text": rows[c][0], "metadata": json.loads(rows[c][1]), "score": scores[c]}
+                for c in top if c in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        chunks, tokens = conn.execute("SELECT chunks, tokens FROM totals WHERE id = 0").fetchone()
+        terms = conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+        return {"chunks": chunks, "tokens": tokens, "terms": terms}
@@ -0,0 +1,271 @@
+"""Near-duplicate documents and pages (MinHash signatures in an LSH index)
+
+The same slides exported twice, or a revision with a few changed pages, never
+hash the same as the original, so every upload used to get a full LLM pass.
+Each stored page gets a MinHash signature (word 3-gram shingles); signatures
+are bucketed by band (LSH) so a lookup touches only the few pages that share a
+band, not the whole collection. A document's signature is the element-wise
+minimum of its page signatures, which is exactly the MinHash of its shingle
+union, so document matches come for free.
+
+PageLinker records, for each incoming page, the stored page it nearly matches
+(estimated Jaccard similarity >= NEAR_DUP_PAGE_THRESHOLD) and whether the two
+are byte-identical. The incoming text is never changed: a near match may be a
+one-word correction, or another user's document. Identical pages produce the
+same chunks as the original anyway, so their map outputs (and, for an
+unchanged document, whole results) are served from the cache.
+
+Signatures persist in SQLite (WAL) so every worker process shares them; each
+process loads rows it has not seen yet before linking a new document.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16             # 16 bands x 4 rows: pages above ~0.5 similarity become candidates
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+MIN_PAGE_WORDS = 12    # title/blank slides are too short to compare safely
+PAGE_THRESHOLD = float(os.getenv("NEAR_DUP_PAGE_THRESHOLD", "0.95"))
+DOC_THRESHOLD = float(os.getenv("NEAR_DUP_DOC_THRESHOLD", "0.7"))
+DOCUMENT_PAGE = 0      # page number under which the whole-document signature is stored
+
+# a*x + b mod p with p < 2**32: values stay in uint32 and the products in uint64
+_PRIME = np.uint64(4294967291)
+_rng = np.random.RandomState(0x5EED)  # fixed: signatures are persisted
+_A = _rng.randint(1, int(_PRIME), NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, int(_PRIME), NUM_PERM, dtype=np.uint64)
+_MIX = np.uint64(0x01000193)  # FNV prime
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+_WORD = re.compile(r"\w+")
+_PAGE_MARKER = re.compile(r"^\[Page \d+\]$", re.MULTILINE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    document_id TEXT NOT NULL,
+    page        INTEGER NOT NULL,
+    signature   BLOB NOT NULL,
+    UNIQUE (document_id, page)
+);
+"""
+
+Key = Tuple[str, int]  # (document_id, page number; DOCUMENT_PAGE for the whole document)
+
+
+def split_pages(content: str) -> List[str]:
+    """Split "[Page N]" text into pages (any preamble joins page 1)."""
+    starts = [m.start() for m in _PAGE_MARKER.finditer(content)]
+    if not starts:
+        return [content] if content.strip() else []
+    starts[0] = 0
+    bounds = starts + [len(content)]
+    return [content[a:b].strip() for a, b in zip(bounds, bounds[1:])]
+
+
+def _marker_and_body(page: str) -> Tuple[str, str]:
+    first, _, rest = page.partition("\n")
+    if _PAGE_MARKER.match(first):
+        return first, rest
+    return "", page
+
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """MinHash signature (NUM_PERM uint32) of the text's word 3-grams; None for very short text."""
+    words = _WORD.findall(text.lower())
+    if len(words) < MIN_PAGE_WORDS:
+        return None
+    # hash each word once, then mix each run of SHINGLE_WORDS word hashes into a 32-bit shingle hash
+    word_hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    n = len(words) - SHINGLE_WORDS + 1
+    hashes = word_hashes[:n].copy()
+    for offset in range(1, SHINGLE_WORDS):
+        hashes = (hashes * _MIX + word_hashes[offset:offset + n]) & _MASK32
+    hashes = np.unique(hashes)
+    return ((hashes[:, None] * _A + _B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class NearDuplicateIndex:
+    """In-memory LSH over persisted page and document signatures."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("NEAR_DUP_PATH", "./cache/near_duplicates.sqlite3")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._signatures: Dict[Key, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, Set[Key]]] = [{} for _ in range(BANDS)]
+        self._seq = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+        self.sync()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _insert(self, key: Key, sig: np.ndarray):
+        # a replaced signature leaves its old bucket entries behind; lookups verify against
+        # the current signature, so they only cost a comparison
+        self._signatures[key] = sig
+        for band in range(BANDS):
+            self._buckets[band].setdefault(sig[band * ROWS:(band + 1) * ROWS].tobytes(), set()).add(key)
+
+    def sync(self) -> int:
+        """Load signatures added (by any process) since the last sync; returns how many."""
+        rows = self._connect().execute(
+            "SELECT seq, document_id, page, signature FROM signatures WHERE seq > ? ORDER BY seq", (self._seq,)
+        ).fetchall()
+        with self._lock:
+            for seq, document_id, page, blob in rows:
+                self._seq = max(self._seq, seq)
+                if len(blob) == NUM_PERM * 4:  # rows written with another NUM_PERM are ignored
+                    self._insert((document_id, page), np.frombuffer(blob, dtype=np.uint32))
+        return len(rows)
+
+    def add(self, document_id: str, page_signatures: Iterable[Optional[np.ndarray]]):
+        """Index a document's pages (1-based, in order; None for pages too short to index)."""
+        entries = [(document_id, n, sig) for n, sig in enumerate(page_signatures, start=1) if sig is not None]
+        if not entries:
+            return
+        entries.append((document_id, DOCUMENT_PAGE, np.minimum.reduce([sig for _, _, sig in entries])))
+        self.remove(document_id)  # a re-indexed document may have fewer pages now
+        self._connect().executemany(
+            "INSERT OR REPLACE INTO signatures (document_id, page, signature) VALUES (?, ?, ?)",
+            [(d, n, sig.astype(np.uint32).tobytes()) for d, n, sig in entries],
+        )
+        self.sync()
+
+    def query(self, sig: np.ndarray, threshold: float, documents: bool = False,
+              exclude: Optional[str] = None) -> Optional[Tuple[Key, float]]:
+        """Best indexed page (or document) with estimated similarity >= threshold."""
+        with self._lock:
+            candidates: Set[Key] = set()
+            for band in range(BANDS):
+                candidates.update(self._buckets[band].get(sig[band * ROWS:(band + 1) * ROWS].tobytes(), ()))
+            best: Optional[Tuple[Key, float]] = None
+            for key in candidates:
+                if (key[1] == DOCUMENT_PAGE) != documents or key[0] == exclude:
+                    continue
+                stored = self._signatures.get(key)  # None once removed
+                if stored is None:
+                    continue
+                score = similarity(sig, stored)
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (key, score)
+            return best
+
+    def remove(self, document_id: str):
+        self._connect().execute("DELETE FROM signatures WHERE document_id = ?", (document_id,))
+        with self._lock:
+            for key in [k for k in self._signatures if k[0] == document_id]:
+                del self._signatures[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            documents = sum(1 for _, page in self._signatures if page == DOCUMENT_PAGE)
+            return {"documents": documents, "pages": len(self._signatures) - documents}
+
+
+class PageLinker:
+    """
+    Links one incoming document's pages to near-identical stored pages.
+
+    fetch(document_id) returns a stored document's text (None once it is gone);
+    each matched document is fetched once. Call page() for every page in order,
+    then index_as() to add the document under its id.
+    """
+
+    def __init__(self, index: NearDuplicateIndex, fetch: Callable[[str], Optional[str]],
+                 document_id: Optional[str] = None):
+        self.index = index
+        self.fetch = fetch
+        self.document_id = document_id
+        self.signatures: List[Optional[np.ndarray]] = []
+        self.links: List[Dict[str, Any]] = []  # {"page", "document_id", "stored_page", "similarity", "identical"}
+        self._documents: Dict[str, Optional[List[str]]] = {}
+        index.sync()
+
+    def _stored_page(self, document_id: str, page: int) -> Optional[str]:
+        if document_id not in self._documents:
+            text = self.fetch(document_id)
+            if text is None:
+                self.index.remove(document_id)  # expired from the document store
+            self._documents[document_id] = split_pages(text) if text is not None else None
+        pages = self._documents[document_id]
+        return pages[page - 1] if pages and page <= len(pages) else None
+
+    def page(self, page: str) -> str:
+        """Record the stored page this one nearly matches, if any; returns the page unchanged."""
+        _, body = _marker_and_body(page)
+        sig = signature(body)
+        self.signatures.append(sig)
+        if sig is None:
+            return page
+        match = self.index.query(sig, PAGE_THRESHOLD, exclude=self.document_id)
+        if match is None:
+            return page
+        (document_id, number), score = match
+        stored = self._stored_page(document_id, number)
+        if stored is None:
+            return page
+        self.links.append({"page": len(self.signatures), "document_id": document_id, "stored_page": number,
+                           "similarity": round(score, 3), "identical": _marker_and_body(stored)[1].strip() == body.strip()})
+        return page
+
+    @property
+    def linked_pages(self) -> int:
+        return len(self.links)
+
+    @property
+    def identical_pages(self) -> int:
+        return sum(1 for link in self.links if link["identical"])
+
+    def document_match(self) -> Optional[Dict[str, Any]]:
+        """The stored document this one nearly duplicates as a whole, if any."""
+        sigs = [s for s in self.signatures if s is not None]
+        if not sigs:
+            return None
+        match = self.index.query(np.minimum.reduce(sigs), DOC_THRESHOLD, documents=True, exclude=self.document_id)
+        if match is None:
+            return None
+        (document_id, _), score = match
+        return {"document_id": document_id, "similarity": round(score, 3)}
+
+    def report(self) -> Dict[str, Any]:
+        """Server-side report: names the matched document, which may belong to another uploader."""
+        return {"near_duplicate_of": self.document_match(), "linked_pages": self.linked_pages,
+                "identical_pages": self.identical_pages, "pages": len(self.signatures)}
+
+    def index_as(self, document_id: str):
+        self.index.add(document_id, self.signatures)
+
+
+def public_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """A report safe to return to the uploader: counts and similarity, never another document's id."""
+    match = report["near_duplicate_of"]
+    return {"near_duplicate": match is not None, "similarity": match["similarity"] if match else None,
+            "linked_pages": report["linked_pages"], "identical_pages": report["identical_pages"],
+            "pages": report["pages"]}
@@ -0,0 +1,141 @@
+"""Single-flight coalescing of identical in-flight requests
+
+Identical generation requests (same cache key) attach to the job already
+running instead of starting a second multi-minute generation on the model.
+Plain calls share the leader's result (or exception); streams are broadcast,
+so a late joiner first replays everything emitted so far and then follows
+the live stream.
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Union
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+# the event loop only keeps weak references to tasks: hold every stream producer until it finishes
+_producers: Set[asyncio.Future] = set()
+
+
+def _reap(task: asyncio.Future):
+    _producers.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"❌ Stream producer failed: {task.exception()}", exc_info=task.exception())
+
+
+class _Broadcast:
+    """Append-only event log that any number of subscribers can follow."""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Future] = None
+        self._cond = asyncio.Condition()
+
+    async def publish(self, item: Any):
+        async with self._cond:
+            self.items.append(item)
+            self._cond.notify_all()
+
+    async def close(self, error: Optional[BaseException] = None):
+        async with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        i = 0
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: i < len(self.items) or self.done)
+                batch = self.items[i:]
+                done, error = self.done, self.error
+            i += len(batch)
+            for item in batch:
+                yield item
+            if done and i >= len(self.items):
+                if error is not None:
+                    raise error
+                return
+
+
+async def _aiter(source: Union[AsyncIterator[Any], Iterable[Any]]) -> AsyncIterator[Any]:
+    """Iterate async sources directly; advance blocking sync generators in a worker thread."""
+    if hasattr(source, "__aiter__"):
+        async for item in source:
+            yield item
+        return
+    it = iter(source)
+    while True:
+        item = await asyncio.to_thread(next, it, _END)
+        if item is _END:
+            return
+        yield item
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.metrics = {
+            "calls": 0,
+            "coalesced": 0,
+            "streams": 0,
+            "streams_coalesced": 0,
+        }
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._streams)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn once per key at a time; concurrent callers get the same result."""
+        task = self._calls.get(key)
+        if task is not None:
+            self.metrics["coalesced"] += 1
+            logger.info(f"🔗 Coalesced request onto in-flight job {key[:24]}...")
+        else:
+            self.metrics["calls"] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _t, k=key: self._calls.pop(k, None))
+        # shield: a caller that disconnects must not cancel the job for the others
+        return await asyncio.shield(task)
+
+    def stream(self, key: str, factory: Callable[[], Union[AsyncIterator[Any], Iterable[Any]]]) -> AsyncIterator[Any]:
+        """Subscribe to the stream for key, starting it with factory() if none is running."""
+        broadcast = self._streams.get(key)
+        if broadcast is not None:
+            self.metrics["streams_coalesced"] += 1
+            logger.info(f"🔗 Coalesced stream onto in-flight job {key[:24]}...")
+            return broadcast.subscribe()
+
+        self.metrics["streams"] += 1
+        broadcast = _Broadcast()
+        self._streams[key] = broadcast
+
+        async def produce():
+            error: Optional[BaseException] = None
+            try:
+                async for item in _aiter(factory()):
+                    await broadcast.publish(item)
+            except asyncio.CancelledError:
+                error = RuntimeError("Stream was cancelled")
+                raise
+            except Exception as e:
+                error = e
+            finally:
+                # always close, even when cancelled, so subscribers never wait forever
+                self._streams.pop(key, None)
+                await broadcast.close(error)
+
+        broadcast.task = asyncio.ensure_future(produce())
+        _producers.add(broadcast.task)
+        broadcast.task.add_done_callback(_reap)
+        return broadcast.subscribe()
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.metrics, "in_flight": self.in_flight}
@@ -1,18 +1,19 @@
-"""Vector Database management using ChromaDB"""
+"""Vector Database management (ChromaDB or the built-in NumPy index, see utils.vector_index)"""
+import asyncio
 import logging
 import os
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 import uuid
 
-logger = logging.getLogger(__name__)
+import numpy as np
 
-try:
-    import chromadb
-    from chromadb.config import Settings
-    CHROMA_AVAILABLE = True
-except ImportError:
-    CHROMA_AVAILABLE = False
-    logger.warning("ChromaDB not available")
+from .chunking import Chunk, chunk_document
+from .embedding_cache import EmbeddingCache, QueryEmbeddingCache, chunk_hash
+from .lexical_index import BM25Index
+from .vector_index import CHROMA_AVAILABLE, ChromaIndex, NumpyIndex, VectorIndex
+
+logger = logging.getLogger(__name__)
 
 try:
     from sentence_transformers import SentenceTransformer
@@ -21,111 +22,270 @@ except ImportError:
     ST_AVAILABLE = False
     logger.warning("SentenceTransformers not available")
 
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# > 1: encode large batches in a SentenceTransformer multi-process pool (CPU hosts with many cores)
+EMBED_PROCESSES = int(os.getenv("EMBED_PROCESSES", "0"))
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "1024"))  # chunks per encode + index write round
+EMBED_MODEL = "all-MiniLM-L6-v2"
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))  # target chunk size in embedding-model tokens
+# "chroma" or "numpy" (built in, memory-mapped); defaults to Chroma when it is installed
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma" if CHROMA_AVAILABLE else "numpy")
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float16")  # numpy backend: float16 halves memory, float32 scans faster
+# numpy backend: "int8" or "pq" searches compact codes and re-ranks the shortlist with the full vectors
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+# "dense", "lexical" (BM25) or "hybrid" (both, reciprocal-rank fused)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))  # taken from each ranking before fusion
+RRF_K = 60  # reciprocal-rank fusion constant: score = sum of 1 / (RRF_K + rank)
+
+
 class VectorDB:
     """Vector database for document embeddings"""
     
     def __init__(self):
-        if not CHROMA_AVAILABLE:
-            raise ImportError("ChromaDB is required for vector database functionality")
+        if VECTOR_BACKEND == "chroma" and not CHROMA_AVAILABLE:
+            raise ImportError("ChromaDB is required for VECTOR_BACKEND=chroma")
         
         if not ST_AVAILABLE:
             raise ImportError("SentenceTransformers is required for embeddings")
         
-        # Initialize Chroma client
-        self.persist_directory = os.getenv("CHROMA_DB_PATH", "./chroma_db")
-        self.client = chromadb.PersistentClient(
-            path=self.persist_directory,
-            settings=Settings(anonymized_telemetry=False)
-        )
-        
         # Initialize embedding model
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')  # Lightweight, fast model
+        self.embedding_model = SentenceTransformer(EMBED_MODEL)  # Lightweight, fast model
+        # longer inputs are truncated by the model; leave room for [CLS]/[SEP]
+        self.chunk_tokens = min(CHUNK_TOKENS, self.embedding_model.max_seq_length - 2)
+        self.embedding_cache = None
+        if os.getenv("EMBED_CACHE_ENABLED", "1") == "1":
+            try:
+                self.embedding_cache = EmbeddingCache(EMBED_MODEL)
+            except Exception as e:
+                logger.warning(f"⚠️  Embedding cache unavailable ({e}), embedding every chunk")
+        self.query_cache = QueryEmbeddingCache() if os.getenv("QUERY_CACHE_ENABLED", "1") == "1" else None
+        # encoding runs off the event loop, one batch at a time, on this worker thread
+        self._embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self._encode_pool = None
+        if EMBED_PROCESSES > 1:
+            self._encode_pool = self.embedding_model.start_multi_process_pool(["cpu"] * EMBED_PROCESSES)
+            logger.info(f"🧵 Embedding pool started ({EMBED_PROCESSES} processes)")
         
-        # Create or get collection
-        self.collection = self.client.get_or_create_collection(
-            name="documents",
-            metadata={"hnsw:space": "cosine"}
-        )
+        # Open the index
+        self.index: VectorIndex
+        if VECTOR_BACKEND == "chroma":
+            self.persist_directory = os.getenv("CHROMA_DB_PATH", "./chroma_db")
+            self.index = ChromaIndex(self.persist_directory)
+        elif VECTOR_BACKEND == "numpy":
+            self.persist_directory = os.getenv("VECTOR_INDEX_PATH", "./vector_index")
+            self.index = NumpyIndex(self.persist_directory, self.embedding_model.get_sentence_embedding_dimension(),
+                                    VECTOR_INDEX_DTYPE, VECTOR_QUANTIZATION)
+        else:
+            raise ValueError(f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}' (expected 'chroma' or 'numpy')")
         
-        logger.info("✅ Vector database initialized")
-    
+        self.ingest_batch_chunks = min(INGEST_BATCH_CHUNKS, self.index.max_batch_size)
+
+        # BM25 index over the same chunks, for hybrid search
+        self.lexical_index = None
+        if os.getenv("LEXICAL_INDEX_ENABLED", "1") == "1":
+            try:
+                self.lexical_index = BM25Index()
+            except Exception as e:
+                logger.warning(f"⚠️  Lexical index unavailable ({e}), search is dense only")
+
+        logger.info(f"✅ Vector database initialized ({self.index.name})")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Embed texts as a float32 array (runs on the embedding thread)."""
+        if self._encode_pool is not None and len(texts) >= 4 * EMBED_BATCH_SIZE:
+            return self.embedding_model.encode_multi_process(texts, self._encode_pool, batch_size=EMBED_BATCH_SIZE)
+        return self.embedding_model.encode(texts, batch_size=EMBED_BATCH_SIZE, convert_to_numpy=True,
+                                           show_progress_bar=False)
+
+    async def _embed(self, texts: List[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._embed_executor, self._encode, texts)
+
+    async def _embed_chunks(self, chunks: List[str], digests: Optional[List[str]] = None) -> np.ndarray:
+        """Chunk embeddings, served from the embedding cache where possible."""
+        if self.embedding_cache is None:
+            return await self._embed(chunks)
+        loop = asyncio.get_running_loop()
+        # runs on the embedding thread: cache lookups and the encode of the misses stay in one call
+        return await loop.run_in_executor(self._embed_executor, self.embedding_cache.embed, chunks, self._encode, digests)
+
+    async def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Query embeddings in one batch, served from the query LRU where possible."""
+        if self.query_cache is None:
+            return await self._embed(queries)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._embed_executor, self.query_cache.embed, queries, self._encode)
+
+    def shutdown(self):
+        """Stop the embedding thread and process pool."""
+        if self._encode_pool is not None:
+            self.embedding_model.stop_multi_process_pool(self._encode_pool)
+            self._encode_pool = None
+        self._embed_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _write(self, ids: List[str], embeddings: np.ndarray, chunks: List[str], metadatas: List[Dict[str, Any]]):
+        """Store chunks in the vector index and the lexical index (runs on a worker thread)."""
+        self.index.upsert(ids=ids, embeddings=embeddings, documents=chunks, metadatas=metadatas)
+        if self.lexical_index is not None:
+            self.lexical_index.add(ids, chunks, metadatas)
+
+    def _document_rows(self, document_id: str, text: str, metadata: Dict[str, Any]) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        """
+        (ids, chunks, metadatas) for one document. Ids are derived from the chunk text
+        (its hash, plus an occurrence number for repeats), so an unchanged chunk keeps
+        its id across edits; see update_document.
+        """
+        ids, chunks, metadatas, seen = [], [], [], {}
+        for i, (chunk, page_start, page_end, tokens) in enumerate(self._chunk_document(text)):
+            digest = chunk_hash(chunk)
+            seen[digest] = seen.get(digest, 0) + 1
+            ids.append(f"{document_id}_{digest[:16]}" + (f"_{seen[digest]}" if seen[digest] > 1 else ""))
+            chunks.append(chunk)
+            chunk_metadata = {
+                **metadata,
+                "document_id": document_id,
+                "chunk_index": i,
+                "chunk_hash": digest,
+                "token_count": tokens,
+                "chunk_text": chunk[:100]  # Store first 100 chars for preview
+            }
+            if page_start:  # text without [Page N] markers has no provenance
+                chunk_metadata.update(page_start=page_start, page_end=page_end)
+            metadatas.append(chunk_metadata)
+        return ids, chunks, metadatas
+
+    async def add_documents(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]]) -> int:
+        """
+        Bulk import (document_id, text, metadata) triples; returns the number of chunks added.
+
+        Chunks from consecutive documents are pooled into batches of ingest_batch_chunks,
+        so small documents still embed in full model batches. Each batch is encoded on
+        the embedding thread while the previous one is written to the index, and
+        embeddings go to the index as the encoder's numpy array, without a list round trip.
+        """
+        ids: List[str] = []
+        chunks: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        pending: Optional[asyncio.Future] = None
+        added = 0
+
+        async def flush(n: int):
+            nonlocal pending, added, ids, chunks, metadatas
+            batch_ids, batch_chunks, batch_metadatas = ids[:n], chunks[:n], metadatas[:n]
+            ids, chunks, metadatas = ids[n:], chunks[n:], metadatas[n:]
+            embeddings = await self._embed_chunks(batch_chunks, [m["chunk_hash"] for m in batch_metadatas])
+            if pending is not None:
+                await pending
+            pending = asyncio.ensure_future(asyncio.to_thread(
+                self._write, batch_ids, embeddings, batch_chunks, batch_metadatas
+            ))
+            added += len(batch_ids)
+
+        try:
+            for document_id, text, metadata in documents:
+                doc_ids, doc_chunks, doc_metadatas = self._document_rows(document_id, text, metadata)
+                ids += doc_ids
+                chunks += doc_chunks
+                metadatas += doc_metadatas
+                while len(ids) >= self.ingest_batch_chunks:
+                    await flush(self.ingest_batch_chunks)
+            if ids:
+                await flush(len(ids))
+            if pending is not None:
+                await pending
+        except BaseException:
+            if pending is not None:
+                pending.cancel()
+            raise
+        return added
+
     async def add_document(self, document_id: str, text: str, metadata: Dict[str, Any]) -> bool:
         """Add document chunks to vector database"""
         try:
-            # Split text into chunks (512 characters with overlap)
-            chunks = self._chunk_text(text, chunk_size=512, overlap=50)
-            
-            # Generate embeddings for each chunk
-            embeddings = self.embedding_model.encode(chunks).tolist()
-            
-            # Prepare data for insertion
-            ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
-            metadatas = [
-                {
-                    **metadata,
-                    "chunk_index": i,
-                    "chunk_text": chunk[:100]  # Store first 100 chars for preview
-                }
-                for i, chunk in enumerate(chunks)
-            ]
-            
-            # Add to collection
-            self.collection.add(
-                embeddings=embeddings,
-                documents=chunks,
-                metadatas=metadatas,
-                ids=ids
-            )
-            
-            logger.info(f"Added {len(chunks)} chunks to vector database for document {document_id}")
+            added = await self.add_documents([(document_id, text, metadata)])
+            logger.info(f"Added {added} chunks to vector database for document {document_id}")
             return True
             
         except Exception as e:
             logger.error(f"Error adding document to vector DB: {e}")
             return False
     
-    async def search(self, query: str, n_results: int = 5, filter_metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Search for similar documents"""
+    async def _dense_search(self, queries: List[str], n_results: int, where: Optional[Dict]) -> List[List[Dict[str, Any]]]:
+        query_embeddings = await self._embed_queries(queries)
+        return await asyncio.to_thread(self.index.query, query_embeddings, n_results, where)
+
+    def _lexical_search(self, queries: List[str], n_results: int, where: Optional[Dict]) -> List[List[Dict[str, Any]]]:
+        return [self.lexical_index.search(query, n_results, where) for query in queries]
+
+    @staticmethod
+    def _fuse(dense: List[Dict[str, Any]], lexical: List[Dict[str, Any]], mode: str, n_results: int) -> List[Dict[str, Any]]:
+        fused: Dict[str, Dict[str, Any]] = {}
+        for ranking, field in ((dense, 'similarity'), (lexical, 'bm25')):
+            for rank, hit in enumerate(ranking):
+                entry = fused.setdefault(hit['id'], {
+                    'text': hit['text'], 'metadata': hit['metadata'], 'similarity': None, 'bm25': None, 'score': 0.0
+                })
+                entry[field] = hit['similarity'] if field == 'similarity' else hit['score']
+                entry['score'] += 1 / (RRF_K + rank + 1) if mode == "hybrid" else entry[field]
+        return sorted(fused.values(), key=lambda r: r['score'], reverse=True)[:n_results]
+
+    async def search_many(self, queries: List[str], n_results: int = 5, filter_metadata: Optional[Dict] = None,
+                          mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Results for several queries at once (see search): the queries are embedded
+        in one batch and run as one multi-vector index query.
+        """
         try:
-            # Generate query embedding
-            query_embedding = self.embedding_model.encode(query).tolist()
-            
-            # Search collection
+            if not queries:
+                return []
+            mode = mode or SEARCH_MODE
+            if self.lexical_index is None:
+                mode = "dense"
             where = filter_metadata if filter_metadata else None
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                where=where,
-                include=['documents', 'metadatas', 'distances']
-            )
+            candidates = max(n_results, HYBRID_CANDIDATES) if mode == "hybrid" else n_results
             
-            # Format results
-            formatted_results = []
-            if results['documents'] and len(results['documents'][0]) > 0:
-                for i in range(len(results['documents'][0])):
-                    formatted_results.append({
-                        'text': results['documents'][0][i],
-                        'metadata': results['metadatas'][0][i],
-                        'similarity': 1 - results['distances'][0][i]  # Convert distance to similarity
-                    })
+            # Retrieve (both retrievers concurrently in hybrid mode)
+            dense = lexical = [[] for _ in queries]
+            if mode == "hybrid":
+                dense, lexical = await asyncio.gather(
+                    self._dense_search(queries, candidates, where),
+                    asyncio.to_thread(self._lexical_search, queries, candidates, where),
+                )
+            elif mode == "lexical":
+                lexical = await asyncio.to_thread(self._lexical_search, queries, candidates, where)
+            else:
+                dense = await self._dense_search(queries, candidates, where)
             
-            return formatted_results
+            # Fuse rankings
+            return [self._fuse(d, l, mode, n_results) for d, l in zip(dense, lexical)]
             
         except Exception as e:
             logger.error(f"Error searching vector DB: {e}")
-            return []
+            return [[] for _ in queries]
+
+    async def search(self, query: str, n_results: int = 5, filter_metadata: Optional[Dict] = None,
+                     mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Search for relevant chunks. mode (default SEARCH_MODE) is "dense" (embedding
+        similarity), "lexical" (BM25) or "hybrid": the top HYBRID_CANDIDATES of both
+        rankings merged by reciprocal-rank fusion. Each result has the dense
+        'similarity' and the 'bm25' score (None where that ranking did not return
+        the chunk) and the 'score' it was ranked by.
+        """
+        return (await self.search_many([query], n_results, filter_metadata, mode))[0]
     
     async def delete_document(self, document_id: str) -> bool:
         """Delete all chunks for a document"""
         try:
             # Get all IDs for this document
-            results = self.collection.get(
-                where={"document_id": document_id}
-            )
+            results = await asyncio.to_thread(self.index.get, {"document_id": document_id})
             
             if results['ids']:
-                self.collection.delete(ids=results['ids'])
+                await asyncio.to_thread(self.index.delete, results['ids'])
                 logger.info(f"Deleted {len(results['ids'])} chunks for document {document_id}")
+            if self.lexical_index is not None:
+                await asyncio.to_thread(self.lexical_index.remove_document, document_id)
             
             return True
             
@@ -134,39 +294,74 @@ class VectorDB:
             return False
     
     async def update_document(self, document_id: str, text: str, metadata: Dict[str, Any]) -> bool:
-        """Update document by deleting and re-adding"""
+        """
+        Re-index a document by diffing its chunks against the stored ones: unchanged
+        chunks keep their ids and vectors (only their metadata is refreshed if it
+        changed), new chunks are embedded and upserted, removed chunks are deleted
+        in one call.
+        """
         try:
-            # Delete existing chunks
-            await self.delete_document(document_id)
-            
-            # Add new chunks
-            return await self.add_document(document_id, text, metadata)
-            
+            existing = await asyncio.to_thread(self.index.get, {"document_id": document_id})
+            stored = dict(zip(existing["ids"], existing["metadatas"]))
+            ids, chunks, metadatas = self._document_rows(document_id, text, metadata)
+
+            new = [i for i, chunk_id in enumerate(ids) if chunk_id not in stored]
+            moved = [i for i, chunk_id in enumerate(ids) if chunk_id in stored and stored[chunk_id] != metadatas[i]]
+            removed = list(stored.keys() - set(ids))
+
+            if removed:
+                await asyncio.to_thread(self.index.delete, removed)
+                if self.lexical_index is not None:
+                    await asyncio.to_thread(self.lexical_index.remove, removed)
+            if moved:
+                moved_ids, moved_metadatas = [ids[i] for i in moved], [metadatas[i] for i in moved]
+                await asyncio.to_thread(self.index.update_metadata, moved_ids, moved_metadatas)
+                if self.lexical_index is not None:
+                    await asyncio.to_thread(self.lexical_index.update_metadata, moved_ids, moved_metadatas)
+            if new:
+                embeddings = await self._embed_chunks([chunks[i] for i in new], [metadatas[i]["chunk_hash"] for i in new])
+                await asyncio.to_thread(
+                    self._write, [ids[i] for i in new], embeddings, [chunks[i] for i in new], [metadatas[i] for i in new]
+                )
+            logger.info(f"Updated document {document_id}: {len(new)} new, {len(removed)} removed, "
+                        f"{len(ids) - len(new)} unchanged chunks ({len(moved)} re-numbered)")
+            return True
+
         except Exception as e:
             logger.error(f"Error updating document in vector DB: {e}")
             return False
     
-    def _chunk_text(self, text: str, chunk_size: int = 512, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks"""
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + chunk_size
-            chunk = text[start:end]
-            chunks.append(chunk)
-            
-            # Move start position with overlap
-            start = end - overlap
-        
-        return chunks
+    def _chunk_document(self, text: str) -> List[Chunk]:
+        """(text, page_start, page_end, tokens) chunks sized in the embedding model's tokens; see utils.chunking."""
+        return chunk_document(text, self.embedding_model.tokenizer, self.chunk_tokens)
+
+    def _chunk_text(self, text: str) -> List[str]:
+        """Split text into chunks along sentence and line boundaries"""
+        return [chunk for chunk, _, _, _ in self._chunk_document(text)]
     
+    async def embed_passages(self, text: str) -> Tuple[List[Chunk], np.ndarray]:
+        """
+        A document's chunks, as they are indexed, with their embeddings (from the
+        embedding cache when the document has been indexed); see utils.chunk_selection.
+        """
+        chunks = await asyncio.to_thread(self._chunk_document, text)
+        if not chunks:
+            return [], np.zeros((0, self.embedding_model.get_sentence_embedding_dimension()), dtype=np.float32)
+        texts = [chunk for chunk, _, _, _ in chunks]
+        return chunks, await self._embed_chunks(texts, [chunk_hash(t) for t in texts])
+
+    async def has_document(self, document_id: str) -> bool:
+        """Whether any chunks are stored for the document"""
+        try:
+            return bool((await asyncio.to_thread(self.index.get, {"document_id": document_id}))['ids'])
+        except Exception as e:
+            logger.error(f"Error looking up document in vector DB: {e}")
+            return False
+
     async def get_document_chunks(self, document_id: str) -> List[Dict[str, Any]]:
         """Get all chunks for a specific document"""
         try:
-            results = self.collection.get(
-                where={"document_id": document_id}
-            )
+            results = await asyncio.to_thread(self.index.get, {"document_id": document_id}, True)
             
             chunks = []
             if results['documents']:
@@ -186,13 +381,16 @@ class VectorDB:
     async def health_check(self) -> Dict[str, Any]:
         """Check vector database health"""
         try:
-            count = self.collection.count()
+            count = self.index.count()
             return {
                 "status": "healthy",
-                "database": "chromadb",
-                "collection": "documents",
+                "database": self.index.name,
                 "total_chunks": count,
-                "persist_directory": self.persist_directory
+                "persist_directory": self.persist_directory,
+                "index": self.index.stats(),
+                "lexical_index": self.lexical_index.stats() if self.lexical_index else None,
+                "query_cache": self.query_cache.stats() if self.query_cache else None,
+                "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None
             }
         except Exception as e:
             return {
@@ -0,0 +1,659 @@
+"""Vector index backends for VectorDB
+
+VectorDB talks to its store through VectorIndex: upsert/update/delete rows of
+(id, embedding, document, metadata), fetch rows by metadata filter, and top-k
+cosine search. Filters use Chroma's ``where`` syntax: ``{"key": value}`` or
+``{"key": {"$eq"|"$ne"|"$in"|"$nin"|"$gt"|"$gte"|"$lt"|"$lte": ...}}``,
+combined with ``$and``/``$or``.
+
+Backends:
+- ChromaIndex: the ChromaDB PersistentClient collection used so far (HNSW).
+- NumpyIndex: built in, no extra dependencies. Unit vectors live in a
+  memory-mapped float16 (or float32) matrix and search is a blocked matrix
+  product plus argpartition. Metadata is kept as dictionary-encoded columns
+  (one int32 code array per key, plus a float array for numbers), so filters
+  are vectorized comparisons. Above IVF_MIN_ROWS the rows are partitioned
+  with spherical k-means (IVF) and a query only scans the IVF_NPROBE closest
+  partitions. Ids, documents and metadata are stored in SQLite next to the
+  matrix and only read back for returned rows.
+
+NumpyIndex can also search compact codes instead of the full matrix:
+quantization="int8" (one byte per dimension plus a per-row scale) or "pq"
+(product quantization, PQ_SUBVECTORS bytes per vector; codebooks are trained
+once PQ_MIN_ROWS rows exist and with every IVF re-partition). The best
+RERANK_CANDIDATES by code score are then re-scored with the full vectors,
+which are read from disk for those rows only.
+
+NumpyIndex expects a single writer process, like Chroma's PersistentClient.
+"""
+import importlib.util
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHROMA_AVAILABLE = importlib.util.find_spec("chromadb") is not None
+
+IVF_MIN_ROWS = int(os.getenv("IVF_MIN_ROWS", "20000"))  # partition once the index holds this many rows
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))         # partitions scanned per query
+IVF_RETRAIN_GROWTH = 4                                  # re-partition when the index has grown this much
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+SCAN_BLOCK_ROWS = 32768
+QUANTIZATIONS = ("none", "int8", "pq")
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "48"))   # bytes per vector with quantization="pq"
+PQ_MIN_ROWS = int(os.getenv("PQ_MIN_ROWS", "10000"))    # train the PQ codebooks once the index holds this many rows
+PQ_CENTROIDS = 256                                      # one byte per sub-vector
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "100"))  # code-scored shortlist re-scored with full vectors
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rows (
+    id       TEXT PRIMARY KEY,
+    row      INTEGER NOT NULL UNIQUE,
+    list     INTEGER NOT NULL DEFAULT -1,
+    document TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+_COMPARE = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+
+
+def normalize(vectors: Any) -> np.ndarray:
+    """Rows scaled to unit length as float32 (cosine similarity becomes a dot product)."""
+    x = np.asarray(vectors, dtype=np.float32)
+    if x.ndim == 1:
+        x = x[None, :]
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def _open_matrix(path: str, dtype: np.dtype, shape: tuple) -> np.memmap:
+    """Memory-map path as an array of shape, growing the file if it is smaller."""
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    with open(path, "ab") as f:
+        if f.tell() < size:
+            f.truncate(size)
+    return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+
+def _kmeans(x: np.ndarray, k: int, rng: np.random.Generator, spherical: bool) -> np.ndarray:
+    """k centroids of the rows of x (cosine k-means on unit vectors if spherical, else Euclidean)."""
+    centroids = x[rng.choice(len(x), k, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        if spherical:
+            assign = np.argmax(x @ centroids.T, axis=1)
+        else:
+            assign = np.argmax(2 * x @ centroids.T - (centroids ** 2).sum(axis=1), axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        sizes = np.bincount(assign, minlength=k)
+        empty = sizes == 0
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()))]  # re-seed empty clusters
+        sizes[empty] = 1
+        centroids = normalize(sums) if spherical else sums / sizes[:, None]
+    return centroids
+
+
+class VectorIndex:
+    """Storage and search backend behind VectorDB."""
+
+    name = "base"
+    max_batch_size = 100_000
+
+    def upsert(self, ids: List[str], embeddings: Any, documents: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def get(self, where: Dict[str, Any], include_documents: bool = False) -> Dict[str, Any]:
+        """{"ids", "metadatas", "documents" (None unless requested)} for rows matching where."""
+        raise NotImplementedError
+
+    def query(self, embeddings: Any, n_results: int, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Per query row: up to n_results {"id", "text", "metadata", "similarity"}, best first."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "rows": self.count()}
+
+
+class ChromaIndex(VectorIndex):
+    """ChromaDB collection (HNSW, cosine)."""
+
+    name = "chromadb"
+
+    def __init__(self, path: str):
+        import chromadb
+        from chromadb.config import Settings
+        self.path = path
+        self.client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+        self.collection = self.client.get_or_create_collection(name="documents", metadata={"hnsw:space": "cosine"})
+        # collection writes reject batches above the client's limit
+        self.max_batch_size = getattr(self.client, "get_max_batch_size", lambda: VectorIndex.max_batch_size)()
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update_metadata(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def get(self, where, include_documents=False):
+        results = self.collection.get(where=where, include=["metadatas"] + (["documents"] if include_documents else []))
+        return {"ids": results["ids"], "metadatas": results["metadatas"],
+                "documents": results["documents"] if include_documents else None}
+
+    def query(self, embeddings, n_results, where=None):
+        results = self.collection.query(query_embeddings=embeddings, n_results=n_results, where=where or None,
+                                        include=["documents", "metadatas", "distances"])
+        return [
+            [{"id": i, "text": doc, "metadata": meta, "similarity": 1 - dist}  # cosine distance -> similarity
+             for i, doc, meta, dist in zip(ids, docs, metas, dists)]
+            for ids, docs, metas, dists in zip(results["ids"], results["documents"],
+                                               results["metadatas"], results["distances"])
+        ]
+
+    def count(self):
+        return self.collection.count()
+
+    def stats(self):
+        return {"backend": self.name, "path": self.path, "rows": self.count()}
+
+
+class _Columns:
+    """
+    Metadata as columns: per key an int32 array of dictionary codes (-1: key
+    missing) and a float64 array of numeric values (NaN: not a number).
+    """
+
+    def __init__(self):
+        self.capacity = 0
+        self.codes: Dict[str, np.ndarray] = {}
+        self.numbers: Dict[str, np.ndarray] = {}
+        self.vocab: Dict[str, Dict[Any, int]] = {}
+
+    def grow(self, capacity: int):
+        extra = capacity - self.capacity
+        for key in self.codes:
+            self.codes[key] = np.concatenate([self.codes[key], np.full(extra, -1, np.int32)])
+            self.numbers[key] = np.concatenate([self.numbers[key], np.full(extra, np.nan)])
+        self.capacity = capacity
+
+    @staticmethod
+    def _token(value: Any) -> Any:
+        return type(value).__name__, value  # keeps 1, 1.0, True and "1" apart
+
+    def code(self, key: str, value: Any) -> int:
+        return self.vocab.get(key, {}).get(self._token(value), -2)  # -2 matches nothing
+
+    def clear(self, row: int):
+        for key in self.codes:
+            self.codes[key][row] = -1
+            self.numbers[key][row] = np.nan
+
+    def set(self, row: int, metadata: Dict[str, Any]):
+        self.clear(row)
+        for key, value in metadata.items():
+            if key not in self.codes:
+                self.codes[key] = np.full(self.capacity, -1, np.int32)
+                self.numbers[key] = np.full(self.capacity, np.nan)
+                self.vocab[key] = {}
+            vocab = self.vocab[key]
+            self.codes[key][row] = vocab.setdefault(self._token(value), len(vocab))
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.numbers[key][row] = value
+
+    def mask(self, where: Optional[Dict[str, Any]], n: int) -> Optional[np.ndarray]:
+        """Boolean mask over the first n rows, or None for no filter."""
+        if not where:
+            return None
+        mask = np.ones(n, bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self.mask(sub, n)
+            elif key == "$or":
+                mask &= np.logical_or.reduce([self.mask(sub, n) for sub in condition])
+            else:
+                mask &= self._match(key, condition, n)
+        return mask
+
+    def _match(self, key: str, condition: Any, n: int) -> np.ndarray:
+        if key not in self.codes:
+            return np.zeros(n, bool)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        codes, numbers = self.codes[key][:n], self.numbers[key][:n]
+        mask = np.ones(n, bool)
+        for op, value in condition.items():
+            if op == "$eq":
+                mask &= codes == self.code(key, value)
+            elif op == "$ne":
+                mask &= (codes >= 0) & (codes != self.code(key, value))
+            elif op in ("$in", "$nin"):
+                hit = np.isin(codes, [self.code(key, v) for v in value])
+                mask &= hit if op == "$in" else (codes >= 0) & ~hit
+            elif op in _COMPARE:
+                with np.errstate(invalid="ignore"):
+                    mask &= _COMPARE[op](numbers, value)
+            else:
+                raise ValueError(f"Unsupported filter operator '{op}'")
+        return mask
+
+
+class _Int8Quantizer:
+    """int8 codes with one float32 scale per row: vector ~= code * scale."""
+
+    name = "int8"
+    ready = True
+
+    def __init__(self, path: str, dim: int):
+        self.path, self.dim = path, dim
+        self.bytes_per_vector = dim + 4
+
+    def open(self, capacity: int):
+        self.codes = _open_matrix(os.path.join(self.path, "codes.int8"), np.int8, (capacity, self.dim))
+        self.scales = _open_matrix(os.path.join(self.path, "scales.float32"), np.float32, (capacity,))
+
+    def flush(self):
+        self.codes.flush()
+        self.scales.flush()
+
+    def train(self, sample: np.ndarray):
+        pass  # per-row scales need no training
+
+    def encode(self, rows: np.ndarray, vectors: np.ndarray):
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+        self.codes[rows] = np.rint(vectors / scales[:, None]).astype(np.int8)
+        self.scales[rows] = scales
+
+    def scores(self, queries: np.ndarray, rows: Optional[np.ndarray], n: int) -> np.ndarray:
+        count = n if rows is None else len(rows)
+        scores = np.empty((len(queries), count), np.float32)
+        for start in range(0, count, SCAN_BLOCK_ROWS):
+            stop = min(count, start + SCAN_BLOCK_ROWS)
+            block = slice(start, stop) if rows is None else rows[start:stop]
+            scores[:, start:stop] = (queries @ self.codes[block].astype(np.float32).T) * self.scales[block]
+        return scores
+
+
+class _ProductQuantizer:
+    """
+    Product quantization: each vector is split into m sub-vectors, each stored as
+    the byte index of its nearest of PQ_CENTROIDS sub-space centroids. A query is
+    scored against the codes through per-sub-space lookup tables.
+    """
+
+    name = "pq"
+
+    def __init__(self, path: str, dim: int, m: int = PQ_SUBVECTORS):
+        if dim % m:
+            raise ValueError(f"PQ_SUBVECTORS={m} does not divide the embedding dimension {dim}")
+        self.path, self.dim, self.m = path, dim, m
+        self.bytes_per_vector = m
+        self._codebooks_path = os.path.join(path, "pq_codebooks.npy")
+        self.codebooks: Optional[np.ndarray] = None  # (m, PQ_CENTROIDS, dim // m)
+        if os.path.exists(self._codebooks_path):
+            self.codebooks = np.load(self._codebooks_path)
+
+    @property
+    def ready(self) -> bool:
+        return self.codebooks is not None
+
+    def open(self, capacity: int):
+        self.codes = _open_matrix(os.path.join(self.path, f"codes.pq{self.m}"), np.uint8, (capacity, self.m))
+
+    def flush(self):
+        self.codes.flush()
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors.reshape(len(vectors), self.m, self.dim // self.m)
+
+    def train(self, sample: np.ndarray):
+        rng = np.random.default_rng(0)
+        parts = self._split(sample)
+        self.codebooks = np.stack([_kmeans(np.ascontiguousarray(parts[:, j]), PQ_CENTROIDS, rng, spherical=False)
+                                   for j in range(self.m)])
+        np.save(self._codebooks_path, self.codebooks)
+
+    def encode(self, rows: np.ndarray, vectors: np.ndarray):
+        if self.codebooks is None:
+            return  # encoded once the codebooks are trained
+        parts = self._split(vectors)
+        norms = (self.codebooks ** 2).sum(axis=2)
+        self.codes[rows] = np.stack([np.argmax(2 * parts[:, j] @ self.codebooks[j].T - norms[j], axis=1)
+                                     for j in range(self.m)], axis=1).astype(np.uint8)
+
+    def scores(self, queries: np.ndarray, rows: Optional[np.ndarray], n: int) -> np.ndarray:
+        tables = np.einsum("qjd,jkd->qjk", self._split(queries), self.codebooks)  # query x sub-space x centroid
+        count = n if rows is None else len(rows)
+        scores = np.zeros((len(queries), count), np.float32)
+        for start in range(0, count, SCAN_BLOCK_ROWS):
+            stop = min(count, start + SCAN_BLOCK_ROWS)
+            block = self.codes[start:stop] if rows is None else self.codes[rows[start:stop]]
+            for q, table in enumerate(tables):
+                for j in range(self.m):
+                    scores[q, start:stop] += table[j].take(block[:, j])
+        return scores
+
+
+class NumpyIndex(VectorIndex):
+    """Memory-mapped unit vectors with exact (flat) or IVF top-k search; see the module docstring."""
+
+    name = "numpy"
+
+    def __init__(self, path: str, dim: int, dtype: str = "float16", quantization: str = "none"):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization '{quantization}' (expected one of {QUANTIZATIONS})")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(os.path.join(path, "rows.sqlite3"), timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        if meta and (int(meta["dim"]) != dim or meta["dtype"] != dtype):
+            raise ValueError(f"Vector index at {path} holds {meta['dtype']} x {meta['dim']} vectors, "
+                             f"not {dtype} x {dim}; use another VECTOR_INDEX_PATH")
+        self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [("dim", str(dim)), ("dtype", dtype), ("quantization", quantization)])
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.quantization = quantization
+        self._quantizer = None
+        if quantization == "int8":
+            self._quantizer = _Int8Quantizer(path, dim)
+        elif quantization == "pq":
+            self._quantizer = _ProductQuantizer(path, dim)
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_rows = int(meta.get("trained_rows", 0))
+        self._load()
+        if self._quantizer is not None and not self._quantizer.ready and self.count() >= PQ_MIN_ROWS:
+            self._train_quantizer()
+        elif self._quantizer is not None and meta.get("quantization", "none") != quantization:
+            self._quantize_all()  # codes are derived from the stored vectors
+
+    # ---- storage ----
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, f"vectors.{self.dtype.name}")
+
+    def _open_vectors(self, capacity: int) -> np.memmap:
+        if self._quantizer is not None:
+            self._quantizer.open(capacity)
+        return _open_matrix(self._vectors_path(), self.dtype, (capacity, self.dim))
+
+    def _load(self):
+        t0 = time.time()
+        rows = self._db.execute("SELECT id, row, list, metadata FROM rows").fetchall()
+        self._size = max((row for _, row, _, _ in rows), default=-1) + 1
+        capacity = max(1024, 1 << math.ceil(math.log2(max(1, self._size))))
+        self._vectors = self._open_vectors(capacity)
+        self._alive = np.zeros(capacity, bool)
+        self._lists = np.full(capacity, -1, np.int32)
+        self._columns = _Columns()
+        self._columns.grow(capacity)
+        self._row_of: Dict[str, int] = {}
+        for id_, row, list_, metadata in rows:
+            self._row_of[id_] = row
+            self._alive[row] = True
+            self._lists[row] = list_
+            self._columns.set(row, json.loads(metadata))
+        self._free = [r for r in range(self._size - 1, -1, -1) if not self._alive[r]]
+        centroids_path = os.path.join(self.path, "centroids.npy")
+        if os.path.exists(centroids_path):
+            self._centroids = np.load(centroids_path)
+        if rows:
+            logger.info(f"✅ Vector index loaded: {len(rows)} rows in {time.time() - t0:.1f}s "
+                        f"({'IVF %d lists' % len(self._centroids) if self._centroids is not None else 'flat'})")
+
+    def _grow(self, capacity: int):
+        old = len(self._alive)
+        self._vectors.flush()
+        if self._quantizer is not None:
+            self._quantizer.flush()
+        del self._vectors
+        self._vectors = self._open_vectors(capacity)
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - old, bool)])
+        self._lists = np.concatenate([self._lists, np.full(capacity - old, -1, np.int32)])
+        self._columns.grow(capacity)
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._size == len(self._alive):
+            self._grow(2 * len(self._alive))
+        self._size += 1
+        return self._size - 1
+
+    # ---- writes ----
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        vectors = normalize(embeddings)
+        with self._lock:
+            rows = []
+            for id_ in ids:
+                row = self._row_of.get(id_)
+                if row is None:
+                    row = self._allocate()
+                    self._row_of[id_] = row
+                rows.append(row)
+            rows_arr = np.asarray(rows)
+            self._vectors[rows_arr] = vectors.astype(self.dtype)
+            self._alive[rows_arr] = True
+            if self._centroids is not None:
+                self._lists[rows_arr] = np.argmax(vectors @ self._centroids.T, axis=1)
+            if self._quantizer is not None:
+                self._quantizer.encode(rows_arr, vectors)
+                self._quantizer.flush()
+            for row, metadata in zip(rows, metadatas):
+                self._columns.set(row, metadata)
+            self._vectors.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rows (id, row, list, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(id_, row, int(self._lists[row]), doc, json.dumps(metadata))
+                 for id_, row, doc, metadata in zip(ids, rows, documents, metadatas)],
+            )
+            live = self.count()
+            if live >= IVF_MIN_ROWS and (self._centroids is None or live >= IVF_RETRAIN_GROWTH * self._trained_rows):
+                self.train()
+            elif self._quantizer is not None and not self._quantizer.ready and live >= PQ_MIN_ROWS:
+                self._train_quantizer()
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            known = [(id_, metadata) for id_, metadata in zip(ids, metadatas) if id_ in self._row_of]
+            for id_, metadata in known:
+                self._columns.set(self._row_of[id_], metadata)
+            self._db.executemany("UPDATE rows SET metadata = ? WHERE id = ?",
+                                 [(json.dumps(metadata), id_) for id_, metadata in known])
+
+    def delete(self, ids):
+        with self._lock:
+            for id_ in ids:
+                row = self._row_of.pop(id_, None)
+                if row is None:
+                    continue
+                self._alive[row] = False
+                self._lists[row] = -1
+                self._columns.clear(row)
+                self._free.append(row)
+            self._db.executemany("DELETE FROM rows WHERE id = ?", [(id_,) for id_ in ids])
+
+    def train(self, nlist: Optional[int] = None):
+        """Partition the live rows with spherical k-means (IVF) and assign every row to its closest centroid."""
+        with self._lock:
+            t0 = time.time()
+            live = np.flatnonzero(self._alive[:self._size])
+            nlist = nlist or max(1, int(math.sqrt(len(live))))
+            centroids = _kmeans(self._sample(live, nlist * KMEANS_SAMPLE_PER_LIST), nlist,
+                                np.random.default_rng(0), spherical=True)
+            self._centroids = centroids
+            for start in range(0, self._size, SCAN_BLOCK_ROWS):
+                block = self._vectors[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+                self._lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            self._lists[:self._size][~self._alive[:self._size]] = -1
+            np.save(os.path.join(self.path, "centroids.npy"), centroids)
+            self._trained_rows = len(live)
+            self._db.execute("BEGIN")
+            self._db.executemany("UPDATE rows SET list = ? WHERE row = ?",
+                                 [(int(self._lists[row]), int(row)) for row in live])
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('trained_rows', ?)", (str(len(live)),))
+            self._db.execute("COMMIT")
+            logger.info(f"🧭 Vector index partitioned into {nlist} IVF lists ({len(live)} rows) in {time.time() - t0:.1f}s")
+            if self._quantizer is not None and self.quantization == "pq":
+                self._train_quantizer()  # refresh the codebooks as the corpus grows
+
+    def _sample(self, rows: np.ndarray, size: int) -> np.ndarray:
+        picked = np.random.default_rng(0).choice(rows, min(len(rows), size), replace=False)
+        return self._vectors[np.sort(picked)].astype(np.float32)
+
+    def _quantize_all(self):
+        """(Re-)encode every row from the stored vectors."""
+        for start in range(0, self._size, SCAN_BLOCK_ROWS):
+            stop = min(self._size, start + SCAN_BLOCK_ROWS)
+            self._quantizer.encode(np.arange(start, stop), self._vectors[start:stop].astype(np.float32))
+        self._quantizer.flush()
+
+    def _train_quantizer(self):
+        with self._lock:
+            t0 = time.time()
+            live = np.flatnonzero(self._alive[:self._size])
+            if len(live) < PQ_CENTROIDS:
+                return
+            self._quantizer.train(self._sample(live, PQ_CENTROIDS * KMEANS_SAMPLE_PER_LIST))
+            self._quantize_all()
+            logger.info(f"🗜️  Vector index {self._quantizer.name} codes trained on {len(live)} rows "
+                        f"in {time.time() - t0:.1f}s")
+
+    # ---- reads ----
+
+    def _rows(self, rows: Sequence[int], include_documents: bool) -> Dict[int, tuple]:
+        found: Dict[int, tuple] = {}
+        rows = [int(r) for r in rows]
+        for i in range(0, len(rows), 500):  # stay under SQLite's bound-parameter limit
+            batch = rows[i:i + 500]
+            columns = "row, id, metadata" + (", document" if include_documents else "")
+            for record in self._db.execute(
+                f"SELECT {columns} FROM rows WHERE row IN ({','.join('?' * len(batch))})", batch
+            ):
+                found[record[0]] = record[1:]
+        return found
+
+    def get(self, where, include_documents=False):
+        with self._lock:
+            mask = self._columns.mask(where, self._size)
+            alive = self._alive[:self._size]
+            rows = np.flatnonzero(alive if mask is None else alive & mask)
+            found = self._rows(rows, include_documents)
+        records = [found[int(r)] for r in rows if int(r) in found]
+        return {"ids": [r[0] for r in records], "metadatas": [json.loads(r[1]) for r in records],
+                "documents": [r[2] for r in records] if include_documents else None}
+
+    def _scores(self, queries: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """queries x rows similarity (rows=None: every row up to the high-water mark), scanned in blocks."""
+        n = self._size if rows is None else len(rows)
+        scores = np.empty((len(queries), n), np.float32)
+        for start in range(0, n, SCAN_BLOCK_ROWS):
+            stop = min(n, start + SCAN_BLOCK_ROWS)
+            block = self._vectors[start:stop] if rows is None else self._vectors[rows[start:stop]]
+            scores[:, start:stop] = queries @ block.astype(np.float32).T
+        return scores
+
+    def _nprobe(self, matching: int) -> int:
+        """
+        IVF partitions to scan, or 0 for an exact scan. A filter keeping a fraction
+        of the rows scales IVF_NPROBE up by the inverse fraction, so the probed
+        partitions still hold about as many matching rows as an unfiltered query
+        sees; when that comes to half the partitions, scanning the matching rows
+        directly is cheaper.
+        """
+        if self._centroids is None or matching == 0:
+            return 0
+        nprobe = math.ceil(IVF_NPROBE * self.count() / matching)
+        return 0 if 2 * nprobe >= len(self._centroids) else nprobe
+
+    def query(self, embeddings, n_results, where=None):
+        queries = normalize(embeddings)
+        with self._lock:
+            allowed = self._alive[:self._size].copy()
+            mask = self._columns.mask(where, self._size)
+            if mask is not None:
+                allowed &= mask
+            nprobe = self._nprobe(int(allowed.sum()))
+            if not nprobe:
+                rows = None if mask is None else np.flatnonzero(allowed)  # unfiltered: contiguous scan
+                hits = self._search(queries, rows, n_results, allowed if rows is None else None)
+            else:
+                hits = []
+                probes = np.argpartition(-(queries @ self._centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+                for query, query_probes in zip(queries, probes):
+                    rows = np.flatnonzero(allowed & np.isin(self._lists[:self._size], query_probes))
+                    hits += self._search(query[None, :], rows, n_results, None)
+            found = self._rows({row for query_hits in hits for row, _ in query_hits}, include_documents=True)
+        return [
+            [{"id": found[row][0], "text": found[row][2], "metadata": json.loads(found[row][1]), "similarity": score}
+             for row, score in query_hits if row in found]
+            for query_hits in hits
+        ]
+
+    def _search(self, queries: np.ndarray, rows: Optional[np.ndarray], k: int,
+                allowed: Optional[np.ndarray]) -> List[List[tuple]]:
+        """Top-k (row, score) per query among rows; with quantization, code scores pick a shortlist to re-score."""
+        if self._quantizer is None or not self._quantizer.ready:
+            return [self._top(scores, rows, k, allowed) for scores in self._scores(queries, rows)]
+        hits = []
+        for query, scores in zip(queries, self._quantizer.scores(queries, rows, self._size)):
+            shortlist = np.asarray([row for row, _ in self._top(scores, rows, max(k, RERANK_CANDIDATES), allowed)],
+                                   dtype=np.int64)
+            hits.append(self._top(self._scores(query[None, :], shortlist)[0], shortlist, k, None))
+        return hits
+
+    @staticmethod
+    def _top(scores: np.ndarray, rows: Optional[np.ndarray], k: int, allowed: Optional[np.ndarray]) -> List[tuple]:
+        if allowed is not None:
+            scores = np.where(allowed, scores, -np.inf)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]) if rows is not None else int(i), float(scores[i])) for i in top if scores[i] > -np.inf]
+
+    def count(self):
+        return len(self._row_of)
+
+    def stats(self):
+        quantized = self._quantizer is not None and self._quantizer.ready
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "rows": self.count(),
+            "capacity": len(self._alive),
+            "dtype": self.dtype.name,
+            "quantization": self.quantization if quantized else "none",
+            "ivf_lists": len(self._centroids) if self._centroids is not None else 0,
+            # bytes scanned per vector; the full vectors are only read to re-rank with quantization
+            "bytes_per_vector": self._quantizer.bytes_per_vector if quantized else self.dim * self.dtype.itemsize,
+            "vector_bytes": len(self._alive) * self.dim * self.dtype.itemsize,
+        }